@@ -62,6 +62,7 @@ from os import path
 from math import degrees
 
 import DapToolsMod as DT
+import DapMainMod
 if CAD.GuiUp:
     import FreeCADGui as CADGui
     from PySide import QtGui, QtCore
@@ -235,16 +236,29 @@ class TaskPanelDapAnimateC:
         for animationBodyName in self.solverObj.BodyNames:
             self.animationBodyObj.append(self.animationDocument.findObjects(Name="^Ani_"+animationBodyName+"$")[0])
 
-        # Load the calculated values of positions/angles from the results file
-        self.Positions = np.loadtxt(path.join(self.solverObj.Directory, "DapAnimation.csv"))
-        self.nTimeSteps = len(self.Positions.T[0])
+        # Open the results store - memory mapped, so that this takes the same time however long the run
+        if path.exists(path.join(self.solverObj.Directory, DapMainMod.RESULTS_FILE)):
+            self.resultsHeader, self.Positions = DapMainMod.openResults(self.solverObj.Directory)
+        else:
+            # Results written as text, before there was a results store
+            self.Positions = np.loadtxt(path.join(self.solverObj.Directory, "DapAnimation.csv"), ndmin=2)
+        # The bodies' shapes are placed where they are at time zero
+        startTick = np.array(self.Positions[0, :])
+        # or resample the frames from the dense output of the run, at any rate and in any window
+        if self.solverObj.AnimationDelta > 0.0 and \
+                path.exists(path.join(self.solverObj.Directory, DapMainMod.DENSE_OUTPUT_FILE)):
+            endTime = self.solverObj.AnimationEnd if self.solverObj.AnimationEnd > 0.0 else self.solverObj.TimeLength
+            frameTimes = np.arange(self.solverObj.AnimationStart, endTime, self.solverObj.AnimationDelta)
+            numCoordinates = len(self.solverObj.BodyNames) * 3
+            uResults = DapMainMod.resampleDenseOutput(self.solverObj.Directory, frameTimes)
+            self.Positions = np.column_stack((frameTimes, uResults[:, 0: numCoordinates]))
+        self.nTimeSteps = len(self.Positions)
 
         # Positions matrix is:
         # timeValue : body1X body1Y body1phi : body2X body2Y body2phi : ....
         # next time tick
 
-        # Shift all the values relative to the starting point of each body
-        startTick = self.Positions[0, :]
+        # Each frame is moved relative to the starting point of each body, as it is shown
         self.startX = []
         self.startY = []
         self.startPhi = []
@@ -252,13 +266,6 @@ class TaskPanelDapAnimateC:
             self.startX.append(startTick[animationIndex * 3 + 1])
             self.startY.append(startTick[animationIndex * 3 + 2])
             self.startPhi.append(startTick[animationIndex * 3 + 3])
-        for tick in range(self.nTimeSteps):
-            thisTick = self.Positions[tick, :]
-            for animationIndex in range(len(self.solverObj.BodyNames)):
-                thisTick[animationIndex * 3 + 1] -= self.startX[animationIndex]
-                thisTick[animationIndex * 3 + 2] -= self.startY[animationIndex]
-                thisTick[animationIndex * 3 + 3] -= self.startPhi[animationIndex]
-            self.Positions[tick, :] = thisTick
 
         # Set up the timer parameters
         self.timer = QtCore.QTimer()
@@ -331,16 +338,16 @@ class TaskPanelDapAnimateC:
 
         self.form.timeStepLabel.setText(
             "{0:5.3f}s of {1:5.3f}s".format(
-                tick * self.solverObj.DeltaTime,
+                self.Positions[tick, 0],
                 self.solverObj.TimeLength
             )
         )
 
         thisTick = self.Positions[tick, :]
         for animationIndex in range(len(self.solverObj.BodyNames)):
-            X = thisTick[animationIndex*3 + 1]
-            Y = thisTick[animationIndex*3 + 2]
-            Phi = thisTick[animationIndex*3 + 3]
+            X = thisTick[animationIndex*3 + 1] - self.startX[animationIndex]
+            Y = thisTick[animationIndex*3 + 2] - self.startY[animationIndex]
+            Phi = thisTick[animationIndex*3 + 3] - self.startPhi[animationIndex]
             self.animationBodyObj[animationIndex].Placement = CAD.Placement(CAD.Vector(X, Y, 0.0),
                                                                             CAD.Rotation(CAD.Vector(0.0, 0.0, 1.0),degrees(Phi)),
                                                                             CAD.Vector(self.startX[animationIndex],
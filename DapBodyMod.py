@@ -175,7 +175,7 @@ class DapBodyC:
     def onChanged(self, bodyObject, newproperty):
         # if Debug:
         #    DT.Mess("DapBodyC-onChanged")
-        return
+        DT.invalidateModelSnapshot(bodyObject)
     #  -------------------------------------------------------------------------
     def __getstate__(self):
         if Debug:
@@ -176,6 +176,12 @@ class DapContainerC:
 
         self.initProperties(containerObject)
     #  -------------------------------------------------------------------------
+    def onChanged(self, containerObject, prop):
+        """The plane of movement, gravity or the members of the container have changed"""
+        # if Debug:
+        #    DT.Mess("DapContainerC-onChanged")
+        DT.invalidateModelSnapshot(containerObject)
+    #  -------------------------------------------------------------------------
     def __getstate__(self):
         if Debug:
             DT.Mess("DapContainerC-__getstate__")
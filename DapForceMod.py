@@ -58,7 +58,7 @@
 import FreeCAD as CAD
 
 from os import path
-from math import sin, cos, tan, asin, acos, atan, tanh, degrees, pi
+from math import sin, cos, tan, asin, acos, atan, tanh, degrees, radians, pi
 
 import DapToolsMod as DT
 if CAD.GuiUp:
@@ -170,11 +170,24 @@ class DapForceC:
         DT.addObjectProperty(forceObject, "Stiffness", 0.0, "App::PropertyFloat", "", "Spring Stiffness")
         DT.addObjectProperty(forceObject, "Value0", 0.0, "App::PropertyFloat", "", "Undeformed Length/Angle")
         DT.addObjectProperty(forceObject, "DampingCoeff", 0, "App::PropertyFloat", "", "Damping coefficient")
+        DT.addObjectProperty(forceObject, "RestitutionCoeff", 0.8, "App::PropertyFloat", "", "Coefficient of restitution of contact with the ground")
+        DT.addObjectProperty(forceObject, "ContactModel", 0, "App::PropertyInteger", "Contact", "Contact force model [0 = Lankarani-Nikravesh, 1 = Flores]")
+        DT.addObjectProperty(forceObject, "FrictionModel", 0, "App::PropertyInteger", "Contact", "Friction model [0 = none, 1 = A, 2 = B]")
+        DT.addObjectProperty(forceObject, "FrictionStatic", 0.0, "App::PropertyFloat", "Contact", "Static coefficient of friction")
+        DT.addObjectProperty(forceObject, "FrictionDynamic", 0.0, "App::PropertyFloat", "Contact", "Dynamic coefficient of friction")
+        DT.addObjectProperty(forceObject, "FrictionViscous", 0.0, "App::PropertyFloat", "Contact", "Viscous coefficient of friction [model B]")
+        DT.addObjectProperty(forceObject, "StribeckVelocity", 1.0, "App::PropertyFloat", "Contact", "Stribeck velocity [model A]")
+        DT.addObjectProperty(forceObject, "StribeckExponent", 2.0, "App::PropertyFloat", "Contact", "Exponent of the Stribeck curve [model A]")
+        DT.addObjectProperty(forceObject, "FrictionSlope", 1.0, "App::PropertyFloat", "Contact", "Slope factor of the tanh at zero velocity [model A]")
+        DT.addObjectProperty(forceObject, "TransitionVelocity", 1.0, "App::PropertyFloat", "Contact", "Velocity of the static to dynamic transition [model B]")
+        DT.addObjectProperty(forceObject, "TransitionForce", 1.0, "App::PropertyFloat", "Contact", "Normal force of the viscous transition [model B]")
         DT.addObjectProperty(forceObject, "forceActuator", 0.0, "App::PropertyFloat", "", "Constant actuator force")
         DT.addObjectProperty(forceObject, "torqueActuator", 0.0, "App::PropertyFloat", "", "Constant actuator torque")
         DT.addObjectProperty(forceObject, "localForce", CAD.Vector(), "App::PropertyVector", "", "Constant force in local frame")
         DT.addObjectProperty(forceObject, "constForce", CAD.Vector(), "App::PropertyVector", "", "Constant force in x-y frame")
         DT.addObjectProperty(forceObject, "constTorque", 0.0, "App::PropertyFloat", "", "Constant torque in x-y frame")
+        DT.addObjectProperty(forceObject, "NoLoadSpeed", 0.0, "App::PropertyFloat", "Motor", "Speed [rad/s] at which the motor torque falls to zero [0 = constant torque]")
+        DT.addObjectProperty(forceObject, "AirFriction", 0.0, "App::PropertyFloat", "Motor", "Coefficient of the air friction torque, proportional to the speed squared")
     #  -------------------------------------------------------------------------
     def onDocumentRestored(self, forceObject):
         if Debug:
@@ -185,7 +198,7 @@ class DapForceC:
     def onChanged(self, forceObject, propertee):
         # if Debug:
         #    DT.Mess("DapForceC-onChanged")
-        return
+        DT.invalidateModelSnapshot(forceObject)
     #  -------------------------------------------------------------------------
     def __getstate__(self):
         if Debug:
@@ -308,15 +321,47 @@ class TaskPanelDapForceC:
 
         self.form.linSpringLength.setValue(self.forceTaskObject.Value0)
         self.form.linSpringStiffness.setValue(self.forceTaskObject.Stiffness)
-        self.form.rotSpringAngle.setValue(self.forceTaskObject.Value0)
+        # The angles are kept in radians, but shown in degrees
+        self.form.rotSpringAngle.setValue(degrees(self.forceTaskObject.Value0))
         self.form.rotSpringStiffness.setValue(self.forceTaskObject.Stiffness)
         self.form.linSpringDamp.setValue(self.forceTaskObject.DampingCoeff)
         self.form.linSpringDampLength.setValue(self.forceTaskObject.Value0)
         self.form.linSpringDampStiffness.setValue(self.forceTaskObject.Stiffness)
         self.form.rotSpringDamp.setValue(self.forceTaskObject.DampingCoeff)
-        self.form.rotSpringDampAngle.setValue(self.forceTaskObject.Value0)
+        self.form.rotSpringDampAngle.setValue(degrees(self.forceTaskObject.Value0))
         self.form.rotSpringDampStiffness.setValue(self.forceTaskObject.Stiffness)
-        
+        self.form.uniSpringDamp.setValue(self.forceTaskObject.DampingCoeff)
+        self.form.uniSpringDampLength.setValue(self.forceTaskObject.Value0)
+        self.form.uniSpringDampStiffness.setValue(self.forceTaskObject.Stiffness)
+        self.form.localForceX.setValue(self.forceTaskObject.localForce.x)
+        self.form.localForceY.setValue(self.forceTaskObject.localForce.y)
+        self.form.globalForceX.setValue(self.forceTaskObject.constForce.x)
+        self.form.globalForceY.setValue(self.forceTaskObject.constForce.y)
+        self.form.constTorque.setValue(self.forceTaskObject.constTorque)
+        self.form.motorTorque.setValue(self.forceTaskObject.torqueActuator)
+        self.form.motorNoLoadSpeed.setValue(self.forceTaskObject.NoLoadSpeed)
+        self.form.motorFrictionTorque.setValue(self.forceTaskObject.torqueActuator)
+        self.form.motorFrictionNoLoadSpeed.setValue(self.forceTaskObject.NoLoadSpeed)
+        self.form.motorAirFriction.setValue(self.forceTaskObject.AirFriction)
+        self.form.contactRestitution.setValue(self.forceTaskObject.RestitutionCoeff)
+        self.form.contactStiffness.setValue(self.forceTaskObject.Stiffness)
+        self.form.contactModel.clear()
+        self.form.contactModel.addItems(DT.CONTACT_MODEL)
+        self.form.contactModel.setCurrentIndex(self.forceTaskObject.ContactModel)
+        self.form.frictionModel.clear()
+        self.form.frictionModel.addItems(DT.FRICTION_MODEL)
+        self.form.frictionModel.setCurrentIndex(self.forceTaskObject.FrictionModel)
+        self.form.frictionStatic.setValue(self.forceTaskObject.FrictionStatic)
+        self.form.frictionDynamic.setValue(self.forceTaskObject.FrictionDynamic)
+        self.form.frictionViscous.setValue(self.forceTaskObject.FrictionViscous)
+        self.form.stribeckVelocity.setValue(self.forceTaskObject.StribeckVelocity)
+        self.form.stribeckExponent.setValue(self.forceTaskObject.StribeckExponent)
+        self.form.frictionSlope.setValue(self.forceTaskObject.FrictionSlope)
+        self.form.transitionVelocity.setValue(self.forceTaskObject.TransitionVelocity)
+        self.form.transitionForce.setValue(self.forceTaskObject.TransitionForce)
+        self.form.frictionModel.currentIndexChanged.connect(self.frictionModelChangedCallbackF)
+        self.frictionModelChangedCallbackF()
+
         # Populate the body object list
         self.bodyObjDict = DT.getDictionary("DapBody")
 
@@ -350,6 +395,8 @@ class TaskPanelDapForceC:
                 self.forceTaskObject.bodyHEADLabel = bodyObj.Label
                 self.forceTaskObject.bodyTAILLabel = bodyObj.Label
                 break
+        self.form.bodyHeadLabelTwoTwo.setCurrentIndex(self.bodyNames.index(self.forceTaskObject.bodyHEADName))
+        self.form.bodyTailLabelTwoTwo.setCurrentIndex(self.bodyNames.index(self.forceTaskObject.bodyTAILName))
 
         # Populate the bodies combo and the matching available points
         # based on the current values in the force object
@@ -363,10 +410,7 @@ class TaskPanelDapForceC:
         self.form.pointLabelTwoOne.setCurrentIndex(pointHEADindex)
         self.form.pointHeadLabelTwoTwo.clear()
         self.form.pointHeadLabelTwoTwo.addItems(self.pointListHEADLabels)
-        self.form.pointHeadLabelTwoTwo.setCurrentIndex(pointHEADindex)
-        self.form.pointTailLabelTwoTwo.clear()
-        self.form.pointTailLabelTwoTwo.addItems(self.pointListHEADLabels)
-        self.form.pointTailLabelTwoTwo.setCurrentIndex(pointHEADindex)
+        self.form.pointHeadLabelTwoTwo.setCurrentIndex(max(pointHEADindex, 0))
 
         (self.pointListTAILNames, self.pointListTAILLabels, pointTAILindex) = DT.getTAILPoints(self.forceTaskObject, self.bodyObjDict)
         self.form.pointTailLabelOneTwo.clear()
@@ -374,7 +418,7 @@ class TaskPanelDapForceC:
         self.form.pointTailLabelOneTwo.setCurrentIndex(pointTAILindex)
         self.form.pointTailLabelTwoTwo.clear()
         self.form.pointTailLabelTwoTwo.addItems(self.pointListTAILLabels)
-        self.form.pointTailLabelTwoTwo.setCurrentIndex(pointTAILindex)
+        self.form.pointTailLabelTwoTwo.setCurrentIndex(max(pointTAILindex, 0))
 
         self.form.bodyLabelOneTwo.currentIndexChanged.connect(self.bodyHEADChangedCallbackF)
         self.form.bodyHeadLabelTwoOne.currentIndexChanged.connect(self.bodyHEADChangedCallbackF)
@@ -429,58 +473,93 @@ class TaskPanelDapForceC:
             else:
                 containerObject.gravityVector.z = 0.0
 
-        elif self.forceTaskObject.actuatorType <= 4:
-            # Two Bodies Two Points for linear spring and rotational spring
+        else:
+            # Every other force has a HEAD body and point, and the ones
+            # between two bodies a TAIL body and point as well
+            actuatorType = self.forceTaskObject.actuatorType
+            bodyHEADindex = self.form.bodyHeadLabelTwoTwo.currentIndex()
+            pointHEADindex = self.form.pointHeadLabelTwoTwo.currentIndex()
+            if actuatorType in DT.FORCE_TYPE_TWO_BODIES:
+                bodyTAILindex = self.form.bodyTailLabelTwoTwo.currentIndex()
+                pointTAILindex = self.form.pointTailLabelTwoTwo.currentIndex()
+                pointListTAILNames = self.pointListTAILNames
+                pointListTAILLabels = self.pointListTAILLabels
+            else:
+                bodyTAILindex = bodyHEADindex
+                pointTAILindex = pointHEADindex
+                pointListTAILNames = self.pointListHEADNames
+                pointListTAILLabels = self.pointListHEADLabels
+            # Refuse to accept the values when a body has no points to attach the force to
+            if pointHEADindex == -1 or pointTAILindex == -1:
+                CAD.Console.PrintError("The body of the force has no points defined yet\n")
+                return False
+
             # Transfer the body names to the forceTaskObject
-            self.forceTaskObject.bodyHEADName = self.bodyNames[self.form.bodyHeadLabelTwoTwo.currentIndex()]
-            self.forceTaskObject.bodyHEADLabel = self.bodyLabels[self.form.bodyHeadLabelTwoTwo.currentIndex()]
-            self.forceTaskObject.bodyHEADindex = self.form.bodyHeadLabelTwoTwo.currentIndex()
-            self.forceTaskObject.bodyTAILName = self.bodyNames[self.form.bodyTailLabelTwoTwo.currentIndex()]
-            self.forceTaskObject.bodyTAILLabel = self.bodyLabels[self.form.bodyTailLabelTwoTwo.currentIndex()]
-            self.forceTaskObject.bodyTAILindex = self.form.bodyTailLabelTwoTwo.currentIndex()
+            self.forceTaskObject.bodyHEADName = self.bodyNames[bodyHEADindex]
+            self.forceTaskObject.bodyHEADLabel = self.bodyLabels[bodyHEADindex]
+            self.forceTaskObject.bodyHEADindex = bodyHEADindex
+            self.forceTaskObject.bodyTAILName = self.bodyNames[bodyTAILindex]
+            self.forceTaskObject.bodyTAILLabel = self.bodyLabels[bodyTAILindex]
+            self.forceTaskObject.bodyTAILindex = bodyTAILindex
 
             # Transfer the point names to the forceTaskObject
-            self.forceTaskObject.pointHEADName = self.pointListHEADNames[self.form.pointHeadLabelTwoTwo.currentIndex()]
-            self.forceTaskObject.pointHEADLabel = self.pointListHEADLabels[self.form.pointHeadLabelTwoTwo.currentIndex()]
-            self.forceTaskObject.pointHEADindex = self.form.pointHeadLabelTwoTwo.currentIndex()
-            self.forceTaskObject.pointTAILName = self.pointListTAILNames[self.form.pointTailLabelTwoTwo.currentIndex()]
-            self.forceTaskObject.pointTAILLabel = self.pointListTAILLabels[self.form.pointTailLabelTwoTwo.currentIndex()]
-            self.forceTaskObject.pointTAILindex = self.form.pointTailLabelTwoTwo.currentIndex()
+            self.forceTaskObject.pointHEADName = self.pointListHEADNames[pointHEADindex]
+            self.forceTaskObject.pointHEADLabel = self.pointListHEADLabels[pointHEADindex]
+            self.forceTaskObject.pointHEADindex = pointHEADindex
+            self.forceTaskObject.pointTAILName = pointListTAILNames[pointTAILindex]
+            self.forceTaskObject.pointTAILLabel = pointListTAILLabels[pointTAILindex]
+            self.forceTaskObject.pointTAILindex = pointTAILindex
 
             # The Spring options
-            if self.forceTaskObject.actuatorType == 1:
+            if actuatorType == 1:
                 self.forceTaskObject.Value0 = self.form.linSpringLength.value()
                 self.forceTaskObject.Stiffness = self.form.linSpringStiffness.value()
-            elif self.forceTaskObject.actuatorType == 2:
+            elif actuatorType == 2:
+                self.forceTaskObject.Value0 = radians(self.form.rotSpringAngle.value())
+                self.forceTaskObject.Stiffness = self.form.rotSpringStiffness.value()
+            elif actuatorType == 3:
                 self.forceTaskObject.DampingCoeff = self.form.linSpringDamp.value()
                 self.forceTaskObject.Value0 = self.form.linSpringDampLength.value()
                 self.forceTaskObject.Stiffness = self.form.linSpringDampStiffness.value()
-            elif self.forceTaskObject.actuatorType == 3:
-                self.forceTaskObject.Value0 = self.form.rotSpringAngle.value()
-                self.forceTaskObject.Stiffness = self.form.rotSpringStiffness.value()
-            elif self.forceTaskObject.actuatorType == 4:
+            elif actuatorType == 4:
                 self.forceTaskObject.DampingCoeff = self.form.rotSpringDamp.value()
-                self.forceTaskObject.Value0 = self.form.rotSpringDampAngle.value()
+                self.forceTaskObject.Value0 = radians(self.form.rotSpringDampAngle.value())
                 self.forceTaskObject.Stiffness = self.form.rotSpringDampStiffness.value()
-
-            # Draw an arrow as long as the distance of the vector between the points
-            llen = (Point1 - Point2).Length
-            if llen > 1e-6:
-                # Direction of the arrow is the direction of the vector between the two points
-                lin_move_dir = (Point2 - Point1).normalize()
-                cylinder = Part.makeCylinder(
-                    diameter*0.6,
-                    0.60 * llen,
-                    Point1 + 0.2 * llen * lin_move_dir,
-                    lin_move_dir,
-                )
-                # Draw the two arrow heads
-                cone1 = Part.makeCone(0, diameter, 0.2 * llen, Point1, lin_move_dir)
-                cone2 = Part.makeCone(0, diameter, 0.2 * llen, Point2, -lin_move_dir)
-                return Part.makeCompound([cylinder, cone1, cone2])
-
-        # All the other options we have not yet handled
-        else:
+            elif actuatorType == 5:
+                self.forceTaskObject.DampingCoeff = self.form.uniSpringDamp.value()
+                self.forceTaskObject.Value0 = self.form.uniSpringDampLength.value()
+                self.forceTaskObject.Stiffness = self.form.uniSpringDampStiffness.value()
+            # The constant forces and torque
+            elif actuatorType == 6:
+                self.forceTaskObject.localForce = CAD.Vector(self.form.localForceX.value(), self.form.localForceY.value(), 0.0)
+            elif actuatorType == 7:
+                self.forceTaskObject.constForce = CAD.Vector(self.form.globalForceX.value(), self.form.globalForceY.value(), 0.0)
+            elif actuatorType == 8:
+                self.forceTaskObject.constTorque = self.form.constTorque.value()
+            # The contact of the point with the ground
+            elif actuatorType == 9:
+                self.forceTaskObject.RestitutionCoeff = self.form.contactRestitution.value()
+                self.forceTaskObject.Stiffness = self.form.contactStiffness.value()
+                self.forceTaskObject.ContactModel = self.form.contactModel.currentIndex()
+                self.forceTaskObject.FrictionModel = self.form.frictionModel.currentIndex()
+                self.forceTaskObject.FrictionStatic = self.form.frictionStatic.value()
+                self.forceTaskObject.FrictionDynamic = self.form.frictionDynamic.value()
+                self.forceTaskObject.FrictionViscous = self.form.frictionViscous.value()
+                self.forceTaskObject.StribeckVelocity = self.form.stribeckVelocity.value()
+                self.forceTaskObject.StribeckExponent = self.form.stribeckExponent.value()
+                self.forceTaskObject.FrictionSlope = self.form.frictionSlope.value()
+                self.forceTaskObject.TransitionVelocity = self.form.transitionVelocity.value()
+                self.forceTaskObject.TransitionForce = self.form.transitionForce.value()
+            # The motors
+            elif actuatorType == 10:
+                self.forceTaskObject.torqueActuator = self.form.motorTorque.value()
+                self.forceTaskObject.NoLoadSpeed = self.form.motorNoLoadSpeed.value()
+            elif actuatorType == 11:
+                self.forceTaskObject.torqueActuator = self.form.motorFrictionTorque.value()
+                self.forceTaskObject.NoLoadSpeed = self.form.motorFrictionNoLoadSpeed.value()
+                self.forceTaskObject.AirFriction = self.form.motorAirFriction.value()
+
+            # No shape is drawn for the forces yet
             self.forceTaskObject.Shape = Part.Shape()
 
         #  Recompute document to update view provider based on the shapes
@@ -493,8 +572,10 @@ class TaskPanelDapForceC:
         if Debug:
             DT.Mess("TaskPanelDapForceC-bodyHEADChangedCallbackF")
 
-        (self.pointListHEADNames, self.pointListHEADLabels, pointHEADindex) = DT.getHEADPoints(self.forceTaskObject, self.bodyObjDict)
         # Load the new set of points in the specified body into the form
+        bodyObj = self.bodyObjDict[self.bodyNames[self.form.bodyHeadLabelTwoTwo.currentIndex()]]
+        self.pointListHEADNames = list(bodyObj.pointNames)
+        self.pointListHEADLabels = list(bodyObj.pointLabels)
         self.form.pointHeadLabelTwoTwo.clear()
         self.form.pointHeadLabelTwoTwo.addItems(self.pointListHEADLabels)
         self.form.pointHeadLabelTwoTwo.setCurrentIndex(0)
@@ -505,7 +586,9 @@ class TaskPanelDapForceC:
             DT.Mess("TaskPanelDapForceC-bodyTAILChangedCallbackF")
 
         # Load the new set of points in the specified body into the form
-        (self.pointListTAILNames, self.pointListTAILLabels,  pointTAILindex) = DT.getTAILPoints(self.forceTaskObject, self.bodyObjDict)
+        bodyObj = self.bodyObjDict[self.bodyNames[self.form.bodyTailLabelTwoTwo.currentIndex()]]
+        self.pointListTAILNames = list(bodyObj.pointNames)
+        self.pointListTAILLabels = list(bodyObj.pointLabels)
         self.form.pointTailLabelTwoTwo.clear()
         self.form.pointTailLabelTwoTwo.addItems(self.pointListTAILLabels)
         self.form.pointTailLabelTwoTwo.setCurrentIndex(0)
@@ -540,6 +623,21 @@ class TaskPanelDapForceC:
             self.form.gravityX.setChecked(False)
             self.form.gravityY.setChecked(False)
     #  -------------------------------------------------------------------------
+    def frictionModelChangedCallbackF(self):
+        """Only enable the parameters of the chosen friction model"""
+        if Debug:
+            DT.Mess("TaskPanelDapForceC-frictionModelChangedCallbackF")
+
+        frictionModel = self.form.frictionModel.currentIndex()
+        self.form.frictionStatic.setEnabled(frictionModel != 0)
+        self.form.frictionDynamic.setEnabled(frictionModel != 0)
+        self.form.stribeckVelocity.setEnabled(frictionModel == 1)
+        self.form.stribeckExponent.setEnabled(frictionModel == 1)
+        self.form.frictionSlope.setEnabled(frictionModel == 1)
+        self.form.frictionViscous.setEnabled(frictionModel == 2)
+        self.form.transitionVelocity.setEnabled(frictionModel == 2)
+        self.form.transitionForce.setEnabled(frictionModel == 2)
+    #  -------------------------------------------------------------------------
     def actuatorChangedCallbackF(self):
         """Hide the stuff not used for gravity or not"""
         if Debug:
@@ -553,15 +651,18 @@ class TaskPanelDapForceC:
         else:
             self.form.bodyPointData.setVisible(True)
             self.form.forceData.setCurrentIndex(index-1)
-
-        if index >= 1 and index <= 4:
             self.form.bodyPointData.setCurrentIndex(2)
-        elif index == 5:
-            self.form.bodyPointData.setCurrentIndex(0)
-        elif index == 6:
-            self.form.bodyPointData.setCurrentIndex(1)
-        else:
-            self.form.bodyPointData.setHidden(True)
+
+            # Only show the TAIL body for the forces between two bodies,
+            # and the points for the forces which act at a point
+            twoBodies = index in DT.FORCE_TYPE_TWO_BODIES
+            atPoints = index in DT.FORCE_TYPE_AT_POINTS
+            self.form.pointHeadLabelTwoTwo.setVisible(atPoints)
+            self.form.label_3.setVisible(atPoints)
+            self.form.bodyTailLabelTwoTwo.setVisible(twoBodies)
+            self.form.label_4.setVisible(twoBodies)
+            self.form.pointTailLabelTwoTwo.setVisible(twoBodies and atPoints)
+            self.form.label_5.setVisible(twoBodies and atPoints)
     #  -------------------------------------------------------------------------
     def __getstate__(self):
         if Debug:
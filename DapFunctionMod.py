@@ -55,7 +55,11 @@
 # *         more information regarding this WorkBench and its usage              *
 # *                                                                              *
 # ********************************************************************************
-import FreeCAD as CAD
+try:
+    import FreeCAD as CAD
+except ImportError:
+    # Headless, with only the console of DapToolsMod
+    from DapToolsMod import CAD
 
 from os import path
 from math import degrees, sin, cos
@@ -104,6 +108,7 @@ class FunctionC:
 
         # Copy over the parameters which were passed in the init call
         FuncType = FuntionParameterList[0]
+        self.FuncType = FuncType
         timeStart = FuntionParameterList[1]
         timeEnd = FuntionParameterList[2]
         valueAtStart = FuntionParameterList[3]
@@ -188,6 +188,11 @@ class DapJointC:
             DT.Mess("DapJointC-onDocumentRestored")
         self.initProperties(jointObject)
     #  -------------------------------------------------------------------------
+    def onChanged(self, jointObject, prop):
+        # if Debug:
+        #    DT.Mess("DapJointC-onChanged")
+        DT.invalidateModelSnapshot(jointObject)
+    #  -------------------------------------------------------------------------
     def __getstate__(self):
         if Debug:
             DT.Mess("DapJointC-__getstate__")
@@ -55,13 +55,31 @@
 # *         more information regarding this WorkBench and its usage              *
 # *                                                                              *
 # ********************************************************************************
-import FreeCAD as CAD
+try:
+    import FreeCAD as CAD
+except ImportError:
+    # Headless, with only the console of DapToolsMod
+    from DapToolsMod import CAD
 
 import os
+import copy
+import time
+import pickle
+import json
+import hashlib
+import io
+import sys
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import DapToolsMod as DT
 import DapFunctionMod
 import numpy as np
-from scipy.integrate import solve_ivp
+from scipy.integrate import solve_ivp, RK45, RK23, DOP853, Radau, BDF, LSODA, OdeSolution, DenseOutput
+from scipy.optimize import OptimizeResult
+from scipy import sparse
+from scipy.sparse.linalg import spsolve, splu
+from scipy.linalg import cho_factor, cho_solve, lu_factor, lu_solve, lu
 import math
 if CAD.GuiUp:
     import FreeCADGui as CADGui
@@ -73,150 +91,302 @@ Debug = False
 # NB NB NB Pull the list out, change the item in the list, and put the list back NB NB NB NB
 ############################################################################################
 
+# The interpolant of the last run, pickled into the solver directory
+DENSE_OUTPUT_FILE = "DapDenseOutput.pkl"
+# The [time, state] rows of the results, and the JSON header which describes them
+RESULTS_FILE = "DapResults.npy"
+RESULTS_HEADER_FILE = "DapResults.json"
+RESULTS_FORMAT_VERSION = 1
+# The model as plain data, written with the results so that it can be solved again headless
+MODEL_SNAPSHOT_FILE = "DapModel.dapjson"
+# Layout of the model snapshot - readModelSnapshot upgrades older ones
+MODEL_SNAPSHOT_VERSION = 1
+# Solver properties which say where the results go or how the last run went, rather than what the model is
+SNAPSHOT_HASH_IGNORED = ("Directory", "FileName", "PostProcessWorkers", "ExportCSV", "DapResultsValid",
+                         "BodyNames", "BodyCoG", "NumFuncEvals", "NumJacEvals", "NumLUDecomps",
+                         "MaxConstraintDrift", "MaxVelocityDrift", "RealTimeFactor", "MissedFrames")
+# Contact points this close to the ground [mm] when another one hits it, hit it at the same instant
+CONTACT_GAP_TOLERANCE = 1.0e-6
+# =============================================================================
+def resampleDenseOutput(directory, timeValues):
+    """Evaluate the states of the last run, kept in its dense output, at any times
+    inside the run without integrating again - returns a row of states per time like uResults"""
+    with open(os.path.join(directory, DENSE_OUTPUT_FILE), "rb") as denseFILE:
+        denseSolution = pickle.load(denseFILE)
+    timeValues = np.clip(np.asarray(timeValues, dtype=np.float64), denseSolution.t_min, denseSolution.t_max)
+    return np.atleast_2d(denseSolution(timeValues).T)
+# =============================================================================
+def writeResultsHeader(directory, header):
+    """Write the JSON header of the results store"""
+    with open(os.path.join(directory, RESULTS_HEADER_FILE), "w") as headerFILE:
+        json.dump(header, headerFILE, indent=1)
+# =============================================================================
+def resultsUpToDate(directory, modelHash, simEnd, simDelta):
+    """Whether directory already holds the complete results of a run of the model
+    with this modelSnapshotHash, over the same times - so it need not be solved again"""
+    try:
+        with open(os.path.join(directory, RESULTS_HEADER_FILE), "r") as headerFILE:
+            header = json.load(headerFILE)
+    except (OSError, ValueError):
+        return False
+    return header.get("complete") is True and header.get("modelHash") == modelHash and \
+        header["timeBase"] == {"start": 0.0, "delta": simDelta, "end": simEnd} and \
+        os.path.exists(os.path.join(directory, RESULTS_FILE))
+# =============================================================================
+def openResults(directory):
+    """Return the header and the memory-mapped [time, state] rows of the results store,
+    which takes the same time however long the run was"""
+    with open(os.path.join(directory, RESULTS_HEADER_FILE), "r") as headerFILE:
+        header = json.load(headerFILE)
+    resultsNp = np.load(os.path.join(directory, RESULTS_FILE), mmap_mode="r")
+    return header, resultsNp[0: header["numRows"]]
+# =============================================================================
+def exportAnimationCSV(directory, fileName=None, chunkSize=10000):
+    """Export the time and the x, y, phi of every moving body from the results store
+    to a space separated text file, a line per time [DapAnimation.csv by default]"""
+    header, resultsNp = openResults(directory)
+    if fileName is None:
+        fileName = os.path.join(directory, "DapAnimation.csv")
+    numColumns = 1 + header["numMovBodies"] * 3
+    with open(fileName, "w") as csvFILE:
+        for chunkStart in range(0, len(resultsNp), chunkSize):
+            np.savetxt(csvFILE, resultsNp[chunkStart: chunkStart + chunkSize, 0: numColumns], fmt="%.17g")
+# =============================================================================
+def plainPropertyValue(value):
+    """The value of a property as plain data which can be written to JSON - vectors become
+    [x, y, z] lists - or None if it is not plain data (links, shapes, placements etc.)"""
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, CAD.Vector):
+        return [value.x, value.y, value.z]
+    if isinstance(value, (list, tuple)):
+        valueList = [plainPropertyValue(item) for item in value]
+        if any([item is None for item in valueList]):
+            return None
+        return valueList
+    return None
+# =============================================================================
+def documentObjectProperties(docObj):
+    """A dictionary of the plain property values of a FreeCAD document object"""
+    propertyDict = {"Name": docObj.Name, "Label": docObj.Label}
+    for propertyName in docObj.PropertiesList:
+        value = plainPropertyValue(getattr(docObj, propertyName))
+        if value is not None:
+            propertyDict[propertyName] = value
+    return propertyDict
+# =============================================================================
+def writeModelSnapshot(fileName, snapshot):
+    """Write a model snapshot made by DapMainC.makeModelSnapshotF to a .dapjson file"""
+    with open(fileName, "w") as snapshotFILE:
+        json.dump(snapshot, snapshotFILE, indent=1)
+# =============================================================================
+def readModelSnapshot(fileName):
+    """Read a model snapshot from a .dapjson file"""
+    with open(fileName, "r") as snapshotFILE:
+        return upgradeModelSnapshot(json.load(snapshotFILE))
+# =============================================================================
+def upgradeModelSnapshot(snapshot):
+    """Bring a model snapshot of an older layout up to MODEL_SNAPSHOT_VERSION [in place]"""
+    version = snapshot.get("version", 0)
+    if version > MODEL_SNAPSHOT_VERSION:
+        raise ValueError("Model snapshot version " + str(version) + " is newer than this NikraDAP [" +
+                         str(MODEL_SNAPSHOT_VERSION) + "]")
+    if version < 1:
+        # The first snapshots had the weight of each body rather than gravity
+        for bodyDict in snapshot["bodies"]:
+            if "gravityXY" not in bodyDict:
+                mass = bodyDict["Mass"]
+                bodyDict["gravityXY"] = [weight / mass if mass != 0.0 else 0.0 for weight in bodyDict["weightXY"]]
+    snapshot["version"] = MODEL_SNAPSHOT_VERSION
+    return snapshot
+# =============================================================================
+def modelSnapshotHash(snapshot):
+    """SHA-256 of everything in a model snapshot which decides its solution, so that identical
+    models hash the same wherever their results go [the solver properties in SNAPSHOT_HASH_IGNORED]"""
+    solverDict = {key: snapshot["solver"][key] for key in snapshot["solver"] if key not in SNAPSHOT_HASH_IGNORED}
+    modelText = json.dumps(dict(snapshot, solver=solverDict), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(modelText.encode("utf-8")).hexdigest()
+# =============================================================================
+# The model in a post-processing worker process, unpickled once when the worker starts
+workerMainObj = None
+def initResultsWorker(mainState):
+    """Unpickle the FreeCAD-free snapshot of the model in a post-processing worker process"""
+    global workerMainObj
+    workerMainObj = pickle.loads(mainState)
+# =============================================================================
+def resultsTextWorker(chunkStart, timeValues, uResults, VerticalHeaders, blockFormats):
+    """The lines of the results file for one chunk of times, worked out in a worker process"""
+    return workerMainObj.resultsTextF(chunkStart, timeValues, uResults, VerticalHeaders, blockFormats)
+
 # =============================================================================
 class DapMainC:
-    """Instantiated when the 'solve' button is clicked in the task panel"""
+    """Instantiated when the 'solve' button is clicked in the task panel,
+    or from a model snapshot when solving headless [python -m DapMainMod]"""
     #  -------------------------------------------------------------------------
-    def __init__(self, simEnd, simDelta, Accuracy, correctInitial):
+    def __init__(self, simEnd, simDelta, correctInitial, snapshot=None):
         if Debug:
             DT.Mess("DapMainC-__init__")
         # Save the time steps passed via the __init__ function
         self.simEnd = simEnd
         self.simDelta = simDelta
         self.correctInitial = correctInitial
-        # Store the requred accuracy figures
-        self.relativeTolerance = 10**(-Accuracy-2)
-        self.absoluteTolerance = 10**(-Accuracy-4)
-        # Have the solver object handy
-        self.solverObj = CAD.ActiveDocument.findObjects(Name="^DapSolver$")[0]
         # Set a variable to flag whether we have reached the end error-free
         # It will be available to DapSolverMod as an instance variable
         self.initialised = False
-
+        if snapshot is None:
+            # Have the solver object handy, and extract the model from the document [or re-use the one
+            # kept from the last solve] and keep a copy of it with the results, to be solved again headless
+            self.solverObj = CAD.ActiveDocument.findObjects(Name="^DapSolver$")[0]
+            snapshot = self.documentModelSnapshotF()
+            if snapshot is None:
+                return
+            writeModelSnapshot(os.path.join(self.solverObj.Directory, MODEL_SNAPSHOT_FILE), snapshot)
+        else:
+            # Headless, the solver settings come from the snapshot and the run statistics go back into it
+            snapshot = upgradeModelSnapshot(snapshot)
+            self.solverObj = ObjectSnapshotC(snapshot["solver"])
+        # Identifies the model, with its results
+        self.modelHash = modelSnapshotHash(snapshot)
+        # Store the integration method and the requred accuracy figures
+        self.integrationMethod = DT.INTEGRATION_METHOD[self.solverObj.IntegrationMethod]
+        self.maxStep = self.solverObj.MaxStep
+        self.firstStep = self.solverObj.FirstStep
+        self.relativeTolerance = self.solverObj.RelativeTolerance
+        self.absoluteTolerance = self.solverObj.AbsoluteTolerance
+        # Integrate with solve_ivp (0), step ourselves and project onto the constraints (1)
+        # integrate only the independent coordinates (2)
+        # or take fixed steps with semi-implicit Euler (3) or RK4 (4) for a real-time preview
+        self.integrationMode = self.solverObj.IntegrationMode
+        # Keep the interpolant of the whole run, so that the results can be resampled later
+        self.denseOutput = self.solverObj.DenseOutput
+        # Write the results to disk in chunks of this many reporting times as the integration goes
+        self.streamResults = self.solverObj.StreamResults
+        self.streamChunkSize = max(1, self.solverObj.StreamChunkSize)
+        # Also write the positions to DapAnimation.csv as text
+        self.exportCSV = self.solverObj.ExportCSV
+        # Number of processes writing the results file [0 = one per core]
+        self.postProcessWorkers = self.solverObj.PostProcessWorkers
+        # Assemble the Jacobian as a sparse (CSR) matrix rather than a dense one
+        self.sparseJacobian = self.solverObj.SparseJacobian
+        # Solve for the accelerations via the augmented matrix (0) or the Schur complement (1)
+        self.accelerationSolver = self.solverObj.AccelerationSolver
+        # Baumgarte stabilisation of the acceleration constraints and its gains
+        self.baumgarte = self.solverObj.BaumgarteStabilisation
+        self.baumgarteAlpha = self.solverObj.BaumgarteAlpha
+        self.baumgarteBeta = self.solverObj.BaumgarteBeta
+        # Contact with the ground by penalty forces (0) or by impact events with restitution (1)
+        self.contactMode = self.solverObj.ContactMode
+        # Impacts slower than this are taken to be resting contact
+        self.restingContactSpeed = self.solverObj.RestingContactSpeed
+        # Hand the implicit integrators our own state Jacobian rather than let them difference Analysis
+        self.analyticJacobian = self.solverObj.AnalyticJacobian
+        # LSODA only takes a dense state Jacobian, Radau and BDF can use a sparse one
+        self.sparseStateJacobian = self.sparseJacobian and self.integrationMethod != "LSODA"
+
+        # The scipy OdeSolver classes for when we step through the solution ourselves
+        self.dictSteppers = {
+            "RK45": RK45,
+            "RK23": RK23,
+            "DOP853": DOP853,
+            "Radau": Radau,
+            "BDF": BDF,
+            "LSODA": LSODA,
+        }
+        # Only these can be restarted from a projected y and f after each step
+        self.projectableMethods = ("RK45", "RK23", "DOP853", "Radau")
+        # Dictionaries of the pointers for Dynamic calling of the batched kernels
+        # which evaluate all the joints of one type in a JointGroupC in one go
+        self.dictConstraintKernels = {
+            0: self.revolute_ConstraintKernel,
+            2: self.revolute_revolute_ConstraintKernel,
+            4: self.relative_rotational_ConstraintKernel,
+            6: self.disc_ConstraintKernel,
+            7: self.rigid_ConstraintKernel,
+        }
+        self.dictJacobianKernels = {
+            0: self.revolute_JacobianKernel,
+            2: self.revolute_revolute_JacobianKernel,
+            4: self.constant_JacobianKernel,
+            6: self.constant_JacobianKernel,
+            7: self.rigid_JacobianKernel,
+        }
+        self.dictAccelerationKernels = {
+            0: self.revolute_AccKernel,
+            2: self.revolute_revolute_AccKernel,
+            4: self.relative_rotational_AccKernel,
+            6: self.zero_AccKernel,
+            7: self.rigid_AccKernel,
+        }
+        # Dictionary of the pointers for Dynamic calling of the batched kernels
+        # which evaluate all the forces of one actuatorType in a ForceGroupC in one go
+        # [gravity and the contact with the ground are handled separately]
+        self.dictForceKernels = {
+            1: self.linearSpring_ForceKernel,
+            2: self.rotationalSpring_ForceKernel,
+            3: self.linearSpring_ForceKernel,
+            4: self.rotationalSpring_ForceKernel,
+            5: self.linearSpring_ForceKernel,
+            6: self.localForce_ForceKernel,
+            7: self.globalForce_ForceKernel,
+            8: self.torque_ForceKernel,
+            10: self.motor_ForceKernel,
+            11: self.motor_ForceKernel,
+        }
+        # Joint types without a batched kernel are still evaluated joint by joint
         # Dictionary of the pointers for Dynamic calling of the Acceleration functions
         self.dictAccelerationFunctions = {
-            0: self.revolute_Acc,
             1: self.translational_Acc,
-            2: self.revolute_revolute_Acc,
             3: self.revolute_translational_Acc,
-            4: self.relative_rotational_Acc,
             5: self.relative_translational_Acc,
-            6: self.disc_Acc,
-            7: self.rigid_Acc,
         }
         # Dictionary of the pointers for Dynamic calling of the Constraint functions
         self.dictConstraintFunctions = {
-            0: self.revolute_Constraint,
             1: self.translational_Constraint,
-            2: self.revolute_revolute_Constraint,
             3: self.revolute_translational_Constraint,
-            4: self.relative_rotational_Constraint,
             5: self.relative_translational_Constraint,
-            6: self.disc_Constraint,
-            7: self.rigid_Constraint,
         }
         # Dictionary of the pointers for Dynamic calling of the Jacobian functions
         self.dictJacobianFunctions = {
-            0: self.revolute_Jacobian,
             1: self.translational_Jacobian,
-            2: self.revolute_revolute_Jacobian,
             3: self.revolute_translational_Jacobian,
-            4: self.relative_rotational_Jacobian,
             5: self.relative_translational_Jacobian,
-            6: self.disc_Jacobian,
-            7: self.rigid_Jacobian,
         }
         ############
         # BODY STUFF
         ############
-        # Load the body and point dictionaries and convert to lists for quick indexing in numpy
-        bodyObjDict = DT.getDictionary("DapBody")
-        DictionaryOfPoints = DT.getDictionaryOfPoints()
+        # The bodies come in the snapshot with the [only] stationary body as the zero'th one
+        self.bodyObjList = [ObjectSnapshotC(bodyDict) for bodyDict in snapshot["bodies"]]
         self.bodyName2Index = {}
-        self.bodyObjList = []
         self.pointDictList = []
         self.numPointsInDict = []
-        # Also check if we have one (and only one) ground body
-        bodyIndex = 0
-        foundGround = False
-        for bodyName in bodyObjDict:
-            bodyObj = bodyObjDict[bodyName]
-            # Append bodyObj and DictionaryOfPoints[bodyName] to the lists
-            self.bodyObjList.append(bodyObj)
-            self.pointDictList.append(DictionaryOfPoints[bodyName])
-            self.numPointsInDict.append(len(DictionaryOfPoints[bodyName]))
-
-            # Swap the stationary body to 0 in the list if applicable
-            # i.e. We swap the current zero'th body with the current item
-            # and make the [only] stationary body the zero'th one in the list.
-            # We have made sure that only one is stationary at definition time
-            # and we have requested the user to put all the stationary objects into one body
-            # [ and didn't allow him/her to do otherwise :-) ]
-
-            # First handle the moving body
-            if bodyObj.movingBody is True:
-                self.bodyName2Index[bodyName] = bodyIndex
-            # This is what we do for the non-moving body
-            else:
-                foundGround = True
-                # Only swap if it is not already body #0
-                if bodyIndex != 0:
-                    # Swap the items in the body Object list
-                    self.bodyObjList[0], self.bodyObjList[bodyIndex] = self.bodyObjList[bodyIndex], self.bodyObjList[0]
-                    # Swap the items in the point Dictionary list
-                    self.pointDictList[0], self.pointDictList[bodyIndex] = self.pointDictList[bodyIndex], self.pointDictList[0]
-                    # Swap the items in the "Number of points in Dictionary" list
-                    self.numPointsInDict[bodyIndex], self.numPointsInDict[0] = self.numPointsInDict[0], self.numPointsInDict[bodyIndex]
-                    # This complicated line is a reverse lookup in the dictionary
-                    # so that we can find the name of the body which was the zero'th one
-                    zerosName = next(key for key, value in self.bodyName2Index.items() if value == 0)
-                    self.bodyName2Index[zerosName] = bodyIndex
-                # Set the index pointer to the new body in the zero'th position
-                self.bodyName2Index[bodyName] = 0
-            bodyIndex += 1
-        # Next bodyName
+        for bodyIndex in range(len(self.bodyObjList)):
+            bodyObj = self.bodyObjList[bodyIndex]
+            self.bodyName2Index[bodyObj.Name] = bodyIndex
+            self.pointDictList.append({bodyObj.pointNames[index]: index for index in range(len(bodyObj.pointNames))})
+            self.numPointsInDict.append(len(bodyObj.pointNames))
 
         # Handy variables calculated from numBodies
-        self.numBodies = bodyIndex
+        self.numBodies = len(self.bodyObjList)
         self.numMovBodies = self.numBodies-1
         self.numMovBodiesx3 = self.numMovBodies * 3
 
-        # Make sure we have found a ground
-        if foundGround is False:
-            CAD.Console.PrintError("No ground (stationary / non-moving) body found\n")
-            CAD.Console.PrintError("One (and only one) ground body must be defined\n\n")
-            return
-
-        # Clean up the space taken by the bodyObjDict
-        bodyObjDict = {}
-
         #############
         # JOINT STUFF
         #############
-        # Load the joint dictionary and convert to a list for quick indexing in numpy
-        jointObjDict = DT.getDictionary("DapJoint")
-        self.jointObjList = []
-        for jointName in jointObjDict:
-            jointObj = jointObjDict[jointName]
-            self.jointObjList.append(jointObj)
+        self.jointObjList = [ObjectSnapshotC(jointDict) for jointDict in snapshot["joints"]]
+        for jointObj in self.jointObjList:
             # Insert the applicable indices into the joint object
             jointObj.bodyHEADindex = self.bodyName2Index[jointObj.bodyHEADName]
             jointObj.pointHEADindex = self.pointDictList[jointObj.bodyHEADindex][jointObj.pointHEADName]
             jointObj.bodyTAILindex = self.bodyName2Index[jointObj.bodyTAILName]
             jointObj.pointTAILindex = self.pointDictList[jointObj.bodyTAILindex][jointObj.pointTAILName]
         self.numJoints = len(self.jointObjList)
-        # Clean up the space taken by the jointObjDictionary
-        jointObjDict = {}
-            
+
         #############
         # FORCE STUFF
         #############
-        # Load the force dictionary and convert to a list for quick indexing in numpy
-        forceObjDict = DT.getDictionary("DapForce")
-        self.forceObjList = []
-        for forceName in forceObjDict:
-            forceObj = forceObjDict[forceName]
-            self.forceObjList.append(forceObj)
+        self.forceObjList = [ObjectSnapshotC(forceDict) for forceDict in snapshot["forces"]]
+        for forceObj in self.forceObjList:
             # Only fix up the indices if it is not gravity
             # because with gravity, a specific body and point makes no sense
             if forceObj.actuatorType != 0:
@@ -226,81 +396,50 @@ class DapMainC:
                 forceObj.bodyTAILindex = self.bodyName2Index[forceObj.bodyTAILName]
                 forceObj.pointTAILindex = self.pointDictList[forceObj.bodyTAILindex][forceObj.pointTAILName]
         self.numForces = len(self.forceObjList)
-        # Clean up the space taken by the forceObjDictionary
-        forceObjDict = {}
 
-        # Get the plane normal rotation matrix from the main DAP container
-        xyzToXYRotation = CAD.Rotation(CAD.Vector(0, 0, 1), DT.getActiveContainerObject().movementPlaneNormal)
         # Find the maximum number of points in any body
-        self.maxNumPoints = 0
-        for bodyIndex in range(self.numBodies):
-            if self.numPointsInDict[bodyIndex] > self.maxNumPoints:
-                self.maxNumPoints = self.numPointsInDict[bodyIndex]
+        self.maxNumPoints = max(self.numPointsInDict)
         # Initialise the size of all the NumPy arrays and fill with zeros
         self.initNumPyArrays()
 
-        # Transfer all the 3D stuff into the numpy arrays
-        # while doing the projection onto the X-Y plane
+        # Transfer the bodies, already projected onto the X-Y plane, into the numpy arrays
         for bodyIndex in range(self.numBodies):
             bodyObj = self.bodyObjList[bodyIndex]
-            # Bring the body Mass, CoG, MoI and Weight up-to-date
-            DT.computeCoGAndMomentInertia(bodyObj)
             # All Mass and weight stuff
             self.MassNp[bodyIndex] = bodyObj.Mass
             self.momentInertiaNp[bodyIndex] = bodyObj.momentInertia
-            npVec = self.vecToNumpyF(xyzToXYRotation.toMatrix().multVec(bodyObj.weightVector))
-            self.WeightNp[bodyIndex] = npVec
+            self.WeightNp[bodyIndex] = np.array(bodyObj.gravityXY, dtype=np.float64) * bodyObj.Mass
 
-            # Change the local vectors to be relative to the CoG, rather than the body origin
             # The CoG in world coordinates are the world coordinates of the body
             # All points are relative to this point
-
-            # World
-            CoG = xyzToXYRotation.toMatrix().multVec(bodyObj.centreOfGravity)
-            npVec = self.vecToNumpyF(CoG)
-            self.worldNp[bodyIndex, 0:2] = npVec.copy()
+            npVec = np.array(bodyObj.worldXY, dtype=np.float64)
+            self.worldNp[bodyIndex, 0:2] = npVec
             self.worldRotNp[bodyIndex, 0:2] = self.Rot90NumpyF(npVec)
             # WorldDot
-            npVec = self.vecToNumpyF(xyzToXYRotation.toMatrix().multVec(bodyObj.worldDot))
+            npVec = np.array(bodyObj.worldDotXY, dtype=np.float64)
             self.worldDotNp[bodyIndex, 0:2] = npVec
             self.worldDotRotNp[bodyIndex, 0:2] = self.Rot90NumpyF(npVec)
             # WorldDotDot
             self.worldDotDotNp[bodyIndex, 0:2] = np.zeros((1, 2))
-            # Transform the points from model Placement to World X-Y plane relative to the CoG
-            bodyPointsLocal = bodyObj.pointLocals.copy()
-            vectorsRelativeCoG = bodyPointsLocal.copy()
-            for localIndex in range(len(bodyPointsLocal)):
-                bodyPointsLocal[localIndex] = xyzToXYRotation.toMatrix(). \
-                    multiply(bodyObj.world.toMatrix()). \
-                    multVec(bodyPointsLocal[localIndex])
-                vectorsRelativeCoG[localIndex] = bodyPointsLocal[localIndex] - CoG
-            # Take some trouble to make phi as nice an angle as possible
-            # Because the user will maybe use it manually later and will appreciate it
-            self.phiNp[bodyIndex] = self.nicePhiPlease(vectorsRelativeCoG)
-            if Debug:
-                DT.Mess("Best Phi: "+str(phi)+"'"+str(phi*180/math.pi)+"]")
-
-            # The phiDot axis vector is by definition perpendicular to the movement plane,
-            # so we don't have to do any rotating from the value set in bodyObj
+            self.phiNp[bodyIndex] = bodyObj.phi
             self.phiDotNp[bodyIndex] = bodyObj.phiDot
 
             # We will now calculate the rotation matrix and use it to find the coordinates of the points
             self.RotMatPhiNp[bodyIndex] = DT.RotationMatrixNp(self.phiNp[bodyIndex])
-            for pointIndex in range(len(vectorsRelativeCoG)):
+            for pointIndex in range(len(bodyObj.pointWorldXY)):
+                # Point World - coordinates of the point relative to the system origin - in world coordinates
+                pointWorld = np.array(bodyObj.pointWorldXY[pointIndex], dtype=np.float64)
+                self.pointWorldNp[bodyIndex, pointIndex] = pointWorld
+                self.pointWorldRotNp[bodyIndex, pointIndex] = self.Rot90NumpyF(pointWorld)
                 # Point Local - vector from module body CoG to the point, in body LCS coordinates
                 # [This is what we needed phi for, to fix the orientation of the body]
-                npVec = self.vecToNumpyF(vectorsRelativeCoG[pointIndex])
+                npVec = pointWorld - self.worldNp[bodyIndex]
                 self.pointLocalNp[bodyIndex, pointIndex, 0:2] = npVec @ self.RotMatPhiNp[bodyIndex]
                 # Point Vector - vector from body CoG to the point in world coordinates
-                self.pointVectorNp[bodyIndex, pointIndex, 0:2] = npVec.copy()
+                self.pointVectorNp[bodyIndex, pointIndex, 0:2] = npVec
                 self.pointVectorRotNp[bodyIndex][pointIndex] = self.Rot90NumpyF(npVec)
-                # Point Vector Dot
+                # Point Vector Dot and Point World Dot
                 self.pointVectorDotNp[bodyIndex][pointIndex] = np.zeros((1, 2))
-                # Point World - coordinates of the point relative to the system origin - in world coordinates
-                npVec = self.vecToNumpyF(bodyPointsLocal[pointIndex])
-                self.pointWorldNp[bodyIndex, pointIndex] = npVec.copy()
-                self.pointWorldRotNp[bodyIndex, pointIndex] = self.Rot90NumpyF(npVec)
-                # Point World Dot
                 self.pointWorldDotNp[bodyIndex][pointIndex] = np.zeros((1, 2))
             # Next pointIndex
         # Next bodyIndex
@@ -361,15 +500,15 @@ class DapMainC:
         # counter of function evaluations
         self.Counter = 0
         
-        # Stuff for the penetration / Friction calculations
-        self.flags = [False for index in range(10)]
-        self.pen_d0 = [0.0 for index in range(10)]
-
         # Make an array with the respective body Mass and moment of inertia
         self.massArrayNp = np.zeros(self.numMovBodiesx3)
         for index in range(1, self.numBodies):
             bodyObj = self.bodyObjList[index]
             self.massArrayNp[(index-1)*3:index*3] = bodyObj.Mass, bodyObj.Mass, bodyObj.momentInertia
+        # and the same as a sparse diagonal matrix for the sparse Jacobian solution
+        self.massDiagSparse = sparse.diags(self.massArrayNp, format="csr")
+        # The inverse masses are used by the unconstrained and Schur complement solutions
+        self.massInvArrayNp = 1.0 / self.massArrayNp
 
         # Make all Force unit vectors which are attached to ground, have their coordinates relative to world
         for forceIndex in range(self.numForces):
@@ -386,6 +525,56 @@ class DapMainC:
                     DT.Np2D(self.forceUnitWorldNp)
                     DT.MessNoLF("ForceUnitWorldRot: ")
                     DT.Np2D(self.forceUnitWorldRotNp)
+        # Index arrays of the forces with a unit vector which rotates with a moving body
+        # so that updatePointPositions can rotate all of them in one go
+        self.forceRotatingNp = np.array([forceIndex for forceIndex in range(self.numForces)
+                                         if self.forceObjList[forceIndex].bodyHEADindex != 0], dtype=np.int64)
+        self.forceRotatingBodyNp = np.array([self.forceObjList[forceIndex].bodyHEADindex
+                                             for forceIndex in self.forceRotatingNp], dtype=np.int64)
+
+        # The contact points of the bodies with the ground (y = 0) - their force index,
+        # body, point and coefficient of restitution for the impact events
+        self.contactForceList = [forceIndex for forceIndex in range(self.numForces)
+                                 if self.forceObjList[forceIndex].actuatorType == 9]
+        self.numContacts = len(self.contactForceList)
+        self.contactBodyNp = np.array([self.forceObjList[forceIndex].bodyHEADindex
+                                       for forceIndex in self.contactForceList], dtype=np.int64)
+        self.contactPointNp = np.array([self.forceObjList[forceIndex].pointHEADindex
+                                        for forceIndex in self.contactForceList], dtype=np.int64)
+        self.contactRestitutionNp = np.array([self.forceObjList[forceIndex].RestitutionCoeff
+                                              for forceIndex in self.contactForceList], dtype=np.float64)
+        # Contacts which have come to rest are handed over to the penalty force
+        self.contactRestingNp = np.zeros((self.numContacts,), dtype=bool)
+        # and the parameters of the penalty force and friction of every contact point
+        self.contactFlatNp = self.contactBodyNp * self.maxNumPoints + self.contactPointNp
+        self.contactStiffnessNp = np.array([self.forceObjList[forceIndex].Stiffness
+                                            for forceIndex in self.contactForceList], dtype=np.float64)
+        self.contactModelNp = np.array([self.forceObjList[forceIndex].ContactModel
+                                        for forceIndex in self.contactForceList], dtype=np.int64)
+        self.frictionModelNp = np.array([self.forceObjList[forceIndex].FrictionModel
+                                         for forceIndex in self.contactForceList], dtype=np.int64)
+        self.frictionParametersNp = np.array([[self.forceObjList[forceIndex].FrictionStatic,
+                                               self.forceObjList[forceIndex].FrictionDynamic,
+                                               self.forceObjList[forceIndex].FrictionViscous,
+                                               self.forceObjList[forceIndex].StribeckVelocity,
+                                               self.forceObjList[forceIndex].StribeckExponent,
+                                               self.forceObjList[forceIndex].FrictionSlope,
+                                               self.forceObjList[forceIndex].TransitionVelocity,
+                                               self.forceObjList[forceIndex].TransitionForce]
+                                              for forceIndex in self.contactForceList],
+                                             dtype=np.float64).reshape(self.numContacts, 8)
+        # Persistent state of each contact - its speed when it hit
+        self.contactSpeed0Np = np.zeros((self.numContacts,), dtype=np.float64)
+
+        # Only the joint types with a batched kernel can be solved - the joint by joint
+        # functions of the translational ones are not finished, so stop here rather than part way through
+        jointTypeNames = {jointType: jointName for jointName, jointType in DT.JOINT_TYPE_DICTIONARY.items()}
+        for jointObj in self.jointObjList:
+            if jointObj.JointType not in self.dictConstraintKernels:
+                CAD.Console.PrintError("Joint " + jointObj.Label + " is a " +
+                                       jointTypeNames.get(jointObj.JointType, str(jointObj.JointType)) +
+                                       " joint, which the solver cannot handle yet\n")
+                return
 
         # Assign number of constraints and number of bodies to each defined joint type
         for jointObj in self.jointObjList:
@@ -453,8 +642,7 @@ class DapMainC:
                     A = self.RotMatPhiNp[bodyTAIL].T @ \
                         (self.worldNp[bodyHEAD] - self.worldNp[bodyTAIL])
                     jointObj.phi0 = self.phiNp[bodyHEAD] - self.phiNp[bodyTAIL]
-                jointObj.d0.x = A[0]
-                jointObj.d0.y = A[1]
+                jointObj.d0 = [A[0], A[1], 0.0]
             else:
                 CAD.Console.PrintError("Unknown Joint Type - this should never occur\n")
         # Next Joint Object
@@ -467,7 +655,7 @@ class DapMainC:
             # If there is a driver function, then
             # store an instance of the class in driverObjDict and initialize its parameters
             if jointObj.FunctType != -1:
-                self.driverObjDict[jointObj.Name] = DapFunctMod.FunctionC(
+                self.driverObjDict[jointObj.Name] = DapFunctionMod.FunctionC(
                     [jointObj.FunctType,
                      jointObj.startTimeDriveFunc, jointObj.endTimeDriveFunc,
                      jointObj.startValueDriveFunc, jointObj.endValueDriveFunc,
@@ -481,10 +669,116 @@ class DapMainC:
             jointObj.rowStart = self.numConstraints
             jointObj.rowEnd = self.numConstraints + jointObj.mConstraints
             self.numConstraints = jointObj.rowEnd
+        # Now that we know the row pointers, work out the sparsity pattern of the Jacobian
+        self.makeJacobianScatterMap()
+        # and compile the joints and forces into groups for the batched kernels
+        self.compileJoints()
+        self.compileForces()
+        # and work out the coupling pattern of the state Jacobian for the implicit integrators
+        self.makeStateJacobianPattern()
+        # and allocate the buffers which the hot-path functions write into
+        self.initWorkspace()
 
         # Return with a flag to show we have reached the end of init error-free
         self.initialised = True
     #  -------------------------------------------------------------------------
+    @classmethod
+    def fromSnapshot(cls, snapshot, simEnd=None, simDelta=None):
+        """Build the model from a snapshot alone, without FreeCAD - the length of the
+        analysis and the reporting interval default to those of its solver"""
+        if simEnd is None:
+            simEnd = snapshot["solver"]["TimeLength"]
+        if simDelta is None:
+            simDelta = snapshot["solver"]["DeltaTime"]
+        return cls(simEnd, simDelta, snapshot["correctInitial"], snapshot=snapshot)
+    #  -------------------------------------------------------------------------
+    def documentModelSnapshotF(self):
+        """The model snapshot of the document. The model extracted by makeModelSnapshotF is kept by the
+        solver, and only extracted again when a body, joint, force, the material or the container has changed
+        [they drop it - see DT.invalidateModelSnapshot] or a solid has moved or changed its shape.
+        Otherwise, only the solver settings are taken afresh"""
+        if Debug:
+            DT.Mess("DapMainC-documentModelSnapshotF")
+        solverProxy = self.solverObj.Proxy
+        solidsFingerprint = self.solidsFingerprintF()
+        if getattr(solverProxy, "modelSnapshot", None) is None or solverProxy.solidsFingerprint != solidsFingerprint:
+            snapshot = self.makeModelSnapshotF()
+            if snapshot is None:
+                return None
+            # Kept only once it is complete, because extracting it brings the bodies' Mass etc. up-to-date
+            solverProxy.modelSnapshot = copy.deepcopy(snapshot)
+            solverProxy.solidsFingerprint = solidsFingerprint
+            return snapshot
+        if Debug:
+            DT.Mess("Re-using the model extracted by the last solve")
+        snapshot = copy.deepcopy(solverProxy.modelSnapshot)
+        snapshot["solver"] = documentObjectProperties(self.solverObj)
+        snapshot["correctInitial"] = self.correctInitial
+        return snapshot
+    #  -------------------------------------------------------------------------
+    def solidsFingerprintF(self):
+        """The placement and bounding box of each of the solids making up the bodies.
+        The solids belong to Assembly 4, so they do not tell the DAP objects when they move or change"""
+        if Debug:
+            DT.Mess("DapMainC-solidsFingerprintF")
+        solidsFingerprint = []
+        for bodyObj in DT.getDictionary("DapBody").values():
+            for assemblyPartName in bodyObj.ass4SolidsNames:
+                shape = bodyObj.Document.getObject(assemblyPartName).Shape
+                boundBox = shape.BoundBox
+                solidsFingerprint.append([assemblyPartName, list(shape.Placement.toMatrix().A),
+                                          [boundBox.XMin, boundBox.YMin, boundBox.ZMin,
+                                           boundBox.XMax, boundBox.YMax, boundBox.ZMax]])
+        return solidsFingerprint
+    #  -------------------------------------------------------------------------
+    def makeModelSnapshotF(self):
+        """Extract the model in the active DAP container into plain data: the solver settings,
+        the bodies projected onto the movement plane and the properties of the joints and forces.
+        The rest of __init__ builds the model from this alone, without FreeCAD"""
+        if Debug:
+            DT.Mess("DapMainC-makeModelSnapshotF")
+        bodyObjList = list(DT.getDictionary("DapBody").values())
+        # Make the [only] stationary body the zero'th one in the list
+        # We have made sure that only one is stationary at definition time
+        # and we have requested the user to put all the stationary objects into one body
+        groundList = [bodyIndex for bodyIndex in range(len(bodyObjList)) if bodyObjList[bodyIndex].movingBody is not True]
+        if len(groundList) == 0:
+            CAD.Console.PrintError("No ground (stationary / non-moving) body found\n")
+            CAD.Console.PrintError("One (and only one) ground body must be defined\n\n")
+            return None
+        bodyObjList[0], bodyObjList[groundList[0]] = bodyObjList[groundList[0]], bodyObjList[0]
+
+        # Get the plane normal rotation matrix from the main DAP container
+        xyzToXYMatrix = CAD.Rotation(CAD.Vector(0, 0, 1), DT.getActiveContainerObject().movementPlaneNormal).toMatrix()
+        bodyList = []
+        for bodyObj in bodyObjList:
+            # Bring the body Mass, CoG, MoI and Weight up-to-date
+            DT.computeCoGAndMomentInertia(bodyObj)
+            bodyDict = documentObjectProperties(bodyObj)
+            # Project gravity, the CoG [the world coordinates of the body], its velocity
+            # and the points in world coordinates onto the X-Y plane
+            # [the weight is worked out from the Mass, so that a change of Mass changes it too]
+            gravity = xyzToXYMatrix.multVec(DT.getActiveContainerObject().gravityVector)
+            CoG = xyzToXYMatrix.multVec(bodyObj.centreOfGravity)
+            worldDot = xyzToXYMatrix.multVec(bodyObj.worldDot)
+            pointWorldList = [xyzToXYMatrix.multiply(bodyObj.world.toMatrix()).multVec(pointLocal)
+                              for pointLocal in bodyObj.pointLocals]
+            bodyDict["gravityXY"] = [gravity.x, gravity.y]
+            bodyDict["worldXY"] = [CoG.x, CoG.y]
+            bodyDict["worldDotXY"] = [worldDot.x, worldDot.y]
+            bodyDict["pointWorldXY"] = [[pointWorld.x, pointWorld.y] for pointWorld in pointWorldList]
+            # Take some trouble to make phi as nice an angle as possible
+            # Because the user will maybe use it manually later and will appreciate it
+            bodyDict["phi"] = self.nicePhiPlease([pointWorld - CoG for pointWorld in pointWorldList])
+            bodyList.append(bodyDict)
+
+        return {"version": MODEL_SNAPSHOT_VERSION,
+                "solver": documentObjectProperties(self.solverObj),
+                "correctInitial": self.correctInitial,
+                "bodies": bodyList,
+                "joints": [documentObjectProperties(jointObj) for jointObj in DT.getDictionary("DapJoint").values()],
+                "forces": [documentObjectProperties(forceObj) for forceObj in DT.getDictionary("DapForce").values()]}
+    #  -------------------------------------------------------------------------
     def MainSolve(self):
         if self.numConstraints != 0 and self.correctInitial:
             # Correct for initial conditions consistency
@@ -593,32 +887,105 @@ class DapMainC:
         #       success                   True if 0 or +1 above
         # ###################################################################################
 
-        # Solve the equations: <analysis function> (<start time>, <end time>) <pos & vel array> <times at which to evaluate>
-        solution = solve_ivp(self.Analysis,
-                             (0.0, self.simEnd),
-                             uArray,
-                             t_eval=self.Tspan,
-                             rtol=self.relativeTolerance,
-                             atol=self.absoluteTolerance)
-
-        # Output the positions/angles results file
-        self.PosFILE = open(os.path.join(self.solverObj.Directory, "DapAnimation.csv"), 'w')
-        Sol = solution.y.T
-        for tick in range(len(solution.t)):
-            self.PosFILE.write(str(solution.t[tick])+" ")
-            for body in range(self.numBodies-1):
-                self.PosFILE.write(str(Sol[tick, body * 3]) + " ")
-                self.PosFILE.write(str(Sol[tick, body * 3 + 1]) + " ")
-                self.PosFILE.write(str(Sol[tick, body * 3 + 2]) + " ")
-            self.PosFILE.write("\n")
-        self.PosFILE.close()
+        # Only pass the step sizes if they have been set, otherwise let the integrator choose
+        stepOptions = {}
+        if self.maxStep > 0.0:
+            stepOptions["max_step"] = self.maxStep
+        if self.firstStep > 0.0:
+            stepOptions["first_step"] = self.firstStep
+        # The implicit methods need the state Jacobian - either ours, or else tell them
+        # its sparsity so that their finite differences need fewer Analysis calls
+        if self.integrationMethod in ("Radau", "BDF", "LSODA"):
+            if self.analyticJacobian:
+                stepOptions["jac"] = self.stateJacobianF
+            elif self.integrationMethod != "LSODA":
+                stepOptions["jac_sparsity"] = self.stateJacobianSparsity
+
+        # No point has hit the ground before the run starts
+        self.contactSpeed0Np[:] = 0.0
+        self.acceptContactsF(uArray)
+
+        if self.contactMode == 1 and self.integrationMode != 0:
+            CAD.Console.PrintWarning("Impact events need the solve_ivp integration mode - using contact forces instead\n")
+            self.contactMode = 0
+        streaming = self.streamResults and self.integrationMode in (0, 1) and \
+            not (self.contactMode == 1 and self.numContacts > 0)
+        if self.streamResults and not streaming:
+            CAD.Console.PrintWarning("Results can only be streamed with the solve_ivp or projection modes "
+                                     "and without impact events - keeping them in memory instead\n")
+        if streaming:
+            # Step through the solution, writing the results out a chunk at a time
+            solution = self.streamSolveF(uArray, stepOptions)
+        elif self.integrationMode == 1 and self.integrationMethod in self.projectableMethods:
+            # Step through the solution, projecting back onto the constraints after each step
+            solution = self.stepwiseSolveF(uArray, stepOptions)
+        elif self.integrationMode == 2 and self.numConstraints > 0:
+            # Integrate only the independent coordinates
+            solution = self.partitionedSolveF(uArray, stepOptions)
+        elif self.integrationMode in (3, 4):
+            # Fixed steps, at a constant cost per step
+            solution = self.fixedStepSolveF(uArray)
+        elif self.contactMode == 1 and self.numContacts > 0:
+            # Integrate from impact to impact
+            solution = self.impactSolveF(uArray, stepOptions)
+        else:
+            if self.integrationMode == 1:
+                CAD.Console.PrintWarning("Projection is not available with " + self.integrationMethod +
+                                         " - integrating without it\n")
+            # Solve the equations: <analysis function> (<start time>, <end time>) <pos & vel array> <times at which to evaluate>
+            solution = solve_ivp(self.Analysis,
+                                 (0.0, self.simEnd),
+                                 uArray,
+                                 method=self.integrationMethod,
+                                 t_eval=self.Tspan,
+                                 events=[self.acceptedStepEventF] if self.numContacts > 0 else None,
+                                 dense_output=self.denseOutput,
+                                 rtol=self.relativeTolerance,
+                                 atol=self.absoluteTolerance,
+                                 **stepOptions)
+        if not solution.success:
+            CAD.Console.PrintError("Integration failed: " + solution.message + "\n")
+        # Flag whether the integration reached the end [for the parameter sweeps]
+        self.integrationSuccess = bool(solution.success)
+
+        # Store the integrator statistics so that different methods can be compared
+        self.solverObj.NumFuncEvals = int(solution.nfev)
+        self.solverObj.NumJacEvals = int(solution.njev)
+        self.solverObj.NumLUDecomps = int(solution.nlu)
+        # and how far the results have drifted off the constraints [already found chunk by chunk if streamed]
+        if streaming:
+            maxPositionDrift, maxVelocityDrift = solution.maxPositionDrift, solution.maxVelocityDrift
+        else:
+            maxPositionDrift, maxVelocityDrift = self.constraintDriftF(solution.t, solution.y.T)
+        self.solverObj.MaxConstraintDrift = maxPositionDrift
+        self.solverObj.MaxVelocityDrift = maxVelocityDrift
+        if Debug:
+            DT.Mess(self.integrationMethod + " nfev: " + str(solution.nfev) +
+                    " njev: " + str(solution.njev) + " nlu: " + str(solution.nlu) +
+                    " drift: " + str(maxPositionDrift) + " " + str(maxVelocityDrift))
+
+        # Store the results with one bulk write, and the header which describes them [already written if streamed]
+        if not streaming:
+            np.save(os.path.join(self.solverObj.Directory, RESULTS_FILE), np.column_stack((solution.t, solution.y.T)))
+            writeResultsHeader(self.solverObj.Directory, self.resultsHeaderF(len(solution.t), bool(solution.success)))
+            # and the positions as text, if asked for
+            if self.exportCSV:
+                exportAnimationCSV(self.solverObj.Directory)
+        # and the interpolant of the whole run [or remove the one of an earlier run]
+        self.denseSolution = solution.sol
+        densePath = os.path.join(self.solverObj.Directory, DENSE_OUTPUT_FILE)
+        if self.denseSolution is not None:
+            with open(densePath, "wb") as denseFILE:
+                pickle.dump(self.denseSolution, denseFILE, protocol=pickle.HIGHEST_PROTOCOL)
+        elif os.path.exists(densePath):
+            os.remove(densePath)
 
         # Save the most important stuff into the solver object
         BodyNames = []
         BodyCoG = []
         for bodyIndex in range(1, len(self.bodyObjList)):
             BodyNames.append(self.bodyObjList[bodyIndex].Name)
-            BodyCoG.append(self.bodyObjList[bodyIndex].centreOfGravity)
+            BodyCoG.append(tuple(self.bodyObjList[bodyIndex].centreOfGravity))
         self.solverObj.BodyNames = BodyNames
         self.solverObj.BodyCoG = BodyCoG
         self.solverObj.DeltaTime = self.simDelta
@@ -626,12 +993,726 @@ class DapMainC:
         self.solverObj.DapResultsValid = True
 
         if self.solverObj.FileName != "-":
-            self.outputResults(solution.t, solution.y.T)
+            if streaming:
+                # Work through the streamed states from the disk rather than from memory
+                header, resultsNp = openResults(self.solverObj.Directory)
+                self.outputResults(resultsNp[:, 0], resultsNp[:, 1:])
+            else:
+                self.outputResults(solution.t, solution.y.T)
     #####################################
     #   This is the end of the solution
     # The rest are all called subroutines
     #####################################
     #  -------------------------------------------------------------------------
+    def stepwiseSolveF(self, uArray, stepOptions):
+        """Step the scipy OdeSolver ourselves, projecting the coordinates and velocities
+        back onto the constraints after every accepted step so they cannot drift.
+        Returns the same fields as solve_ivp"""
+        if Debug:
+            DT.Mess("DapMainMod-stepwiseSolveF")
+        self.projectionFactor = None
+        odeSolver = self.dictSteppers[self.integrationMethod](self.Analysis,
+                                                              0.0,
+                                                              self.projectStateF(0.0, uArray),
+                                                              self.simEnd,
+                                                              rtol=self.relativeTolerance,
+                                                              atol=self.absoluteTolerance,
+                                                              **stepOptions)
+        numOutputs = len(self.Tspan)
+        uResults = np.zeros((numOutputs, len(uArray),), dtype=np.float64)
+        outputIndex = 0
+        while outputIndex < numOutputs and self.Tspan[outputIndex] <= 0.0:
+            uResults[outputIndex] = odeSolver.y
+            outputIndex += 1
+        denseTickList = [odeSolver.t]
+        denseInterpolantList = []
+
+        message = "The solver successfully reached the end of the integration interval."
+        while odeSolver.status == "running":
+            stepMessage = odeSolver.step()
+            if odeSolver.status == "failed":
+                message = stepMessage
+                break
+            if self.denseOutput:
+                denseTickList.append(odeSolver.t)
+                denseInterpolantList.append(odeSolver.dense_output())
+            # Interpolate the reporting times inside this step, before we move its end point
+            if outputIndex < numOutputs and self.Tspan[outputIndex] <= odeSolver.t:
+                interpolant = denseInterpolantList[-1] if self.denseOutput else odeSolver.dense_output()
+                while outputIndex < numOutputs and self.Tspan[outputIndex] <= odeSolver.t:
+                    uResults[outputIndex] = self.projectStateF(self.Tspan[outputIndex],
+                                                               interpolant(self.Tspan[outputIndex]))
+                    outputIndex += 1
+            # Carry on from the projected end point, with its derivative to match
+            odeSolver.y = self.projectStateF(odeSolver.t, odeSolver.y)
+            self.acceptContactsF(odeSolver.y)
+            odeSolver.f = odeSolver.fun(odeSolver.t, odeSolver.y)
+
+        return OptimizeResult(t=self.Tspan[0: outputIndex],
+                              y=uResults[0: outputIndex].T,
+                              sol=self.makeDenseSolutionF(denseTickList, denseInterpolantList),
+                              nfev=odeSolver.nfev,
+                              njev=odeSolver.njev,
+                              nlu=odeSolver.nlu,
+                              status=-1 if odeSolver.status == "failed" else 0,
+                              message=message,
+                              success=odeSolver.status != "failed")
+    #  -------------------------------------------------------------------------
+    def streamSolveF(self, uArray, stepOptions):
+        """Step the scipy OdeSolver ourselves and write the states at the reporting times
+        to disk as they are passed, a chunk at a time, so that the memory used does not grow
+        with the length of the run and a run which is cut short keeps what it had done.
+        Returns the same fields as solve_ivp, but with t and y None - the results are only in the store"""
+        if Debug:
+            DT.Mess("DapMainMod-streamSolveF")
+        # Project after every step as well, if that is what the integration mode asks for
+        projecting = self.integrationMode == 1 and self.integrationMethod in self.projectableMethods
+        self.projectionFactor = None
+        if projecting:
+            uArray = self.projectStateF(0.0, uArray)
+        odeSolver = self.dictSteppers[self.integrationMethod](self.Analysis,
+                                                              0.0,
+                                                              uArray,
+                                                              self.simEnd,
+                                                              rtol=self.relativeTolerance,
+                                                              atol=self.absoluteTolerance,
+                                                              **stepOptions)
+        numOutputs = len(self.Tspan)
+        numStates = len(uArray)
+        # The chunk being filled, and where the chunks go
+        chunkTicksNp = np.zeros((self.streamChunkSize,), dtype=np.float64)
+        chunkUNp = np.zeros((self.streamChunkSize, numStates,), dtype=np.float64)
+        animationFILE = None
+        if self.exportCSV:
+            animationFILE = open(os.path.join(self.solverObj.Directory, "DapAnimation.csv"), 'w')
+        statesNp = np.lib.format.open_memmap(os.path.join(self.solverObj.Directory, RESULTS_FILE), mode="w+",
+                                             dtype=np.float64, shape=(numOutputs, numStates + 1))
+        # The header says how far the run has got, in case it does not finish
+        writeResultsHeader(self.solverObj.Directory, self.resultsHeaderF(0, False))
+        self.streamDrift = [0.0, 0.0]
+        outputIndex = 0
+        chunkIndex = 0
+        while outputIndex < numOutputs and self.Tspan[outputIndex] <= 0.0:
+            chunkTicksNp[chunkIndex] = self.Tspan[outputIndex]
+            chunkUNp[chunkIndex] = odeSolver.y
+            outputIndex += 1
+            chunkIndex += 1
+            if chunkIndex == self.streamChunkSize:
+                self.flushChunkF(chunkTicksNp, chunkUNp, outputIndex, animationFILE, statesNp)
+                chunkIndex = 0
+
+        message = "The solver successfully reached the end of the integration interval."
+        while odeSolver.status == "running":
+            stepMessage = odeSolver.step()
+            if odeSolver.status == "failed":
+                message = stepMessage
+                break
+            # Interpolate the reporting times inside this step
+            if outputIndex < numOutputs and self.Tspan[outputIndex] <= odeSolver.t:
+                interpolant = odeSolver.dense_output()
+                while outputIndex < numOutputs and self.Tspan[outputIndex] <= odeSolver.t:
+                    chunkTicksNp[chunkIndex] = self.Tspan[outputIndex]
+                    chunkUNp[chunkIndex] = interpolant(self.Tspan[outputIndex])
+                    if projecting:
+                        chunkUNp[chunkIndex] = self.projectStateF(self.Tspan[outputIndex], chunkUNp[chunkIndex])
+                    outputIndex += 1
+                    chunkIndex += 1
+                    if chunkIndex == self.streamChunkSize:
+                        self.flushChunkF(chunkTicksNp, chunkUNp, outputIndex, animationFILE, statesNp)
+                        chunkIndex = 0
+            if projecting:
+                odeSolver.y = self.projectStateF(odeSolver.t, odeSolver.y)
+            self.acceptContactsF(odeSolver.y)
+            if projecting:
+                odeSolver.f = odeSolver.fun(odeSolver.t, odeSolver.y)
+        # and whatever is left over
+        self.flushChunkF(chunkTicksNp[0: chunkIndex], chunkUNp[0: chunkIndex], outputIndex, animationFILE, statesNp)
+        if animationFILE is not None:
+            animationFILE.close()
+        del statesNp
+        writeResultsHeader(self.solverObj.Directory, self.resultsHeaderF(outputIndex, odeSolver.status != "failed"))
+
+        return OptimizeResult(t=None,
+                              y=None,
+                              sol=None,
+                              maxPositionDrift=self.streamDrift[0],
+                              maxVelocityDrift=self.streamDrift[1],
+                              nfev=odeSolver.nfev,
+                              njev=odeSolver.njev,
+                              nlu=odeSolver.nlu,
+                              status=-1 if odeSolver.status == "failed" else 0,
+                              message=message,
+                              success=odeSolver.status != "failed")
+    #  -------------------------------------------------------------------------
+    def flushChunkF(self, chunkTicksNp, chunkUNp, outputIndex, animationFILE, statesNp):
+        """Write a chunk of streamed results, ending at outputIndex, to the results store
+        [and the animation text file] on disk, and keep track of the constraint drift as we go"""
+        if Debug:
+            DT.Mess("DapMainMod-flushChunkF")
+        chunkStart = outputIndex - len(chunkTicksNp)
+        statesNp[chunkStart: outputIndex, 0] = chunkTicksNp
+        statesNp[chunkStart: outputIndex, 1:] = chunkUNp
+        statesNp.flush()
+        writeResultsHeader(self.solverObj.Directory, self.resultsHeaderF(outputIndex, False))
+        if animationFILE is not None:
+            np.savetxt(animationFILE, np.column_stack((chunkTicksNp, chunkUNp[:, 0: self.numMovBodiesx3])),
+                       fmt="%.17g")
+            animationFILE.flush()
+        maxPositionDrift, maxVelocityDrift = self.constraintDriftF(chunkTicksNp, chunkUNp)
+        self.streamDrift[0] = max(self.streamDrift[0], maxPositionDrift)
+        self.streamDrift[1] = max(self.streamDrift[1], maxVelocityDrift)
+    #  -------------------------------------------------------------------------
+    def resultsHeaderF(self, numRows, complete):
+        """The JSON header of the results store, describing its rows of [time, state]"""
+        return {
+            "version": RESULTS_FORMAT_VERSION,
+            "numRows": int(numRows),
+            "complete": bool(complete),
+            "bodyNames": [bodyObj.Name for bodyObj in self.bodyObjList[1:]],
+            "numMovBodies": self.numMovBodies,
+            "columns": ["time"] +
+                       [coordinate + "." + bodyObj.Name
+                        for bodyObj in self.bodyObjList[1:] for coordinate in ("x", "y", "phi")] +
+                       [coordinate + "Dot." + bodyObj.Name
+                        for bodyObj in self.bodyObjList[1:] for coordinate in ("x", "y", "phi")],
+            "timeBase": {"start": 0.0, "delta": self.simDelta, "end": self.simEnd},
+            "units": {"time": "s", "length": "mm", "angle": "rad"},
+            "integrationMethod": self.integrationMethod,
+            "modelHash": self.modelHash,
+        }
+    #  -------------------------------------------------------------------------
+    def projectStateF(self, tick, uArray):
+        """Return uArray projected onto the constraints: Newton iteration of the
+        coordinates onto Phi = 0, then the velocities onto J velocities = nu.
+        J J^T is only factorised again when the old factorisation stops
+        at least halving the constraint error on each iteration"""
+        if Debug:
+            DT.Mess("DapMainMod-projectStateF")
+        uProjected = np.array(uArray, dtype=np.float64)
+        if self.numConstraints == 0:
+            return uProjected
+        positions = uProjected[0: self.numMovBodiesx3]
+        velocities = uProjected[self.numMovBodiesx3:]
+        self.unpackStateF(uProjected)
+        previousError = np.inf
+        for n in range(10):
+            constraintError = self.Constraints(tick)
+            error = np.abs(constraintError).max()
+            if error < self.absoluteTolerance:
+                break
+            if self.projectionFactor is None or error > 0.5 * previousError:
+                self.factoriseProjectionF()
+            previousError = error
+            positions -= self.projectionJacobianNp.T @ cho_solve(self.projectionFactor, constraintError,
+                                                                 check_finite=False)
+            self.unpackStateF(uProjected)
+
+        # and the velocities at the projected coordinates, in the same way
+        Jacobian = self.getJacobianF()
+        rhsVel = self.RHSVel(tick)
+        previousError = np.inf
+        for n in range(10):
+            constraintVel = Jacobian @ velocities - rhsVel
+            error = np.abs(constraintVel).max()
+            if error < self.absoluteTolerance:
+                break
+            if self.projectionFactor is None or error > 0.5 * previousError:
+                self.factoriseProjectionF()
+            previousError = error
+            velocities -= self.projectionJacobianNp.T @ cho_solve(self.projectionFactor, constraintVel,
+                                                                  check_finite=False)
+        return uProjected
+    #  -------------------------------------------------------------------------
+    def factoriseProjectionF(self):
+        """Keep the Jacobian at the current coordinates and the Cholesky factorisation of J J^T"""
+        self.projectionJacobianNp = self.getJacobianF().copy()
+        self.projectionFactor = cho_factor(self.projectionJacobianNp @ self.projectionJacobianNp.T,
+                                           check_finite=False)
+    #  -------------------------------------------------------------------------
+    def partitionedSolveF(self, uArray, stepOptions):
+        """Integrate only the independent coordinates and their velocities, recovering the
+        dependent ones from the constraints whenever they are needed.  The partition is
+        chosen again, and the integrator restarted, when the dependent columns of the
+        Jacobian become badly conditioned. Returns the same fields as solve_ivp"""
+        if Debug:
+            DT.Mess("DapMainMod-partitionedSolveF")
+        # Our state Jacobian is for the full state - let the integrator difference the small one
+        stepOptions = {key: value for key, value in stepOptions.items() if key not in ("jac", "jac_sparsity")}
+        self.partitionUNp = np.array(uArray, dtype=np.float64)
+        self.choosePartitionF()
+        numOutputs = len(self.Tspan)
+        uResults = np.zeros((numOutputs, len(uArray),), dtype=np.float64)
+        outputIndex = 0
+        while outputIndex < numOutputs and self.Tspan[outputIndex] <= 0.0:
+            uResults[outputIndex] = uArray
+            outputIndex += 1
+
+        tick = 0.0
+        # The full state and its derivative at the end of every step, for the dense output
+        hermiteTickList = [0.0]
+        hermiteUList = [np.array(uArray, dtype=np.float64)]
+        hermiteUDotList = [self.Analysis(0.0, uArray)] if self.denseOutput else []
+        numFuncEvals = numJacEvals = numLUDecomps = 0
+        odeSolver = None
+        message = "The solver successfully reached the end of the integration interval."
+        status = 0
+        while tick < self.simEnd:
+            # (Re)start the integrator from the independent coordinates of the current partition
+            if odeSolver is None:
+                odeSolver = self.dictSteppers[self.integrationMethod](self.partitionedAnalysisF,
+                                                                       tick,
+                                                                       self.partitionUNp[self.partitionStateNp],
+                                                                       self.simEnd,
+                                                                       rtol=self.relativeTolerance,
+                                                                       atol=self.absoluteTolerance,
+                                                                       **stepOptions)
+            stepMessage = odeSolver.step()
+            if odeSolver.status == "failed":
+                message = stepMessage
+                status = -1
+                break
+            tick = odeSolver.t
+            # Fill in the dependent coordinates at the reporting times inside this step
+            if outputIndex < numOutputs and self.Tspan[outputIndex] <= tick:
+                interpolant = odeSolver.dense_output()
+                while outputIndex < numOutputs and self.Tspan[outputIndex] <= tick:
+                    uResults[outputIndex] = self.dependentStateF(self.Tspan[outputIndex],
+                                                                 interpolant(self.Tspan[outputIndex]))
+                    outputIndex += 1
+            # Choose a new partition if the dependent Jacobian columns are becoming singular
+            uStep = self.dependentStateF(tick, odeSolver.y)
+            self.acceptContactsF(uStep)
+            if self.denseOutput:
+                hermiteTickList.append(tick)
+                hermiteUList.append(uStep)
+                hermiteUDotList.append(self.Analysis(tick, uStep))
+            if np.linalg.cond(self.getJacobianF()[:, self.dependentNp]) > 10.0 * self.partitionCondition:
+                numFuncEvals += odeSolver.nfev
+                numJacEvals += odeSolver.njev
+                numLUDecomps += odeSolver.nlu
+                # and carry on with the step size we had got to
+                stepOptions["first_step"] = min(odeSolver.step_size, self.simEnd - tick)
+                self.choosePartitionF()
+                odeSolver = None
+                if Debug:
+                    DT.Mess("New partition at " + str(tick) + ": " + str(self.independentNp))
+        if odeSolver is not None:
+            numFuncEvals += odeSolver.nfev
+            numJacEvals += odeSolver.njev
+            numLUDecomps += odeSolver.nlu
+
+        return OptimizeResult(t=self.Tspan[0: outputIndex],
+                              y=uResults[0: outputIndex].T,
+                              sol=self.makeHermiteSolutionF(hermiteTickList, hermiteUList, hermiteUDotList),
+                              nfev=numFuncEvals,
+                              njev=numJacEvals,
+                              nlu=numLUDecomps,
+                              status=status,
+                              message=message,
+                              success=status == 0)
+    #  -------------------------------------------------------------------------
+    def fixedStepSolveF(self, uArray):
+        """Integrate with fixed steps of semi-implicit Euler or RK4, projecting onto the
+        constraints after every step, so every step costs the same and a preview can keep up
+        with the clock.  The step is MaxStep, rounded to fit a whole number of steps into the
+        reporting interval [the reporting interval itself if MaxStep is 0].
+        Records how the wall-clock time compares with the simulated time"""
+        if Debug:
+            DT.Mess("DapMainMod-fixedStepSolveF")
+        stepsPerOutput = 1
+        if 0.0 < self.maxStep < self.simDelta:
+            stepsPerOutput = int(math.ceil(self.simDelta / self.maxStep - 1.0e-9))
+        stepSize = self.simDelta / stepsPerOutput
+        numOutputs = len(self.Tspan)
+        numStates = len(uArray)
+        uResults = np.zeros((numOutputs, numStates,), dtype=np.float64)
+        # There is nothing to report if the simulation ends before it starts
+        if numOutputs == 0:
+            self.solverObj.RealTimeFactor = 0.0
+            self.solverObj.MissedFrames = 0
+            return OptimizeResult(t=self.Tspan.copy(),
+                                  y=uResults.T,
+                                  sol=None,
+                                  nfev=0,
+                                  njev=0,
+                                  nlu=0,
+                                  status=0,
+                                  message="Fixed step integration completed.",
+                                  success=True)
+        # Preallocated state and RK4 stages
+        uStep = np.zeros((numStates,), dtype=np.float64)
+        uStage = np.zeros((numStates,), dtype=np.float64)
+        uDotSum = np.zeros((numStates,), dtype=np.float64)
+        positions = uStep[0: self.numMovBodiesx3]
+        velocities = uStep[self.numMovBodiesx3:]
+
+        self.projectionFactor = None
+        uStep[:] = self.projectStateF(0.0, uArray)
+        uResults[0] = uStep
+        # The state and its derivative at the start of every step, for the dense output
+        hermiteTickList = []
+        hermiteUList = []
+        hermiteUDotList = []
+        startCounter = self.Counter
+        missedFrames = 0
+        startTime = time.perf_counter()
+        for outputIndex in range(1, numOutputs):
+            for step in range(stepsPerOutput):
+                tick = self.Tspan[outputIndex-1] + step * stepSize
+                uDot = self.Analysis(tick, uStep)
+                if self.denseOutput:
+                    hermiteTickList.append(tick)
+                    hermiteUList.append(uStep.copy())
+                    hermiteUDotList.append(uDot)
+                if self.integrationMode == 3:
+                    # Semi-implicit Euler: the new velocities move the coordinates
+                    velocities += stepSize * uDot[self.numMovBodiesx3:]
+                    positions += stepSize * velocities
+                else:
+                    # Classical fourth order Runge-Kutta
+                    np.copyto(uDotSum, uDot)
+                    np.multiply(uDot, 0.5 * stepSize, out=uStage)
+                    uStage += uStep
+                    uDot = self.Analysis(tick + 0.5 * stepSize, uStage)
+                    uDotSum += 2.0 * uDot
+                    np.multiply(uDot, 0.5 * stepSize, out=uStage)
+                    uStage += uStep
+                    uDot = self.Analysis(tick + 0.5 * stepSize, uStage)
+                    uDotSum += 2.0 * uDot
+                    np.multiply(uDot, stepSize, out=uStage)
+                    uStage += uStep
+                    uDotSum += self.Analysis(tick + stepSize, uStage)
+                    uDotSum *= stepSize / 6.0
+                    uStep += uDotSum
+                uStep[:] = self.projectStateF(tick + stepSize, uStep)
+                self.acceptContactsF(uStep)
+            uResults[outputIndex] = uStep
+            # Have we fallen behind the clock at this frame
+            if time.perf_counter() - startTime > self.Tspan[outputIndex]:
+                missedFrames += 1
+        wallTime = time.perf_counter() - startTime
+        # and at the end of the last step
+        if self.denseOutput and numOutputs > 1:
+            hermiteTickList.append(self.Tspan[numOutputs-1])
+            hermiteUList.append(uStep.copy())
+            hermiteUDotList.append(self.Analysis(self.Tspan[numOutputs-1], uStep))
+
+        # Report whether we kept up with real time
+        simulatedTime = self.Tspan[numOutputs-1]
+        self.solverObj.RealTimeFactor = simulatedTime / wallTime if wallTime > 0.0 else 0.0
+        self.solverObj.MissedFrames = missedFrames
+        if missedFrames > 0:
+            CAD.Console.PrintWarning("Fixed step integration ran at " +
+                                     str(round(self.solverObj.RealTimeFactor, 2)) +
+                                     " times real time and was late for " + str(missedFrames) +
+                                     " of " + str(numOutputs - 1) + " frames\n")
+
+        return OptimizeResult(t=self.Tspan.copy(),
+                              y=uResults.T,
+                              sol=self.makeHermiteSolutionF(hermiteTickList, hermiteUList, hermiteUDotList),
+                              nfev=self.Counter - startCounter,
+                              njev=0,
+                              nlu=0,
+                              status=0,
+                              message="Fixed step integration completed.",
+                              success=True)
+    #  -------------------------------------------------------------------------
+    def impactSolveF(self, uArray, stepOptions):
+        """Integrate with solve_ivp until a contact point reaches the ground, apply the
+        impact impulses with restitution of all the contacts hitting it to the velocities,
+        and carry on from there. Returns the same fields as solve_ivp"""
+        if Debug:
+            DT.Mess("DapMainMod-impactSolveF")
+        # One terminal event per contact point, when it comes down through the ground
+        eventList = []
+        for contactIndex in range(self.numContacts):
+            event = lambda tick, uArray, contactIndex=contactIndex: self.contactGapF(contactIndex, uArray)
+            event.terminal = True
+            event.direction = -1
+            eventList.append(event)
+        # and the approach speeds of the contacts left to the penalty force are latched at every accepted step
+        eventList.append(self.acceptedStepEventF)
+        self.contactRestingNp[:] = False
+        self.restPenetratingContactsF(uArray)
+
+        tickList = []
+        uList = []
+        denseTickList = [0.0]
+        denseInterpolantList = []
+        numFuncEvals = numJacEvals = numLUDecomps = 0
+        startTick = 0.0
+        uStart = np.array(uArray, dtype=np.float64)
+        while True:
+            tEval = self.Tspan[self.Tspan >= startTick] if startTick == 0.0 else self.Tspan[self.Tspan > startTick]
+            solution = solve_ivp(self.Analysis,
+                                 (startTick, self.simEnd),
+                                 uStart,
+                                 method=self.integrationMethod,
+                                 t_eval=tEval,
+                                 events=eventList,
+                                 dense_output=self.denseOutput,
+                                 rtol=self.relativeTolerance,
+                                 atol=self.absoluteTolerance,
+                                 **stepOptions)
+            tickList.append(solution.t)
+            uList.append(np.reshape(solution.y, (len(uStart), -1)))
+            # The segments join at the impacts, where the velocities jump
+            if solution.sol is not None:
+                denseTickList += list(solution.sol.ts[1:])
+                denseInterpolantList += solution.sol.interpolants
+            numFuncEvals += solution.nfev
+            numJacEvals += solution.njev
+            numLUDecomps += solution.nlu
+            if solution.status != 1:
+                break
+            # Apply the impulse of all the contacts which hit the ground at this instant
+            hitList = [contactIndex for contactIndex in range(self.numContacts)
+                       if len(solution.t_events[contactIndex]) > 0]
+            startTick = solution.t_events[hitList[0]][0]
+            uStart = self.impactF(hitList, startTick, solution.y_events[hitList[0]][0])
+            self.restPenetratingContactsF(uStart)
+            if Debug:
+                DT.Mess("Impact at " + str(startTick))
+
+        return OptimizeResult(t=np.concatenate(tickList),
+                              y=np.concatenate(uList, axis=1),
+                              sol=self.makeDenseSolutionF(denseTickList, denseInterpolantList),
+                              nfev=numFuncEvals,
+                              njev=numJacEvals,
+                              nlu=numLUDecomps,
+                              status=solution.status,
+                              message=solution.message,
+                              success=solution.success)
+    #  -------------------------------------------------------------------------
+    def makeDenseSolutionF(self, tickList, interpolantList):
+        """The OdeSolution of the step interpolants, or None if there are none to keep"""
+        if not self.denseOutput or len(interpolantList) == 0:
+            return None
+        return OdeSolution(np.array(tickList), interpolantList)
+    #  -------------------------------------------------------------------------
+    def makeHermiteSolutionF(self, tickList, uList, uDotList):
+        """The OdeSolution of cubic Hermite interpolants between the states
+        and their derivatives at the ends of the steps"""
+        if not self.denseOutput or len(tickList) < 2:
+            return None
+        interpolantList = [HermiteDenseOutputC(tickList[index], tickList[index+1],
+                                               uList[index], uList[index+1],
+                                               uDotList[index], uDotList[index+1])
+                           for index in range(len(tickList) - 1)]
+        return OdeSolution(np.array(tickList), interpolantList)
+    #  -------------------------------------------------------------------------
+    def contactGapF(self, contactIndex, uArray):
+        """Height of a contact point above the ground, worked out directly from uArray
+        [contacts which have come to rest are left to the penalty force]"""
+        if self.contactRestingNp[contactIndex]:
+            return 1.0
+        bodyIndex = self.contactBodyNp[contactIndex]
+        pointLocal = self.pointLocalNp[bodyIndex, self.contactPointNp[contactIndex]]
+        phi = uArray[(bodyIndex-1)*3+2]
+        return uArray[(bodyIndex-1)*3+1] + math.sin(phi) * pointLocal[0] + math.cos(phi) * pointLocal[1]
+    #  -------------------------------------------------------------------------
+    def impactF(self, hitList, tick, uArray):
+        """Return uArray with the velocities after the impact of contact points with the ground.
+        The contacts in hitList, and any others approaching within CONTACT_GAP_TOLERANCE of the
+        ground, are given their impulses P along the normal together with the joint impulses, from
+        [ M  -J^T  -C^T ] [ velocities+ ]   [ M velocities-           ]
+        [ J   0     0   ] [ Lambda      ] = [ nu                      ]
+        [ C   0     0   ] [ P           ]   [ -e C velocities-        ]
+        where the rows of C pick the normal velocities of the contact points out of the velocities.
+        A contact which would need P < 0 [pulling on the ground] is left out, and put back again
+        if the others then leave it approaching the ground"""
+        if Debug:
+            DT.Mess("DapMainMod-impactF")
+        uAfter = np.array(uArray, dtype=np.float64)
+        velocities = uAfter[self.numMovBodiesx3:]
+        velocitiesBefore = velocities.copy()
+        self.unpackStateF(uAfter)
+        contactRowsNp = np.zeros((self.numContacts, self.numMovBodiesx3,), dtype=np.float64)
+        contactRange = np.arange(self.numContacts)
+        contactRowsNp[contactRange, (self.contactBodyNp-1)*3+1] = 1.0
+        contactRowsNp[contactRange, (self.contactBodyNp-1)*3+2] = self.pointVectorNp[self.contactBodyNp, self.contactPointNp, 0]
+        approachSpeedNp = -contactRowsNp @ velocities
+        gapNp = np.array([self.contactGapF(contactIndex, uAfter) for contactIndex in range(self.numContacts)])
+        hittingNp = (gapNp <= CONTACT_GAP_TOLERANCE) & (approachSpeedNp > 0.0)
+        hittingNp[hitList] = True
+        # Bouncing ever lower would need ever more events, so slow impacts end in resting contact
+        slowNp = hittingNp & (approachSpeedNp < self.restingContactSpeed)
+        restitutionNp = np.where(slowNp, 0.0, self.contactRestitutionNp)
+
+        numBodPlusConstr = self.numMovBodiesx3 + self.numConstraints
+        if self.numConstraints > 0:
+            Jacobian = self.getJacobianF()
+            nu = self.RHSVel(tick)
+        activeNp = hittingNp.copy()
+        for iteration in range(2 * self.numContacts + 1):
+            activeRowsNp = contactRowsNp[activeNp]
+            numActive = len(activeRowsNp)
+            impactMatrix = np.zeros((numBodPlusConstr + numActive, numBodPlusConstr + numActive,), dtype=np.float64)
+            np.einsum('ii->i', impactMatrix)[0: self.numMovBodiesx3] = self.massArrayNp
+            impactMatrix[0: self.numMovBodiesx3, numBodPlusConstr:] = -activeRowsNp.T
+            impactMatrix[numBodPlusConstr:, 0: self.numMovBodiesx3] = activeRowsNp
+            rhs = np.zeros((numBodPlusConstr + numActive,), dtype=np.float64)
+            rhs[0: self.numMovBodiesx3] = self.massArrayNp * velocitiesBefore
+            rhs[numBodPlusConstr:] = restitutionNp[activeNp] * approachSpeedNp[activeNp]
+            if self.numConstraints > 0:
+                impactMatrix[self.numMovBodiesx3: numBodPlusConstr, 0: self.numMovBodiesx3] = Jacobian
+                impactMatrix[0: self.numMovBodiesx3, self.numMovBodiesx3: numBodPlusConstr] = -Jacobian.T
+                rhs[self.numMovBodiesx3: numBodPlusConstr] = nu
+            try:
+                impulseNp = np.linalg.solve(impactMatrix, rhs)
+            except np.linalg.LinAlgError:
+                # More contacts than the bodies can tell apart, like three points of a body landing flat
+                impulseNp = np.linalg.lstsq(impactMatrix, rhs, rcond=None)[0]
+            velocities[:] = impulseNp[0: self.numMovBodiesx3]
+            pullingNp = impulseNp[numBodPlusConstr:] < 0.0
+            if pullingNp.any():
+                activeNp[np.flatnonzero(activeNp)[pullingNp]] = False
+                continue
+            approachingNp = hittingNp & ~activeNp & (contactRowsNp @ velocities < 0.0)
+            if not approachingNp.any():
+                break
+            activeNp |= approachingNp
+        self.contactRestingNp |= slowNp & activeNp
+        return uAfter
+    #  -------------------------------------------------------------------------
+    def restPenetratingContactsF(self, uArray):
+        """Hand the contact points which are already below the ground over to the penalty force,
+        as their impact events, looking for them coming down through it, can never fire"""
+        if Debug:
+            DT.Mess("DapMainMod-restPenetratingContactsF")
+        for contactIndex in range(self.numContacts):
+            if self.contactGapF(contactIndex, uArray) < -CONTACT_GAP_TOLERANCE:
+                self.contactRestingNp[contactIndex] = True
+    #  -------------------------------------------------------------------------
+    def choosePartitionF(self):
+        """Split the coordinates into dependent and independent sets at partitionUNp.
+        LU factorisation of J^T with row pivoting picks the numConstraints
+        columns of J which are best conditioned as the dependent coordinates"""
+        if Debug:
+            DT.Mess("DapMainMod-choosePartitionF")
+        self.unpackStateF(self.partitionUNp)
+        Jacobian = self.getJacobianF()
+        pivots, lower, upper = lu(Jacobian.T, p_indices=True)
+        pivotOrder = np.argsort(pivots)
+        self.dependentNp = np.sort(pivotOrder[0: self.numConstraints])
+        self.independentNp = np.sort(pivotOrder[self.numConstraints:])
+        # Positions in uArray of the independent coordinates and velocities
+        self.partitionStateNp = np.concatenate((self.independentNp, self.numMovBodiesx3 + self.independentNp))
+        self.partitionCondition = np.linalg.cond(Jacobian[:, self.dependentNp])
+        self.partitionFactor = lu_factor(Jacobian[:, self.dependentNp], check_finite=False)
+        if Debug:
+            DT.Mess("Independent coordinates: " + str(self.independentNp))
+    #  -------------------------------------------------------------------------
+    def dependentStateF(self, tick, yArray):
+        """Return the full uArray for the independent coordinates and velocities in yArray:
+        Newton iteration of Phi = 0 for the dependent coordinates, starting from their last values,
+        then the dependent velocities from  J_dep velocities_dep = nu - J_ind velocities_ind"""
+        uArray = self.partitionUNp
+        numIndependent = len(self.independentNp)
+        uArray[self.partitionStateNp] = yArray
+        positions = uArray[0: self.numMovBodiesx3]
+        velocities = uArray[self.numMovBodiesx3:]
+        self.unpackStateF(uArray)
+        # The dependent Jacobian columns factorised last time are usually good enough for the Newton
+        # iteration, otherwise factorise them again when they stop at least halving the error
+        previousError = np.inf
+        for n in range(20):
+            constraintError = self.Constraints(tick)
+            error = np.abs(constraintError).max()
+            if error < self.absoluteTolerance:
+                break
+            if error > 0.5 * previousError:
+                self.partitionFactor = lu_factor(self.getJacobianF()[:, self.dependentNp], check_finite=False)
+            previousError = error
+            positions[self.dependentNp] -= lu_solve(self.partitionFactor, constraintError, check_finite=False)
+            self.unpackStateF(uArray)
+        Jacobian = self.getJacobianF()
+        self.partitionFactor = lu_factor(Jacobian[:, self.dependentNp], check_finite=False)
+        velocities[self.dependentNp] = lu_solve(self.partitionFactor,
+                                                self.RHSVel(tick) -
+                                                Jacobian[:, self.independentNp] @ yArray[numIndependent:],
+                                                check_finite=False)
+        return uArray.copy()
+    #  -------------------------------------------------------------------------
+    def partitionedAnalysisF(self, tick, yArray):
+        """The r-h-s of the equations in the independent coordinates only"""
+        uDot = self.Analysis(tick, self.dependentStateF(tick, yArray))
+        return uDot[self.partitionStateNp]
+    #  -------------------------------------------------------------------------
+    def augmentedSolveF(self, Jacobian, rhsAccel):
+        """Solve the full augmented system for the accelerations and Lambda
+        [ M  -J^T ] [ accel  ]   [ F     ]
+        [ J   0   ] [ Lambda ] = [ gamma ]"""
+        if Debug:
+            DT.Mess("DapMainMod-augmentedSolveF")
+        # Combine Force Array and rhs of Acceleration Constraints into one array
+        rhs = self.augmentedRhsNp
+        rhs[0: self.numMovBodiesx3] = self.forceArrayNp
+        rhs[self.numMovBodiesx3:] = rhsAccel
+        if Debug:
+            DT.Mess("rhs")
+            DT.Np1D(True, rhs)
+
+        # Create the Jacobian-Mass-Jacobian matrix
+        # [ diagonal masses ---- Jacobian transpose ]
+        # [    |                        |           ]
+        # [  Jacobian      ------     Zeros         ]
+        if self.sparseJacobian:
+            JacMasJac = sparse.bmat([[self.massDiagSparse, -Jacobian.T],
+                                     [Jacobian, None]], format="csc")
+            # Solve the sparse JacMasJac augmented with the rhs
+            solvedVector = spsolve(JacMasJac, rhs)
+        else:
+            # The LU factorisation is done in place, so all four blocks are rewritten every time
+            JacMasJac = self.augmentedMatrixNp
+            JacMasJac[0: self.numMovBodiesx3, 0: self.numMovBodiesx3] = 0.0
+            self.augmentedDiagonalNp[0: self.numMovBodiesx3] = self.massArrayNp
+            JacMasJac[self.numMovBodiesx3:, 0: self.numMovBodiesx3] = Jacobian
+            np.negative(Jacobian.T, out=JacMasJac[0: self.numMovBodiesx3, self.numMovBodiesx3:])
+            JacMasJac[self.numMovBodiesx3:, self.numMovBodiesx3:] = 0.0
+            if Debug:
+                DT.Mess("Jacobian-MassDiagonal-JacobianT Array")
+                DT.Np2D(JacMasJac)
+            # Solve the JacMasJac augmented with the rhs
+            solvedVector = lu_solve(lu_factor(JacMasJac, overwrite_a=True, check_finite=False),
+                                    rhs, overwrite_b=True, check_finite=False)
+
+        # First half of solution are the acceleration values, second half is Lambda
+        return solvedVector[: self.numMovBodiesx3], solvedVector[self.numMovBodiesx3:]
+    #  -------------------------------------------------------------------------
+    def schurSolveF(self, Jacobian, rhsAccel):
+        """Solve for the accelerations and Lambda via the Schur complement
+        (J M^-1 J^T) Lambda = gamma - J M^-1 F
+        accel = M^-1 (F + J^T Lambda)
+        M is diagonal so M^-1 is free, and J M^-1 J^T is only
+        numConstraints square and symmetric positive definite"""
+        if Debug:
+            DT.Mess("DapMainMod-schurSolveF")
+        if self.sparseJacobian:
+            JacMassInv = Jacobian @ sparse.diags(self.massInvArrayNp, format="csr")
+            schurMatrix = (JacMassInv @ Jacobian.T).tocsc()
+            rhsLambda = rhsAccel - JacMassInv @ self.forceArrayNp
+            # scipy has no sparse Cholesky, so factorise with a sparse LU
+            Lambda = splu(schurMatrix).solve(rhsLambda)
+            accel = Jacobian.T @ Lambda
+        else:
+            JacMassInv = np.multiply(Jacobian, self.massInvArrayNp, out=self.jacMassInvNp)
+            schurMatrix = np.matmul(JacMassInv, Jacobian.T, out=self.schurMatrixNp)
+            rhsLambda = np.matmul(JacMassInv, self.forceArrayNp, out=self.rhsLambdaNp)
+            np.subtract(rhsAccel, rhsLambda, out=rhsLambda)
+            if Debug:
+                DT.Mess("Schur complement J M^-1 J^T")
+                DT.Np2D(schurMatrix)
+            # The Schur complement is symmetric, so its transpose is a Fortran ordered
+            # view of the same matrix, which LAPACK can factorise in place
+            Lambda = cho_solve(cho_factor(schurMatrix.T, overwrite_a=True, check_finite=False),
+                               rhsLambda, overwrite_b=True, check_finite=False)
+            accel = np.matmul(Jacobian.T, Lambda, out=self.accelNp)
+
+        accel += self.forceArrayNp
+        accel *= self.massInvArrayNp
+        return accel, Lambda
+    #  -------------------------------------------------------------------------
     def Analysis(self, tick, uArray):
         """The Analysis function which takes a
         uArray consisting of a world 3vector and a velocity 3vector"""
@@ -639,73 +1720,39 @@ class DapMainC:
             DT.Mess("Input to 'Analysis'")
             DT.Np1D(True, uArray)
 
-        # Unpack uArray into world coordinate and world velocity sub-arrays
-        index1 = 0
-        index2 = self.numMovBodiesx3
-        for bodyIndex in range(1, self.numBodies):
-            self.worldNp[bodyIndex, 0] = uArray[index1]
-            self.worldNp[bodyIndex, 1] = uArray[index1+1]
-            self.phiNp[bodyIndex] = uArray[index1+2]
-            self.worldDotNp[bodyIndex, 0] = uArray[index2]
-            self.worldDotNp[bodyIndex, 1] = uArray[index2+1]
-            self.phiDotNp[bodyIndex] = uArray[index2+2]
-            index1 += 3
-            index2 += 3
-        if Debug:
-            DT.Np2D(self.worldNp)
-            DT.Np1Ddeg(True, self.phiNp)
-            DT.Np2D(self.worldDotNp)
-            DT.Np1Ddeg(True, self.phiDotNp)
-
-        # Update the point stuff accordingly
-        self.updatePointPositions()
-        self.updatePointVelocities()
+        # Unpack uArray and update the point stuff accordingly
+        self.unpackStateF(uArray)
 
         # array of applied forces
         self.makeForceArray()
         # find the accelerations ( a = F / m )
-        accel = []
         if self.numConstraints == 0:
-            for index in range(self.numMovBodiesx3):
-                accel.append = self.massInvArray[index] * self.forceArrayNp[index]
+            accel = np.multiply(self.massInvArrayNp, self.forceArrayNp, out=self.accelNp)
         # We go through this if we have any constraints
         else:
-            Jacobian = self.getJacobianF()
+            if self.sparseJacobian:
+                Jacobian = self.getSparseJacobianF()
+            else:
+                Jacobian = self.getJacobianF()
             if Debug:
                 DT.Mess("Jacobian")
-                DT.Np2D(Jacobian)
-
-            # Create the Jacobian-Mass-Jacobian matrix
-            # [ diagonal masses ---- Jacobian transpose ]
-            # [    |                        |           ]
-            # [  Jacobian      ------     Zeros         ]
-            numBodPlusConstr = self.numMovBodiesx3 + self.numConstraints
-            JacMasJac = np.zeros((numBodPlusConstr, numBodPlusConstr), dtype=np.float64)
-            JacMasJac[0: self.numMovBodiesx3, 0: self.numMovBodiesx3] = np.diag(self.massArrayNp)
-            JacMasJac[self.numMovBodiesx3:, 0: self.numMovBodiesx3] = Jacobian
-            JacMasJac[0: self.numMovBodiesx3, self.numMovBodiesx3:] = -Jacobian.T
-            if Debug:
-                DT.Mess("Jacobian-MassDiagonal-JacobianT Array")
-                DT.Np2D(JacMasJac)
+                if self.sparseJacobian:
+                    DT.Np2D(Jacobian.toarray())
+                else:
+                    DT.Np2D(Jacobian)
 
             # get r-h-s of acceleration constraints at this time
-            rhsAccel = self.RHSAcc(tick)
+            rhsAccel = self.stabilisedRHSAccF(tick)
             if Debug:
                 DT.Mess("rhsAccel")
                 DT.Np1D(True, rhsAccel)
-            # Combine Force Array and rhs of Acceleration Constraints into one array
-            rhs = np.zeros((numBodPlusConstr,), dtype=np.float64)
-            rhs[0: self.numMovBodiesx3] = self.forceArrayNp
-            rhs[self.numMovBodiesx3:] = rhsAccel
-            if Debug:
-                DT.Mess("rhs")
-                DT.Np1D(True, rhs)
-            # Solve the JacMasJac augmented with the rhs
-            solvedVector = np.linalg.solve(JacMasJac, rhs)
-            # First half of solution are the acceleration values
-            accel = solvedVector[: self.numMovBodiesx3]
-            # Second half is Lambda which is reported in the output results routine
-            self.Lambda = solvedVector[self.numMovBodiesx3:]
+
+            # Solve for the accelerations and the Lagrange multipliers
+            # Lambda is reported in the output results routine
+            if self.accelerationSolver == 1:
+                accel, self.Lambda = self.schurSolveF(Jacobian, rhsAccel)
+            else:
+                accel, self.Lambda = self.augmentedSolveF(Jacobian, rhsAccel)
             if Debug:
                 DT.MessNoLF("Accelerations: ")
                 DT.Np1D(True, accel)
@@ -713,25 +1760,205 @@ class DapMainC:
                 DT.Np1D(True, self.Lambda)
 
         # Transfer the accelerations back into the worldDotDot/phiDotDot and uDot/uDotDot Arrays
-        for bodyIndex in range(1, self.numBodies):
-            accelIndex = (bodyIndex-1)*3
-            self.worldDotDotNp[bodyIndex] = accel[accelIndex], accel[accelIndex+1]
-            self.phiDotDotNp[bodyIndex] = accel[accelIndex+2]
-        uDotArray = np.zeros((self.numMovBodies * 6), dtype=np.float64)
-        index1 = 0
-        index2 = self.numMovBodiesx3
-        for bodyIndex in range(1, self.numBodies):
-            uDotArray[index1:index1+2] = self.worldDotNp[bodyIndex]
-            uDotArray[index1+2] = self.phiDotNp[bodyIndex]
-            uDotArray[index2:index2+2] = self.worldDotDotNp[bodyIndex]
-            uDotArray[index2+2] = self.phiDotDotNp[bodyIndex]
-            index1 += 3
-            index2 += 3
+        accel = accel.reshape(self.numMovBodies, 3)
+        self.worldDotDotNp[1:] = accel[:, 0:2]
+        self.phiDotDotNp[1:] = accel[:, 2]
+        self.uDotPositionNp[:, 0:2] = self.worldDotNp[1:]
+        self.uDotPositionNp[:, 2] = self.phiDotNp[1:]
+        self.uDotVelocityNp[:, 0:2] = self.worldDotDotNp[1:]
+        self.uDotVelocityNp[:, 2] = self.phiDotDotNp[1:]
 
         # Increment number of function evaluations
         self.Counter += 1
 
-        return uDotArray
+        # solve_ivp hangs on to the arrays we return (e.g. as the first stage of the next step)
+        # so hand it a copy rather than the workspace buffer which we overwrite next time
+        return self.uDotArrayNp.copy()
+    #  -------------------------------------------------------------------------
+    def unpackStateF(self, uArray):
+        """Unpack uArray into the world coordinate and world velocity sub-arrays
+        and update the point positions and velocities accordingly"""
+        self.uArrayNp[:] = uArray
+        self.worldNp[1:] = self.uPositionNp[:, 0:2]
+        self.phiNp[1:] = self.uPositionNp[:, 2]
+        self.worldDotNp[1:] = self.uVelocityNp[:, 0:2]
+        self.phiDotNp[1:] = self.uVelocityNp[:, 2]
+        if Debug:
+            DT.Np2D(self.worldNp)
+            DT.Np1Ddeg(True, self.phiNp)
+            DT.Np2D(self.worldDotNp)
+            DT.Np1Ddeg(True, self.phiDotNp)
+
+        self.updatePointPositions()
+        self.updatePointVelocities()
+    #  -------------------------------------------------------------------------
+    def makeStateJacobianPattern(self):
+        """Work out, from the body coupling graph, which bodies' accelerations depend on which
+        bodies' coordinates and velocities (jac_sparsity for the implicit integrators), and
+        colour the bodies so that stateJacobianF can perturb all the bodies of one colour at once"""
+        if Debug:
+            DT.Mess("DapMainMod-makeStateJacobianPattern")
+        # Two moving bodies are coupled if a joint or a (non-gravity) force connects them
+        neighbourList = [set() for bodyIndex in range(self.numBodies)]
+        couplingList = [(jointObj.bodyHEADindex, jointObj.bodyTAILindex) for jointObj in self.jointObjList]
+        couplingList += [(forceObj.bodyHEADindex, forceObj.bodyTAILindex) for forceObj in self.forceObjList
+                         if forceObj.actuatorType != 0]
+        for bodyHEAD, bodyTAIL in couplingList:
+            if bodyHEAD != 0 and bodyTAIL != 0 and bodyHEAD != bodyTAIL:
+                neighbourList[bodyHEAD].add(bodyTAIL)
+                neighbourList[bodyTAIL].add(bodyHEAD)
+
+        # The Lagrange multipliers couple every body in a connected mechanism,
+        # but ground does not pass the coupling on (it cannot move)
+        componentNp = np.full((self.numBodies,), -1, dtype=np.int64)
+        for bodyIndex in range(1, self.numBodies):
+            if componentNp[bodyIndex] < 0:
+                componentNp[bodyIndex] = bodyIndex
+                stack = [bodyIndex]
+                while stack:
+                    for neighbour in neighbourList[stack.pop()]:
+                        if componentNp[neighbour] < 0:
+                            componentNp[neighbour] = bodyIndex
+                            stack.append(neighbour)
+        coupled = sparse.csr_matrix(componentNp[1:, np.newaxis] == componentNp[np.newaxis, 1:], dtype=np.float64)
+        coupled = sparse.kron(coupled, np.ones((3, 3,)), format="csr")
+        # d(positions)/d(velocities) is the identity and d(accelerations)/du follows the coupling
+        self.stateJacobianSparsity = sparse.bmat([[None, sparse.identity(self.numMovBodiesx3)],
+                                                  [coupled, coupled]], format="csc")
+
+        # Distance-2 colouring: no two bodies of the same colour are coupled or share a
+        # coupled neighbour, so every force row, constraint row and Jacobian entry
+        # changed by perturbing a colour can be put down to exactly one of its bodies
+        colourNp = np.full((self.numBodies,), -1, dtype=np.int64)
+        for bodyIndex in range(1, self.numBodies):
+            taken = set()
+            for neighbour in neighbourList[bodyIndex]:
+                taken.add(colourNp[neighbour])
+                for neighbour2 in neighbourList[neighbour]:
+                    taken.add(colourNp[neighbour2])
+            colour = 0
+            while colour in taken:
+                colour += 1
+            colourNp[bodyIndex] = colour
+        self.numColours = int(colourNp[1:].max()) + 1 if self.numMovBodies > 0 else 0
+
+        # For each colour: the moving bodies [0 based] in it, and which of them
+        # owns each force row and constraint row that perturbing the colour changes
+        self.colourBodiesList = []
+        self.colourForceRowsList = []
+        self.colourForceOwnerList = []
+        self.colourConstraintRowsList = []
+        self.colourConstraintOwnerList = []
+        for colour in range(self.numColours):
+            self.colourBodiesList.append(np.flatnonzero(colourNp[1:] == colour))
+            forceRows = []
+            forceOwners = []
+            for bodyIndex in range(1, self.numBodies):
+                for owner in [bodyIndex] + list(neighbourList[bodyIndex]):
+                    if colourNp[owner] == colour:
+                        forceRows += range((bodyIndex-1) * 3, bodyIndex * 3)
+                        forceOwners += [owner-1] * 3
+                        break
+            self.colourForceRowsList.append(np.array(forceRows, dtype=np.int64))
+            self.colourForceOwnerList.append(np.array(forceOwners, dtype=np.int64))
+            constraintRows = []
+            constraintOwners = []
+            for jointObj in self.jointObjList:
+                for owner in (jointObj.bodyHEADindex, jointObj.bodyTAILindex):
+                    if owner != 0 and colourNp[owner] == colour:
+                        constraintRows += range(jointObj.rowStart, jointObj.rowEnd)
+                        constraintOwners += [owner-1] * jointObj.mConstraints
+                        break
+            self.colourConstraintRowsList.append(np.array(constraintRows, dtype=np.int64))
+            self.colourConstraintOwnerList.append(np.array(constraintOwners, dtype=np.int64))
+    #  -------------------------------------------------------------------------
+    def stateJacobianF(self, tick, uArray):
+        """The Jacobian of Analysis with respect to uArray for the implicit integrators
+        [   0         I      ]
+        [ d(accel)/d(pos)  d(accel)/d(vel) ]
+        Differentiating  M accel - J^T Lambda = F  and  J accel = gamma  gives
+        [ M  -J^T ] [ d(accel)  ]   [ dF + dJ^T Lambda ]
+        [ J   0   ] [ d(Lambda) ] = [ dgamma - dJ accel ]
+        so one factorisation gives every column.  dF, dJ and dgamma come from
+        differencing the force, Jacobian and gamma kernels one colour of bodies at a time"""
+        if Debug:
+            DT.Mess("DapMainMod-stateJacobianF")
+        numBodPlusConstr = self.numMovBodiesx3 + self.numConstraints
+        numStates = self.numMovBodies * 6
+        uArray = np.asarray(uArray, dtype=np.float64)
+
+        # Evaluate the accelerations and Lambda at uArray, and keep the kernel values there
+        self.Analysis(tick, uArray)
+        accel = self.uDotArrayNp[self.numMovBodiesx3:].copy()
+        forceBase = self.forceArrayNp.copy()
+        if self.numConstraints > 0:
+            Lambda = self.Lambda.copy()
+            jacobianDataBase = self.jacobianDataNp.copy()
+            rhsAccBase = self.rhsAccNp.copy()
+            # Factorise the augmented matrix at uArray
+            if self.sparseJacobian:
+                Jacobian = self.jacobianCSR
+                factorised = splu(sparse.bmat([[self.massDiagSparse, -Jacobian.T],
+                                               [Jacobian, None]], format="csc")).solve
+            else:
+                Jacobian = self.jacobianDenseNp
+                JacMasJac = np.zeros((numBodPlusConstr, numBodPlusConstr,), dtype=np.float64, order='F')
+                np.einsum('ii->i', JacMasJac)[0: self.numMovBodiesx3] = self.massArrayNp
+                JacMasJac[self.numMovBodiesx3:, 0: self.numMovBodiesx3] = Jacobian
+                JacMasJac[0: self.numMovBodiesx3, self.numMovBodiesx3:] = -Jacobian.T
+                luAndPiv = lu_factor(JacMasJac, overwrite_a=True, check_finite=False)
+                factorised = lambda rhs: lu_solve(luAndPiv, rhs, overwrite_b=True, check_finite=False)
+
+        # Finite difference steps, and the column of each moving body's coordinate
+        stepNp = np.sqrt(np.finfo(np.float64).eps) * np.maximum(1.0, np.abs(uArray))
+        rhsColumns = np.zeros((numBodPlusConstr, numStates,), dtype=np.float64)
+        uPerturbed = uArray.copy()
+        for colour in range(self.numColours):
+            bodies = self.colourBodiesList[colour]
+            forceRows = self.colourForceRowsList[colour]
+            forceOwners = self.colourForceOwnerList[colour]
+            constraintRows = self.colourConstraintRowsList[colour]
+            constraintOwners = self.colourConstraintOwnerList[colour]
+            for coordinate in range(6):
+                # Positions are the first half of uArray and velocities the second
+                offset = coordinate if coordinate < 3 else self.numMovBodiesx3 + coordinate - 3
+                perturbed = bodies * 3 + offset
+                uPerturbed[perturbed] += stepNp[perturbed]
+                self.unpackStateF(uPerturbed)
+                self.makeForceArray()
+                rhsTop = self.forceArrayNp - forceBase
+                if self.numConstraints > 0:
+                    # The Jacobian only depends on the positions
+                    if coordinate < 3:
+                        self.fillJacobianDataF()
+                    else:
+                        self.jacobianDataNp[:] = jacobianDataBase
+                    rhsBottom = self.stabilisedRHSAccF(tick) - rhsAccBase
+                    if coordinate < 3:
+                        jacobianDelta = self.jacobianDataNp - jacobianDataBase
+                        np.add.at(rhsTop, self.jacobianColumnsNp, jacobianDelta * Lambda[self.jacobianRowsNp])
+                        np.subtract.at(rhsBottom, self.jacobianRowsNp, jacobianDelta * accel[self.jacobianColumnsNp])
+                    columns = constraintOwners * 3 + offset
+                    rhsColumns[self.numMovBodiesx3 + constraintRows, columns] = \
+                        rhsBottom[constraintRows] / stepNp[columns]
+                columns = forceOwners * 3 + offset
+                rhsColumns[forceRows, columns] = rhsTop[forceRows] / stepNp[columns]
+                uPerturbed[perturbed] = uArray[perturbed]
+
+        # Solve for all the columns of d(accel)/du together
+        if self.numConstraints > 0:
+            accelDerivative = factorised(rhsColumns)[0: self.numMovBodiesx3]
+        else:
+            accelDerivative = rhsColumns * self.massInvArrayNp[:, np.newaxis]
+
+        stateJacobian = np.zeros((numStates, numStates,), dtype=np.float64)
+        np.einsum('ii->i', stateJacobian[0: self.numMovBodiesx3, self.numMovBodiesx3:])[:] = 1.0
+        stateJacobian[self.numMovBodiesx3:] = accelDerivative
+        # Leave the workspace consistent with uArray
+        self.unpackStateF(uArray)
+        if self.sparseStateJacobian:
+            return sparse.csc_matrix(self.stateJacobianSparsity.multiply(stateJacobian))
+        return stateJacobian
     #  -------------------------------------------------------------------------
     def correctInitialConditions(self):
         """This function corrects the supplied initial conditions by making
@@ -783,18 +2010,27 @@ class DapMainC:
         return False
     #  -------------------------------------------------------------------------
     def updatePointPositions(self):
-        for bodyIndex in range(1, self.numBodies):
-            # Compute the Rotation Matrix
-            self.RotMatPhiNp[bodyIndex] = DT.RotationMatrixNp(self.phiNp[bodyIndex])
-
-            if Debug:
-                DT.Mess("Local                   Vector                  Rotated                 World")
-            for pointIndex in range(self.numPointsInDict[bodyIndex]):
-                pointVector = self.RotMatPhiNp[bodyIndex] @ self.pointLocalNp[bodyIndex, pointIndex]
-                self.pointVectorNp[bodyIndex, pointIndex] = pointVector
-                self.pointWorldNp[bodyIndex, pointIndex] =  self.worldNp[bodyIndex] + pointVector
-                self.pointVectorRotNp[bodyIndex][pointIndex] = self.Rot90NumpyF(pointVector)
-                if Debug:
+        """Update the rotation matrices, point vectors and world coordinates of
+        every point on every moving body with a few operations over the whole NumPy arrays"""
+        # Compute the Rotation Matrices of all the moving bodies at once
+        # [ cos(phi)  -sin(phi) ]
+        # [ sin(phi)   cos(phi) ]
+        np.cos(self.phiNp[1:], out=self.RotMatPhiNp[1:, 0, 0])
+        np.sin(self.phiNp[1:], out=self.RotMatPhiNp[1:, 1, 0])
+        np.negative(self.RotMatPhiNp[1:, 1, 0], out=self.RotMatPhiNp[1:, 0, 1])
+        self.RotMatPhiNp[1:, 1, 1] = self.RotMatPhiNp[1:, 0, 0]
+
+        # Point Vector - Rotation Matrix @ Point Local, for every point in every moving body
+        np.einsum('bij,bpj->bpi', self.RotMatPhiNp[1:], self.pointLocalNp[1:], out=self.pointVectorNp[1:])
+        # Point World - body world coordinates plus the Point Vector
+        np.add(self.worldNp[1:, np.newaxis, :], self.pointVectorNp[1:], out=self.pointWorldNp[1:])
+        # Point Vector rotated by 90 degrees  i.e. [-y, x]
+        np.negative(self.pointVectorNp[1:, :, 1], out=self.pointVectorRotNp[1:, :, 0])
+        self.pointVectorRotNp[1:, :, 1] = self.pointVectorNp[1:, :, 0]
+        if Debug:
+            DT.Mess("Local                   Vector                  Rotated                 World")
+            for bodyIndex in range(1, self.numBodies):
+                for pointIndex in range(self.numPointsInDict[bodyIndex]):
                     DT.Np1D(False, self.pointLocalNp[bodyIndex][pointIndex])
                     DT.MessNoLF("   ")
                     DT.Np1D(False, self.pointVectorNp[bodyIndex][pointIndex])
@@ -802,13 +2038,17 @@ class DapMainC:
                     DT.Np1D(False, self.pointVectorRotNp[bodyIndex][pointIndex])
                     DT.MessNoLF("   ")
                     DT.Np1D(True, self.pointWorldNp[bodyIndex][pointIndex])
-                    
-        for forceIndex in range(self.numForces):
-            forceObj = self.forceObjList[forceIndex]
-            if forceObj.bodyHEADindex != 0:
-                unitVector = self.RotMatPhiNp[forceObj.bodyHEADindex] @ self.forceUnitLocalNp[forceIndex]
-                self.forceUnitWorldNp[forceIndex] = unitVector
-                self.forceUnitWorldRotNp[forceIndex] = self.Rot90NumpyF(unitVector)
+
+        # Rotate the unit vectors of all the forces attached to a moving body
+        if len(self.forceRotatingNp) > 0:
+            np.take(self.RotMatPhiNp, self.forceRotatingBodyNp, axis=0, out=self.forceRotMatNp)
+            unitVectors = np.einsum('fij,fj->fi', self.forceRotMatNp, self.forceUnitLocalRotatingNp,
+                                    out=self.forceUnitRotatingNp)
+            unitVectorsRot = self.forceUnitRotatingRotNp
+            np.negative(unitVectors[:, 1], out=unitVectorsRot[:, 0])
+            unitVectorsRot[:, 1] = unitVectors[:, 0]
+            self.forceUnitWorldNp[self.forceRotatingNp] = unitVectors
+            self.forceUnitWorldRotNp[self.forceRotatingNp] = unitVectorsRot
         if Debug:
             DT.MessNoLF("Unit Force Vector: ")
             DT.Np2D(self.forceUnitLocalNp)
@@ -818,63 +2058,195 @@ class DapMainC:
             DT.Np2D(self.forceUnitWorldRotNp)
     #  -------------------------------------------------------------------------
     def updatePointVelocities(self):
+        """Update the velocities of every point on every moving body
+        with a few operations over the whole NumPy arrays"""
         if Debug:
             DT.Mess("DapMainMod-updatePointVelocities")
-        for bodyIndex in range(1, self.numBodies):
-            for pointIndex in range(self.numPointsInDict[bodyIndex]):
-                velVector = self.pointVectorRotNp[bodyIndex, pointIndex] * self.phiDotNp[bodyIndex]
-                self.pointVectorDotNp[bodyIndex, pointIndex] = velVector
-                self.pointWorldDotNp[bodyIndex, pointIndex] = self.worldDotNp[bodyIndex] + velVector
-        for forceObj in self.forceObjList:
-            if forceObj.actuatorType != 0:
-                if forceObj.bodyHEADindex != 0:
-                    forceObj.unitWorldDot = self.Rot90NumpyF(forceObj.unitWorld) * self.phiDotNp[forceObj.bodyHEADindex]
+        # Point Vector Dot - Point Vector rotated by 90 degrees times phiDot
+        np.multiply(self.pointVectorRotNp[1:], self.phiDotNp[1:, np.newaxis, np.newaxis], out=self.pointVectorDotNp[1:])
+        # Point World Dot - body world velocity plus the Point Vector Dot
+        np.add(self.worldDotNp[1:, np.newaxis, :], self.pointVectorDotNp[1:], out=self.pointWorldDotNp[1:])
+        # Unit vector velocities of all the forces attached to a moving body
+        if len(self.forceRotatingNp) > 0:
+            np.take(self.phiDotNp, self.forceRotatingBodyNp, out=self.forcePhiDotNp)
+            np.multiply(self.forceUnitRotatingRotNp, self.forcePhiDotNp[:, np.newaxis], out=self.forceUnitRotatingDotNp)
+            self.forceUnitWorldDotNp[self.forceRotatingNp] = self.forceUnitRotatingDotNp
+    #  =============================================================================
+    def compileJoints(self):
+        """Sort the joints into groups of the same type and number of constraints
+        so that one batched kernel evaluates all the joints in a group in one go"""
+        if Debug:
+            DT.Mess("DapMainMod-compileJoints")
+        groupDict = {}
+        self.unbatchedJointIndexList = []
+        for jointIndex in range(self.numJoints):
+            jointObj = self.jointObjList[jointIndex]
+            if jointObj.JointType in self.dictConstraintKernels:
+                groupKey = (jointObj.JointType, jointObj.mConstraints)
+                if groupKey not in groupDict:
+                    groupDict[groupKey] = []
+                groupDict[groupKey].append(jointIndex)
+            else:
+                self.unbatchedJointIndexList.append(jointIndex)
+        # The driven joints [with a driver function] are the only ones whose velocity constraints depend on time
+        self.drivenJointIndexList = [jointIndex for jointIndex in range(self.numJoints)
+                                     if self.jointObjList[jointIndex].JointType in (4, 5)
+                                     and self.jointObjList[jointIndex].FunctType != -1]
+        self.jointGroupList = []
+        for groupKey in groupDict:
+            self.jointGroupList.append(JointGroupC(self, groupKey[0], groupKey[1], groupDict[groupKey]))
+    #  -------------------------------------------------------------------------
+    def compileForces(self):
+        """Sort the forces into groups of the same actuatorType so that one batched
+        kernel evaluates all the forces in a group, and lay out the HEAD and TAIL
+        force terms of every group in one array, to be added to the bodies in one go"""
+        if Debug:
+            DT.Mess("DapMainMod-compileForces")
+        self.numGravity = 0
+        groupDict = {}
+        for forceIndex in range(self.numForces):
+            actuatorType = self.forceObjList[forceIndex].actuatorType
+            if actuatorType == 0:
+                self.numGravity += 1
+            elif actuatorType in self.dictForceKernels:
+                if actuatorType not in groupDict:
+                    groupDict[actuatorType] = []
+                groupDict[actuatorType].append(forceIndex)
+        self.forceGroupList = []
+        for actuatorType in groupDict:
+            self.forceGroupList.append(ForceGroupC(self, actuatorType, groupDict[actuatorType]))
+
+        # [Fx, Fy, moment] of the HEAD and then the TAIL of every force in every group
+        # The groups' kernels write into views of this array
+        numTerms = 2 * sum([group.numForces for group in self.forceGroupList])
+        self.forceTermNp = np.zeros((numTerms, 3,), dtype=np.float64)
+        forceTermBodyList = []
+        termStart = 0
+        for group in self.forceGroupList:
+            group.forceHEADNp = self.forceTermNp[termStart: termStart + group.numForces]
+            group.forceTAILNp = self.forceTermNp[termStart + group.numForces: termStart + 2 * group.numForces]
+            forceTermBodyList += list(group.bodyHEADNp) + list(group.bodyTAILNp)
+            # The constant parts only need filling in once
+            if group.actuatorType == 7:
+                group.forceHEADNp[:, 0:2] = group.vectorNp
+            elif group.actuatorType == 8:
+                group.forceHEADNp[:, 2] = group.torqueNp
+            termStart += 2 * group.numForces
+        self.forceTermBodyNp = np.array(forceTermBodyList, dtype=np.int64)
+    #  -------------------------------------------------------------------------
+    def gatherPointsF(self, pointsNp, group):
+        """Gather pointsNp[body, point] at the HEAD and at the TAIL
+        of every joint in the group into group.vecHEADNp and group.vecTAILNp"""
+        np.take(pointsNp.reshape(-1, 2), group.pointHEADFlatNp, axis=0, out=group.vecHEADNp)
+        np.take(pointsNp.reshape(-1, 2), group.pointTAILFlatNp, axis=0, out=group.vecTAILNp)
+    #  -------------------------------------------------------------------------
+    def gatherBodyVectorsF(self, bodiesNp, group):
+        """Gather the HEAD and TAIL body vectors of every joint in the group
+        into group.vecHEADNp and group.vecTAILNp - zero for the ground body"""
+        np.take(bodiesNp, group.bodyHEADNp, axis=0, out=group.vecHEADNp)
+        np.take(bodiesNp, group.bodyTAILNp, axis=0, out=group.vecTAILNp)
+        group.vecHEADNp *= group.headMovingNp[:, np.newaxis]
+        group.vecTAILNp *= group.tailMovingNp[:, np.newaxis]
+    #  -------------------------------------------------------------------------
+    def gatherBodyScalarsF(self, bodiesNp, group):
+        """Gather the HEAD and TAIL body scalars of every joint in the group
+        into group.scalarHEADNp and group.scalarTAILNp - zero for the ground body"""
+        np.take(bodiesNp, group.bodyHEADNp, out=group.scalarHEADNp)
+        np.take(bodiesNp, group.bodyTAILNp, out=group.scalarTAILNp)
+        group.scalarHEADNp *= group.headMovingNp
+        group.scalarTAILNp *= group.tailMovingNp
+    #  -------------------------------------------------------------------------
+    def evaluateDriversF(self, group, tick):
+        """Evaluate [f, fDot, fDotDot] of the driver function of every joint in the group"""
+        for index in range(group.numJoints):
+            if group.driverList[index] is not None:
+                group.driverNp[index] = group.driverList[index].getFofT(tick)
+    #  -------------------------------------------------------------------------
+    def rigidTAILVectorF(self, group):
+        """The d0 vector of every rigid joint in the group in world coordinates
+        i.e. rotated by the TAIL body, unless the TAIL body is ground"""
+        np.take(self.RotMatPhiNp, group.bodyTAILNp, axis=0, out=group.rotMatTAILNp)
+        np.einsum('jik,jk->ji', group.rotMatTAILNp, group.d0Np, out=group.d0WorldNp)
+        np.copyto(group.d0WorldNp, group.d0Np, where=group.tailGroundNp[:, np.newaxis])
+        return group.d0WorldNp
     #  =============================================================================
     def Constraints(self, tick):
         if Debug:
             DT.Mess("DapMainMod-Constraints")
-        DeltaConstraint = np.zeros((self.numConstraints,), dtype=np.float64)
+        DeltaConstraint = self.constraintNp
+        # Call the applicable kernel for each group of joints
+        for group in self.jointGroupList:
+            self.dictConstraintKernels[group.jointType](group, tick)
+            DeltaConstraint[group.rowNp] = group.constraintNp
         # Call the applicable function which is pointed to by the Constraints dictionary
-        for jointObj in self.jointObjList:
+        for jointIndex in self.unbatchedJointIndexList:
+            jointObj = self.jointObjList[jointIndex]
             constraint = self.dictConstraintFunctions[jointObj.JointType](jointObj, tick)
             if Debug:
                 DT.Mess(constraint)
             DeltaConstraint[jointObj.rowStart: jointObj.rowEnd] = constraint
         return DeltaConstraint
     #  -------------------------------------------------------------------------
-    def revolute_Constraint(self, jointObj, tick):
+    def revolute_ConstraintKernel(self, group, tick):
         if Debug:
-            DT.Mess("DapMainMod-revolute_Constraint")
-        # Evaluate the constraints for a revolute joint
-        bodyHEAD = jointObj.bodyHEADindex
-        bodyTAIL = jointObj.bodyTAILindex
-        constraint = self.pointWorldNp[bodyHEAD, jointObj.pointHEADindex] - self.pointWorldNp[bodyTAIL, jointObj.pointTAILindex]
-        if jointObj.fixDof:
-            if bodyHEAD == 0:
-                constraint = np.array([constraint[0], constraint[1], -self.phiNp[bodyTAIL] - jointObj.phi0])
-            elif bodyTAIL == 0:
-                constraint = np.array([constraint[0], constraint[1],  self.phiNp[bodyHEAD] - jointObj.phi0])
-            else:
-                constraint = np.array([constraint[0], constraint[1],  self.phiNp[bodyHEAD] - self.phiNp[bodyTAIL] - jointObj.phi0])
-        return constraint
+            DT.Mess("DapMainMod-revolute_ConstraintKernel")
+        # The HEAD and TAIL points of a revolute joint coincide
+        self.gatherPointsF(self.pointWorldNp, group)
+        np.subtract(group.vecHEADNp, group.vecTAILNp, out=group.constraintNp[:, 0:2])
+        # and if the DOF is fixed, the relative angle stays at phi0
+        if group.mConstraints == 3:
+            self.gatherBodyScalarsF(self.phiNp, group)
+            np.subtract(group.scalarHEADNp, group.scalarTAILNp, out=group.constraintNp[:, 2])
+            group.constraintNp[:, 2] -= group.phi0Np
     #  -------------------------------------------------------------------------
-    def disc_Constraint(self, jointObject, tick):
-        bodyHEAD = jointObject.bodyHEADindex
-        return np.array([(self.worldNp[bodyHEAD, 1] - jointObject.Radius),
-                         ((self.worldNp[bodyHEAD,0] - jointObject.x0) + jointObject.Radius *
-                          (self.phiNp[bodyHEAD] - jointObject.phi0))])
+    def revolute_revolute_ConstraintKernel(self, group, tick):
+        if Debug:
+            DT.Mess("DapMainMod-revolute_revolute_ConstraintKernel")
+        # The distance between the HEAD and TAIL points stays at lengthLink
+        # (diff.diff / Length - Length) / 2
+        self.gatherPointsF(self.pointWorldNp, group)
+        np.subtract(group.vecHEADNp, group.vecTAILNp, out=group.diffNp)
+        constraint = group.constraintNp[:, 0]
+        np.einsum('ji,ji->j', group.diffNp, group.diffNp, out=constraint)
+        constraint /= group.lengthLinkNp
+        constraint -= group.lengthLinkNp
+        constraint *= 0.5
     #  -------------------------------------------------------------------------
-    def relative_rotational_Constraint(self, jointObject, tick):
-        [func, funcDot, funcDotDot] = DapFunctionMod.GetFofT(jointObject.FunctType, tick)
-        bodyHEAD = jointObject.bodyHEADindex
-        bodyTAIL = jointObject.bodyTAILindex
-        if bodyHEAD == 0:
-            f = -self.phiNp[bodyTAIL] - func
-        elif bodyTAIL == 0:
-            f = self.phiNp[bodyHEAD] - func
-        else:
-            f = self.phiNp[bodyHEAD] - self.phiNp[bodyTAIL] - func
-        return np.array([f])
+    def relative_rotational_ConstraintKernel(self, group, tick):
+        if Debug:
+            DT.Mess("DapMainMod-relative_rotational_ConstraintKernel")
+        # The relative angle follows the driver function f(t)
+        self.evaluateDriversF(group, tick)
+        self.gatherBodyScalarsF(self.phiNp, group)
+        np.subtract(group.scalarHEADNp, group.scalarTAILNp, out=group.constraintNp[:, 0])
+        group.constraintNp[:, 0] -= group.driverNp[:, 0]
+    #  -------------------------------------------------------------------------
+    def disc_ConstraintKernel(self, group, tick):
+        if Debug:
+            DT.Mess("DapMainMod-disc_ConstraintKernel")
+        # The disc stays on the ground (y = Radius) and rolls without slipping
+        np.take(self.worldNp, group.bodyHEADNp, axis=0, out=group.vecHEADNp)
+        self.gatherBodyScalarsF(self.phiNp, group)
+        np.subtract(group.vecHEADNp[:, 1], group.radiusNp, out=group.constraintNp[:, 0])
+        # (x - x0) + Radius * (phi - phi0)
+        rolling = group.constraintNp[:, 1]
+        np.subtract(group.scalarHEADNp, group.phi0Np, out=rolling)
+        rolling *= group.radiusNp
+        rolling += group.vecHEADNp[:, 0]
+        rolling -= group.x0Np
+    #  -------------------------------------------------------------------------
+    def rigid_ConstraintKernel(self, group, tick):
+        if Debug:
+            DT.Mess("DapMainMod-rigid_ConstraintKernel")
+        # The HEAD body stays at d0 (in TAIL coordinates) from the TAIL body
+        d0World = self.rigidTAILVectorF(group)
+        self.gatherBodyVectorsF(self.worldNp, group)
+        np.subtract(group.vecHEADNp, group.vecTAILNp, out=group.constraintNp[:, 0:2])
+        group.constraintNp[:, 0:2] -= d0World
+        # with the relative angle staying at phi0
+        self.gatherBodyScalarsF(self.phiNp, group)
+        np.subtract(group.scalarHEADNp, group.scalarTAILNp, out=group.constraintNp[:, 2])
+        group.constraintNp[:, 2] -= group.phi0Np
     #  -------------------------------------------------------------------------
     def relative_translational_Constraint(self, jointObject, tick):
         [func, funcDot, funcDotDot] = DapFunctionMod.GetFofT(jointObject.FunctType, tick)
@@ -885,16 +2257,6 @@ class DapMainC:
         diff = self.worldNp[bodyHEAD, pointHEAD] - self.worldNp[bodyTAIL, pointTAIL]
         return np.array([(diff.dot(diff) - func ** 2) / 2])
     #  -------------------------------------------------------------------------
-    def revolute_revolute_Constraint(self, jointObject, tick):
-        bodyHEAD = jointObject.bodyHEADindex
-        bodyTAIL = jointObject.bodyTAILindex
-        pointHEAD = jointObject.pointHEADindex
-        pointTAIL = jointObject.pointTAILindex
-        diff = self.pointWorldNp[bodyHEAD, pointHEAD] - self.pointWorldNp[bodyTAIL, pointTAIL]
-        Length = jointObject.lengthLink
-        unitVec = diff / Length
-        return np.array([(unitVec.dot(diff) - Length) / 2.0])
-    #  -------------------------------------------------------------------------
     def revolute_translational_Constraint(self, jointObject, tick):
         bodyHEAD = jointObject.bodyHEADindex
         bodyTAIL = jointObject.bodyTAILindex
@@ -904,20 +2266,6 @@ class DapMainC:
         diff = self.pointWorldNp[bodyHEAD, pointHEAD] - self.pointWorldNp[bodyTAIL, pointTAIL]
         return np.array([unitHEADRot.dot(diff) - jointObject.Length])
     #  -------------------------------------------------------------------------
-    def rigid_Constraint(self, jointObject):
-        bodyHEAD = jointObject.bodyHEADindex
-        bodyTAIL = jointObject.bodyTAILindex
-        TAILVec = self.RotMatPhiNp[bodyTAIL] @ (self.vecToNumpyF(jointObject.d0))
-        if bodyHEAD == 0:
-            return np.array([-self.worldNp[bodyTAIL] + TAILVec,
-                             -self.phiNp[bodyTAIL] - jointObject.phi0])
-        if bodyTAIL == 0:
-            return np.array([self.worldNp[bodyHEAD] - self.vecToNumpyF(jointObject.d0),
-                             self.phiNp[bodyHEAD] - jointObject.phi0])
-        else:
-            return np.array([self.worldNp[bodyHEAD] - self.worldNp[bodyTAIL] + TAILvec,
-                             self.phiNp[bodyHEAD] - self.phiNp[bodyTAIL] - jointObject.phi0])
-    #  -------------------------------------------------------------------------
     def translational_Constraint(self, jointObject, tick):
         bodyHEAD = jointObject.bodyHEADindex
         bodyTAIL = jointObject.bodyTAILindex
@@ -932,58 +2280,135 @@ class DapMainC:
         else:
             return np.array([unitTAILRot.dot(diff), unitTAILRot.dot(unitHEAD)])
     #  =========================================================================
-    def getJacobianF(self):
+    def makeJacobianScatterMap(self):
+        """Work out the (row, column) sparsity pattern of the Jacobian once.
+        Each joint has its own slots in jacobianDataNp for the values of its
+        HEAD and TAIL blocks, and jacobianPermNp scatters them into the CSR Jacobian"""
         if Debug:
-            DT.Mess("DapMainMod-Jacobian")
-        Jacobian = np.zeros((self.numConstraints, self.numMovBodiesx3,))
-        for jointObj in self.jointObjList:
-            # Call the applicable function which is pointed to by the Jacobian dictionary
-            JacobianHEAD, JacobianTAIL = self.dictJacobianFunctions[jointObj.JointType](jointObj)
-            # Fill in the values in the Jacobian
-            rowStart = jointObj.rowStart
-            rowEnd = jointObj.rowEnd
+            DT.Mess("DapMainMod-makeJacobianScatterMap")
+        rowList = []
+        columnList = []
+        # Starting slot of each joint's HEAD and TAIL blocks [-1 if attached to ground]
+        self.jacHEADSlotNp = np.full((self.numJoints,), -1, dtype=np.int64)
+        self.jacTAILSlotNp = np.full((self.numJoints,), -1, dtype=np.int64)
+        slot = 0
+        for jointIndex in range(self.numJoints):
+            jointObj = self.jointObjList[jointIndex]
             if jointObj.bodyHEADindex != 0:
-                columnHEADStart = (jointObj.bodyHEADindex-1) * 3
-                columnHEADEnd = jointObj.bodyHEADindex * 3
-                Jacobian[rowStart: rowEnd, columnHEADStart: columnHEADEnd] = JacobianHEAD
+                self.jacHEADSlotNp[jointIndex] = slot
+                for row in range(jointObj.rowStart, jointObj.rowEnd):
+                    for column in range((jointObj.bodyHEADindex-1) * 3, jointObj.bodyHEADindex * 3):
+                        rowList.append(row)
+                        columnList.append(column)
+                        slot += 1
             if jointObj.bodyTAILindex != 0:
-                columnTAILStart = (jointObj.bodyTAILindex-1) * 3
-                columnTAILEnd = jointObj.bodyTAILindex * 3
-                Jacobian[rowStart: rowEnd, columnTAILStart: columnTAILEnd] = JacobianTAIL
-        return Jacobian
-    #  -------------------------------------------------------------------------
-    def revolute_Jacobian(self, jointObj):
-        if Debug:
-            DT.Mess("DapMainMod-revolute_Jacobian")
-        # Jacobian sub-matrices for a revolute joint
-        if jointObj.fixDof:
-            JacobianHEAD = np.array([
-                [1.0, 0.0, - self.pointVectorNp[jointObj.bodyHEADindex, jointObj.pointHEADindex, 1]],
-                [0.0, 1.0, self.pointVectorNp[jointObj.bodyHEADindex, jointObj.pointHEADindex, 0]],
-                [0.0, 0.0, 1.0]])
-            JacobianTAIL = np.array([
-                [-1.0, 0.0, self.pointVectorNp[jointObj.bodyTAILindex, jointObj.pointTAILindex, 1]],
-                [0.0, -1.0, - self.pointVectorNp[jointObj.bodyTAILindex, jointObj.pointTAILindex, 0]],
-                [0.0, 0.0, -1.0]])
-        else:
-            JacobianHEAD = np.array([
-                [1.0, 0.0, - self.pointVectorNp[jointObj.bodyHEADindex, jointObj.pointHEADindex, 1]],
-                [0.0, 1.0, self.pointVectorNp[jointObj.bodyHEADindex, jointObj.pointHEADindex, 0]]])
-            JacobianTAIL = np.array([
-                [-1.0, 0.0, self.pointVectorNp[jointObj.bodyTAILindex, jointObj.pointTAILindex, 1]],
-                [0.0, -1.0, - self.pointVectorNp[jointObj.bodyTAILindex, jointObj.pointTAILindex, 0]]])
-        return JacobianHEAD, JacobianTAIL
-    #  =========================================================================
-    def disc_Jacobian(self, jointObject):
-        # Jacobian sub-matrices for a disk joint between a body and the ground
-        JacobianHEAD = np.array([[0.0, 1.0, 0.0],
-                                 [1.0, 0.0, jointObject.Radius]])
-        return JacobianHEAD, JacobianHEAD
-    #  -------------------------------------------------------------------------
-    def relative_rotational_Jacobian(self, jointObject):
-        JacobianHEAD = np.array([0.0, 0.0, 1.0])
-        JacobianTAIL = np.array([0.0, 0.0, -1.0])
-        return JacobianHEAD, JacobianTAIL
+                self.jacTAILSlotNp[jointIndex] = slot
+                for row in range(jointObj.rowStart, jointObj.rowEnd):
+                    for column in range((jointObj.bodyTAILindex-1) * 3, jointObj.bodyTAILindex * 3):
+                        rowList.append(row)
+                        columnList.append(column)
+                        slot += 1
+        self.jacobianRowsNp = np.array(rowList, dtype=np.int64)
+        self.jacobianColumnsNp = np.array(columnList, dtype=np.int64)
+        # The values of all the slots, followed by a trash block into which
+        # the batched kernels write the blocks of the ground body
+        self.jacobianTrashSlot = slot
+        self.jacobianSlotsNp = np.zeros((slot + 9,), dtype=np.float64)
+        self.jacobianDataNp = self.jacobianSlotsNp[0: slot]
+
+        # Let scipy sort the pattern into CSR order, with the slot numbers as values,
+        # so we know which slot ends up where in the CSR data array
+        slotOrder = sparse.csr_matrix((np.arange(1, slot+1, dtype=np.float64),
+                                       (self.jacobianRowsNp, self.jacobianColumnsNp)),
+                                      shape=(self.numConstraints, self.numMovBodiesx3))
+        self.jacobianPermNp = slotOrder.data.astype(np.int64) - 1
+        self.jacobianCSR = sparse.csr_matrix((np.zeros((slot,), dtype=np.float64),
+                                              slotOrder.indices.copy(),
+                                              slotOrder.indptr.copy()),
+                                             shape=(self.numConstraints, self.numMovBodiesx3))
+    #  -------------------------------------------------------------------------
+    def fillJacobianDataF(self):
+        """Write the HEAD and TAIL blocks of every joint into its slots in jacobianDataNp"""
+        # Call the applicable kernel for each group of joints and scatter its blocks into their slots
+        for group in self.jointGroupList:
+            self.dictJacobianKernels[group.jointType](group)
+            self.jacobianSlotsNp[group.jacHEADSlotNp] = group.jacHEADNp
+            self.jacobianSlotsNp[group.jacTAILSlotNp] = group.jacTAILNp
+        # and do the remaining joints one by one
+        for jointIndex in self.unbatchedJointIndexList:
+            jointObj = self.jointObjList[jointIndex]
+            # Call the applicable function which is pointed to by the Jacobian dictionary
+            JacobianHEAD, JacobianTAIL = self.dictJacobianFunctions[jointObj.JointType](jointObj)
+            blockSize = jointObj.mConstraints * 3
+            slot = self.jacHEADSlotNp[jointIndex]
+            if slot >= 0:
+                self.jacobianDataNp[slot: slot + blockSize] = np.ravel(JacobianHEAD)
+            slot = self.jacTAILSlotNp[jointIndex]
+            if slot >= 0:
+                self.jacobianDataNp[slot: slot + blockSize] = np.ravel(JacobianTAIL)
+    #  -------------------------------------------------------------------------
+    def getJacobianF(self):
+        """Return the Jacobian as a dense numConstraints x numMovBodiesx3 matrix"""
+        if Debug:
+            DT.Mess("DapMainMod-Jacobian")
+        self.fillJacobianDataF()
+        # Only the entries in the sparsity pattern are ever non-zero, so just overwrite those
+        self.jacobianDenseNp[self.jacobianRowsNp, self.jacobianColumnsNp] = self.jacobianDataNp
+        return self.jacobianDenseNp
+    #  -------------------------------------------------------------------------
+    def getSparseJacobianF(self):
+        """Return the Jacobian as a CSR matrix with the pattern worked out in
+        makeJacobianScatterMap - only the values are updated on each call"""
+        if Debug:
+            DT.Mess("DapMainMod-SparseJacobian")
+        self.fillJacobianDataF()
+        np.take(self.jacobianDataNp, self.jacobianPermNp, out=self.jacobianCSR.data)
+        return self.jacobianCSR
+    #  -------------------------------------------------------------------------
+    def revolute_JacobianKernel(self, group):
+        if Debug:
+            DT.Mess("DapMainMod-revolute_JacobianKernel")
+        # Jacobian sub-matrices for the revolute joints
+        # [ 1.0  0.0  -pointVector.y ]   [ -1.0   0.0  pointVector.y ]
+        # [ 0.0  1.0   pointVector.x ]   [  0.0  -1.0 -pointVector.x ]
+        # [ 0.0  0.0   1.0           ]   [  0.0   0.0 -1.0           ]  <- if DOF fixed
+        # Only the last column changes - the rest was filled in by JointGroupC
+        self.gatherPointsF(self.pointVectorRotNp, group)
+        group.jacHEADNp[:, 0:2, 2] = group.vecHEADNp
+        np.negative(group.vecTAILNp, out=group.jacTAILNp[:, 0:2, 2])
+    #  -------------------------------------------------------------------------
+    def revolute_revolute_JacobianKernel(self, group):
+        if Debug:
+            DT.Mess("DapMainMod-revolute_revolute_JacobianKernel")
+        # Jacobian sub-matrices for the revolute-revolute joints
+        # [  unit.x,  unit.y,  unit . pointVectorRot(HEAD) ]
+        # [ -unit.x, -unit.y, -unit . pointVectorRot(TAIL) ]
+        self.gatherPointsF(self.pointWorldNp, group)
+        unitVec = group.diffNp
+        np.subtract(group.vecHEADNp, group.vecTAILNp, out=unitVec)
+        unitVec /= group.lengthLinkNp[:, np.newaxis]
+        group.jacHEADNp[:, 0, 0:2] = unitVec
+        np.negative(unitVec, out=group.jacTAILNp[:, 0, 0:2])
+        self.gatherPointsF(self.pointVectorRotNp, group)
+        np.einsum('ji,ji->j', unitVec, group.vecHEADNp, out=group.jacHEADNp[:, 0, 2])
+        np.einsum('ji,ji->j', unitVec, group.vecTAILNp, out=group.jacTAILNp[:, 0, 2])
+        group.jacTAILNp[:, 0, 2] *= -1.0
+    #  -------------------------------------------------------------------------
+    def rigid_JacobianKernel(self, group):
+        if Debug:
+            DT.Mess("DapMainMod-rigid_JacobianKernel")
+        # Jacobian sub-matrices for the rigid joints
+        # [ 1.0  0.0  0.0 ]   [ -1.0   0.0  -d0WorldRot.x ]
+        # [ 0.0  1.0  0.0 ]   [  0.0  -1.0  -d0WorldRot.y ]
+        # [ 0.0  0.0  1.0 ]   [  0.0   0.0  -1.0          ]
+        d0World = self.rigidTAILVectorF(group)
+        group.jacTAILNp[:, 0, 2] = d0World[:, 1]
+        np.negative(d0World[:, 0], out=group.jacTAILNp[:, 1, 2])
+    #  -------------------------------------------------------------------------
+    def constant_JacobianKernel(self, group):
+        """The Jacobian sub-matrices of this joint type are constant
+        and were filled in once by JointGroupC"""
+        return
     #  -------------------------------------------------------------------------
     def relative_translational_Jacobian(self, jointObject):
         bodyHEAD = jointObject.bodyHEADindex
@@ -996,18 +2421,6 @@ class DapMainC:
         JacobianTAIL = np.array([-diff[0], -diff[1], -diff.dot(self.pointVectorRotNp[bodyHEAD, pointTAIL])])
         return JacobianHEAD, JacobianTAIL
     #  -------------------------------------------------------------------------
-    def revolute_revolute_Jacobian(self, jointObject):
-        bodyHEAD = jointObject.bodyHEADindex
-        bodyTAIL = jointObject.bodyTAILindex
-        pointHEAD = jointObject.pointHEADindex
-        pointTAIL = jointObject.pointTAILindex
-        diff = self.pointWorldNp[bodyHEAD, pointHEAD] - self.pointWorldNp[bodyTAIL, pointTAIL]
-        unitVec = diff / jointObject.lengthLink
-
-        JacobianHEAD = np.array([unitVec[0], unitVec[1], unitVec.dot(self.pointVectorRotNp[bodyHEAD, pointHEAD])])
-        JacobianTAIL = np.array([-unitVec[0], -unitVec[1], -unitVec.dot(self.pointVectorRotNp[bodyTAIL, pointTAIL])])
-        return JacobianHEAD, JacobianTAIL
-    #  -------------------------------------------------------------------------
     def revolute_translational_Jacobian(self, jointObject):
         bodyHEAD = jointObject.bodyHEADindex
         bodyTAIL = jointObject.bodyTAILindex
@@ -1021,18 +2434,6 @@ class DapMainC:
         JacobianTAIL = np.array([-unitVecRot[0], -unitVecRot[1], -unitVec.dot(self.pointVectorNp[bodyTAIL, pointTAIL])])
         return JacobianHEAD, JacobianTAIL
     #  -------------------------------------------------------------------------
-    def rigid_Jacobian(self, jointObject):
-        bodyTAIL = jointObject.bodyTAILindex
-        JacobianHEAD = np.array([[1.0, 0.0, 0.0],
-                                 [0.0, 1.0, 0.0],
-                                 [0.0, 0.0, 1.0]])
-        if bodyTAIL != 0:
-            BodAJoint = self.RotMatPhiNp[bodyTAIL] @ self.vecToNumpyF(jointObject.d0)
-            JacobianTAIL = np.array([[-1.0, 0.0, -self.Rot90NumpyF(BodAJoint)[0]],
-                                     [0.0, -1.0, -self.Rot90NumpyF(BodAJoint)[1]],
-                                     [0.0, 0.0, -1.0]])
-        return JacobianHEAD, JacobianTAIL
-    #  -------------------------------------------------------------------------
     def translational_Jacobian(self, jointObject):
         bodyHEAD = jointObject.bodyHEADindex
         bodyTAIL = jointObject.bodyTAILindex
@@ -1065,71 +2466,130 @@ class DapMainC:
     def RHSVel(self, tick):
         if Debug:
             DT.Mess("DapMainMod-RHSVel")
-        # Call the applicable relative-rotation or relative-translation function where applicable
-        rhsVel = np.zeros((self.numConstraints,), dtype=np.float64)
-        for jointObj in self.jointObjList:
-            if jointObj.JointType == 4:  # 'Driven-Rotation':
-                [func, funcDot, funcDotDot] = DapFunctionMod.GetFofT(self.jointObject.FunctType, tick)
-                fVelocity = func * funcDot
-                rhsVel[jointObj.rowStart: jointObj.rowEnd] = fVelocity
-            elif jointObj.JointType == 5:  # 'Driven-Translation':
-                [func, funcDot, funcDotDot] = DapFunctionMod.GetFofT(self.jointObject.FunctType, tick)
-                fVelocity = funcDot
-                rhsVel[jointObj.rowStart: jointObj.rowEnd] = fVelocity
+        # Only the driven joints have a non-zero r-h-s of the velocity constraints (nu = -dPhi/dt)
+        rhsVel = self.rhsVelNp
+        for jointIndex in self.drivenJointIndexList:
+            jointObj = self.jointObjList[jointIndex]
+            [func, funcDot, funcDotDot] = self.driverObjDict[jointObj.Name].getFofT(tick)
+            if jointObj.JointType == 4:  # 'Driven-Rotation': Phi = phiHEAD - phiTAIL - f(t)
+                rhsVel[jointObj.rowStart] = funcDot
+            else:  # 'Driven-Translation': Phi = (d.d - f(t)^2) / 2
+                rhsVel[jointObj.rowStart] = func * funcDot
         return rhsVel
+    #  -------------------------------------------------------------------------
+    def stabilisedRHSAccF(self, tick):
+        """The r-h-s of the acceleration constraints, with the Baumgarte terms
+        gamma - 2 alpha PhiDot - beta^2 Phi  when stabilisation is switched on,
+        which turns the constraint drift into a damped oscillation which dies away.
+        jacobianDataNp must already hold the Jacobian at the current positions"""
+        rhsAcc = self.RHSAcc(tick)
+        if self.baumgarte:
+            # PhiDot = J velocities - nu, worked out from the Jacobian slots
+            np.take(self.uVelocityNp.reshape(-1), self.jacobianColumnsNp, out=self.jacobianWeightsNp)
+            self.jacobianWeightsNp *= self.jacobianDataNp
+            constraintVel = self.constraintVelNp
+            constraintVel[:] = 0.0
+            np.add.at(constraintVel, self.jacobianRowsNp, self.jacobianWeightsNp)
+            constraintVel -= self.RHSVel(tick)
+            constraintVel *= 2.0 * self.baumgarteAlpha
+            rhsAcc -= constraintVel
+            # and the same buffer again for the Baumgarte position term
+            np.multiply(self.Constraints(tick), self.baumgarteBeta ** 2, out=constraintVel)
+            rhsAcc -= constraintVel
+        return rhsAcc
+    #  -------------------------------------------------------------------------
+    def constraintDriftF(self, timeValues, uResults):
+        """The largest violation of the position and of the velocity constraints
+        over the results, to show how well the integration keeps to the joints"""
+        if Debug:
+            DT.Mess("DapMainMod-constraintDriftF")
+        maxPositionDrift = 0.0
+        maxVelocityDrift = 0.0
+        if self.numConstraints > 0:
+            for timeIndex in range(len(timeValues)):
+                self.unpackStateF(uResults[timeIndex])
+                maxPositionDrift = max(maxPositionDrift, np.abs(self.Constraints(timeValues[timeIndex])).max())
+                constraintVel = self.getJacobianF() @ self.uVelocityNp.reshape(-1) - self.RHSVel(timeValues[timeIndex])
+                maxVelocityDrift = max(maxVelocityDrift, np.abs(constraintVel).max())
+        return maxPositionDrift, maxVelocityDrift
     #  =========================================================================
     def RHSAcc(self, tick):
         if Debug:
             DT.Mess("DapMainMod-RHSAcc")
         # Determine the Right=Hand-Side of the acceleration equation (gamma)
-        rhsAcc = np.zeros((self.numConstraints,), dtype=np.float64)
+        rhsAcc = self.rhsAccNp
+        # Call the applicable kernel for each group of joints
+        for group in self.jointGroupList:
+            self.dictAccelerationKernels[group.jointType](group, tick)
+            rhsAcc[group.rowNp] = group.gammaNp
         # Call the applicable function which is pointed to by the Acceleration dictionary
-        for jointObj in self.jointObjList:
+        for jointIndex in self.unbatchedJointIndexList:
+            jointObj = self.jointObjList[jointIndex]
             gamma = self.dictAccelerationFunctions[jointObj.JointType](jointObj, tick)
             rhsAcc[jointObj.rowStart: jointObj.rowEnd] = gamma
         return rhsAcc
     #  =========================================================================
-    def revolute_Acc(self, jointObj, tick):
+    def revolute_AccKernel(self, group, tick):
         if Debug:
-            DT.Mess("DapMainMod-revolute_Acc")
-        bodyHEAD = jointObj.bodyHEADindex
-        bodyTAIL = jointObj.bodyTAILindex
-        pointHEAD = jointObj.pointHEADindex
-        pointTAIL = jointObj.pointTAILindex
-        if bodyHEAD == 0:
-            gammaF = self.Rot90NumpyF(self.pointVectorDotNp[bodyTAIL, pointTAIL]) * self.phiDotNp[bodyTAIL]
-        elif bodyTAIL == 0:
-            gammaF = -self.Rot90NumpyF(self.pointVectorDotNp[bodyHEAD, pointHEAD]) * self.phiDotNp[bodyHEAD]
-        else:
-            gammaF = -self.Rot90NumpyF(self.pointVectorDotNp[bodyHEAD, pointHEAD]) * self.phiDotNp[bodyHEAD] + \
-                     self.Rot90NumpyF(self.pointVectorDotNp[bodyTAIL, pointTAIL]) * self.phiDotNp[bodyTAIL]
-        if jointObj.fixDof:
-            gammaF = np.array([[gammaF[0], gammaF[1]],
-                               [0.0, 0.0]])
-        return gammaF
-    #  -------------------------------------------------------------------------
-    def disc_Acc(self, jointObject, tick):
-        return np.array([0.0, 0.0])
+            DT.Mess("DapMainMod-revolute_AccKernel")
+        # gamma = pointVector(HEAD) * phiDot(HEAD)^2 - pointVector(TAIL) * phiDot(TAIL)^2
+        # [ and zero for the relative angle if the DOF is fixed ]
+        self.gatherPointsF(self.pointVectorNp, group)
+        self.gatherBodyScalarsF(self.phiDotNp, group)
+        group.scalarHEADNp *= group.scalarHEADNp
+        group.scalarTAILNp *= group.scalarTAILNp
+        group.vecHEADNp *= group.scalarHEADNp[:, np.newaxis]
+        group.vecTAILNp *= group.scalarTAILNp[:, np.newaxis]
+        np.subtract(group.vecHEADNp, group.vecTAILNp, out=group.gammaNp[:, 0:2])
     #  -------------------------------------------------------------------------
-    def revolute_revolute_Acc(self, jointObject, tick):
+    def revolute_revolute_AccKernel(self, group, tick):
         """ DAP_BC_12_2023/Formulation/"""
-        bodyHEAD = jointObject.bodyHEADindex
-        bodyTAIL = jointObject.bodyTAILindex
-        pointHEAD = jointObject.pointHEADindex
-        pointTAIL = jointObject.pointTAILindex
-        diff = self.pointWorldNp[bodyHEAD, pointHEAD] - self.pointWorldNp[bodyTAIL, pointTAIL]
-        diffDot = self.pointWorldDotNp[bodyHEAD, pointHEAD] - self.pointWorldDotNp[bodyTAIL, pointTAIL]
-        unit = diff/jointObject.lengthLink
-        unitDotNp = diffDot/jointObject.lengthLink
-        f = -unitDotNp.dot(diffDot)
-        if bodyHEAD == 0:
-            f += unit.dot(self.Rot90NumpyF(self.pointVectorDotNp[bodyTAIL, pointTAIL]) * self.phiDotNp[bodyTAIL])
-        elif bodyTAIL == 0:
-            f -= unit.dot(self.Rot90NumpyF(self.pointVectorDotNp[bodyHEAD, pointHEAD]) * self.phiDotNp[bodyHEAD])
-        else:
-            f += unit.dot(self.Rot90NumpyF(self.pointVectorDotNp[bodyTAIL, pointTAIL]) * self.phiDotNp[bodyTAIL]) \
-                 -unit.dot(self.Rot90NumpyF(self.pointVectorDotNp[bodyHEAD, pointHEAD]) * self.phiDotNp[bodyHEAD])
-        return f
+        if Debug:
+            DT.Mess("DapMainMod-revolute_revolute_AccKernel")
+        # gamma = - diffDot . diffDot / Length
+        #         + unit . pointVector(HEAD) * phiDot(HEAD)^2
+        #         - unit . pointVector(TAIL) * phiDot(TAIL)^2
+        gamma = group.gammaNp[:, 0]
+        self.gatherPointsF(self.pointWorldDotNp, group)
+        np.subtract(group.vecHEADNp, group.vecTAILNp, out=group.diffDotNp)
+        np.einsum('ji,ji->j', group.diffDotNp, group.diffDotNp, out=gamma)
+        gamma /= group.lengthLinkNp
+        np.negative(gamma, out=gamma)
+        self.gatherPointsF(self.pointWorldNp, group)
+        unitVec = group.diffNp
+        np.subtract(group.vecHEADNp, group.vecTAILNp, out=unitVec)
+        unitVec /= group.lengthLinkNp[:, np.newaxis]
+        self.gatherPointsF(self.pointVectorNp, group)
+        self.gatherBodyScalarsF(self.phiDotNp, group)
+        np.einsum('ji,ji->j', unitVec, group.vecHEADNp, out=group.scalarNp)
+        group.scalarNp *= group.scalarHEADNp
+        group.scalarNp *= group.scalarHEADNp
+        gamma += group.scalarNp
+        np.einsum('ji,ji->j', unitVec, group.vecTAILNp, out=group.scalarNp)
+        group.scalarNp *= group.scalarTAILNp
+        group.scalarNp *= group.scalarTAILNp
+        gamma -= group.scalarNp
+    #  -------------------------------------------------------------------------
+    def relative_rotational_AccKernel(self, group, tick):
+        if Debug:
+            DT.Mess("DapMainMod-relative_rotational_AccKernel")
+        # gamma = fDotDot(t) of the driver function
+        self.evaluateDriversF(group, tick)
+        group.gammaNp[:, 0] = group.driverNp[:, 2]
+    #  -------------------------------------------------------------------------
+    def rigid_AccKernel(self, group, tick):
+        if Debug:
+            DT.Mess("DapMainMod-rigid_AccKernel")
+        # gamma = - d0World * phiDot(TAIL)^2   [ and zero for the angle ]
+        d0World = self.rigidTAILVectorF(group)
+        self.gatherBodyScalarsF(self.phiDotNp, group)
+        group.scalarTAILNp *= group.scalarTAILNp
+        np.negative(group.scalarTAILNp, out=group.scalarTAILNp)
+        np.multiply(d0World, group.scalarTAILNp[:, np.newaxis], out=group.gammaNp[:, 0:2])
+    #  -------------------------------------------------------------------------
+    def zero_AccKernel(self, group, tick):
+        """gamma of this joint type is always zero, as filled in by JointGroupC"""
+        return
     #  -------------------------------------------------------------------------
     def revolute_translational_Acc(self, jointObject, tick):
         bodyHEADindex = jointObject.bodyHEADindex
@@ -1151,14 +2611,6 @@ class DapMainC:
                              self.pointVectorDotNp[bodyTAIL, pointTAIL] * self.phiDotNp[bodyTAIL])
         return f
     #  -------------------------------------------------------------------------
-    def rigid_Acc(self, jointObject, tick):
-        bodyTAIL = jointObject.bodyTAILindex
-        if bodyTAIL != 0:
-            tailVector = -self.RotMatPhiNp[bodyTAIL] @ (self.vecToNumpyF(jointObject.d0) * (self.phiDotNp[bodyTAIL]**2))
-            return np.array([tailVector[0], tailVector[1], 0.0])
-        else:
-            return np.array([0.0, 0.0, 0.0])
-    #  -------------------------------------------------------------------------
     def translational_Acc(self, jointObject, tick):
         bodyHEAD = jointObject.bodyHEADindex
         bodyTAIL = jointObject.bodyTAILindex
@@ -1191,10 +2643,6 @@ class DapMainC:
         else:
             return np.array([f2, 0.0])
     #  -------------------------------------------------------------------------
-    def relative_rotational_Acc(self, jointObject, tick):
-        [func, funcDot, funcDotDot] = DapFunctionMod.GetFofT(self.jointObject.FunctType, tick)
-        return funcDotDot
-    #  -------------------------------------------------------------------------
     def relative_translational_Acc(self, jointObject, tick):
         [func, funcDot, funcDotDot] = DapFunctionMod.GetFofT(self.jointObject.FunctType, tick)
         bodyHEAD = jointObject.bodyHEADindex
@@ -1213,81 +2661,149 @@ class DapMainC:
                 - diff.dot(self.Rot90NumpyF(self.pointVectorDotNp[bodyHEAD, pointHEAD]) * self.phiDotNp[bodyHEAD]) - diffDot.dot(diffDot)
         return f
     #  =========================================================================
-    def LinearSpringDamperActuator(self, forceObject):
-        bodyHEAD = forceObject.bodyHEADindex
-        bodyTAIL = forceObject.bodyTAILindex
-        # Get a dictionary of all points
-        pointHEAD = forceObject.pointHEADindex
-        pointTAIL = forceObject.pointTAILindex
-        diffVector = self.pointWorldNp[bodyHEAD, pointHEAD] - \
-            self.pointWorldNp[bodyTAIL, pointTAILindex]
-        diffVectorDot = self.pointWorldDotNp[bodyHEAD, pointHEAD] - \
-            self.pointWorldDotNp[bodyTAIL, pointTAILindex]
-        L = diffVector.Length
-        LDot = diffVector.dot(diffVectorDot) / L
-        delta = L - forceObject.Value0
-        unitDiffVector = diffVector / L
-        force = forceObject.Stiffness * delta + \
-            forceObject.DampingCoeff * LDot + \
-            forceObject.forceActuator
-
-        # Find the component of the force in the direction of
-        # the vector between the head and the tail of the force
-        forceProjection = force.dot(unitDiffVector)
-        if bodyHEAD != 0:
-            self.sumForcesNp[bodyHEAD] -= forceProjection
-            self.sumMomentsNp[bodyHEAD] -= self.Rot90NumpyF(self.pointVectorNp[bodyHEAD, pointHEAD]).dot(forceProjection)
-        if bodyTAIL != 0:
-            self.sumForcesNp[bodyTAIL] += forceProjection
-            self.sumMomentsNp[bodyTAIL] += self.Rot90NumpyF(self.pointVectorNp[bodyTAIL, pointTAIL]).dot(forceProjection)
-    # -------------------------------------------------------------------------
-    def RotationalSpringDamperActuator(self, forceObject):
-        bodyHEAD = forceObject.bodyHEADindex
-        bodyTAIL = forceObject.bodyTAILindex
-        if bodyHEAD == 0:
-            theta = -self.phiNp[bodyTAIL]
-            thetaDot = -self.phiDotNp[bodyTAIL]
-            Torque = forceObject.Stiffness * (theta - forceObject.Value0) + \
-                forceObject.DampingCoeff * thetaDot + \
-                forceObject.torqueActuator
-            self.sumMomentsNp[bodyTAIL] += Torque
-        elif bodyTAIL == 0:
-            theta = self.phiNp[bodyHEAD]
-            thetaDot = self.phiDotNp[bodyHEAD]
-            Torque = forceObject.Stiffness * (theta - forceObject.Value0) + \
-                forceObject.DampingCoeff * thetaDot + \
-                forceObject.torqueActuator
-            self.sumMomentsNp[bodyHEAD] -= Torque
-        else:
-            theta = self.phiNp[bodyHEAD] - self.phiNp[bodyTAIL]
-            thetadot = self.phiDotNp[bodyHEAD] - self.phiDotNp[bodyTAIL]
-            Torque = forceObject.Stiffness * (theta - forceObject.theta0) + \
-                forceObject.DampingCoeff * thetaDot + \
-                forceObject.torqueActuator
-            self.sumMomentsNp[bodyHEAD] -= Torque
-            self.sumMomentsNp[bodyTAIL] += Torque
-    # -------------------------------------------------------------------------
-    def futureImplementation(self, forceObject):
+    def linearSpring_ForceKernel(self, group):
+        """Spring, linear spring-damper and unilateral spring-damper between the
+        HEAD and TAIL points - positive force is tension"""
+        self.gatherPointsF(self.pointWorldNp, group)
+        np.subtract(group.vecHEADNp, group.vecTAILNp, out=group.diffNp)
+        self.gatherPointsF(self.pointWorldDotNp, group)
+        np.subtract(group.vecHEADNp, group.vecTAILNp, out=group.diffDotNp)
+        length = np.sqrt(np.einsum('ij,ij->i', group.diffNp, group.diffNp))
+        # Coincident points have no direction to push along
+        length = np.maximum(length, 1.0e-12)
+        unitVector = group.diffNp / length[:, np.newaxis]
+        lengthDot = np.einsum('ij,ij->i', unitVector, group.diffDotNp)
+        np.subtract(length, group.value0Np, out=group.deltaNp)
+        force = group.stiffnessNp * group.deltaNp + group.dampingNp * lengthDot + group.actuatorNp
+        # The unilateral ones only push, and only while compressed
+        if group.actuatorType == 5:
+            force = np.where(group.deltaNp < 0.0, np.minimum(force, 0.0), 0.0)
+        # The pull of the spring on the HEAD is towards the TAIL and vice versa
+        forceVector = unitVector * force[:, np.newaxis]
+        group.forceHEADNp[:, 0:2] = -forceVector
+        group.forceTAILNp[:, 0:2] = forceVector
+        self.gatherPointsF(self.pointVectorNp, group)
+        group.forceHEADNp[:, 2] = group.vecHEADNp[:, 1] * forceVector[:, 0] - group.vecHEADNp[:, 0] * forceVector[:, 1]
+        group.forceTAILNp[:, 2] = group.vecTAILNp[:, 0] * forceVector[:, 1] - group.vecTAILNp[:, 1] * forceVector[:, 0]
+    #  -------------------------------------------------------------------------
+    def rotationalSpring_ForceKernel(self, group):
+        """Rotational spring and rotational spring-damper between the HEAD and TAIL bodies"""
+        self.gatherBodyScalarsF(self.phiNp, group)
+        np.subtract(group.scalarHEADNp, group.scalarTAILNp, out=group.deltaNp)
+        group.deltaNp -= group.value0Np
+        self.gatherBodyScalarsF(self.phiDotNp, group)
+        torque = group.stiffnessNp * group.deltaNp + \
+            group.dampingNp * (group.scalarHEADNp - group.scalarTAILNp) + \
+            group.actuatorNp
+        group.forceHEADNp[:, 2] = -torque
+        group.forceTAILNp[:, 2] = torque
+    #  -------------------------------------------------------------------------
+    def localForce_ForceKernel(self, group):
+        """Constant force fixed in the coordinates of the HEAD body, acting at the HEAD point"""
+        forceVector = np.einsum('jik,jk->ji', self.RotMatPhiNp[group.bodyHEADNp], group.vectorNp)
+        group.forceHEADNp[:, 0:2] = forceVector
+        self.gatherPointsF(self.pointVectorNp, group)
+        group.forceHEADNp[:, 2] = group.vecHEADNp[:, 0] * forceVector[:, 1] - group.vecHEADNp[:, 1] * forceVector[:, 0]
+    #  -------------------------------------------------------------------------
+    def globalForce_ForceKernel(self, group):
+        """Constant force in a fixed global direction, acting at the HEAD point"""
+        self.gatherPointsF(self.pointVectorNp, group)
+        group.forceHEADNp[:, 2] = group.vecHEADNp[:, 0] * group.vectorNp[:, 1] - group.vecHEADNp[:, 1] * group.vectorNp[:, 0]
+    #  -------------------------------------------------------------------------
+    def torque_ForceKernel(self, group):
+        """Constant torque on the HEAD body [filled in once by compileForces]"""
         return
     #  -------------------------------------------------------------------------
-    def Contact(self, constraintIndex, indexPoint, bodyObj, kConst, eConst, FlagsList, penetrationDot0List, contact_LN_or_FM=True):
-        penetration = -bodyObj.pointWorldNp[indexPoint].y
-        if penetration > 0:
-            penetrationDot = -bodyObj.pointWorldDotNp[indexPoint].y
-            if FlagsList[constraintIndex] is False:
-                penetrationDot0List[constraintIndex] = penetrationDot
-                FlagsList[constraintIndex] = True
-
-            if contact_LN_or_FM is True:
-                forceY = Contact_LN(penetration, penetrationDot, penetrationDot0List[constraintIndex], kConst, eConst)
-            else:
-                forceY = Contact_FM(penetration, penetrationDot, penetrationDot0List[constraintIndex], kConst, eConst)
+    def motor_ForceKernel(self, group):
+        """Motor on the HEAD body reacting on the TAIL body, with a linear torque-speed
+        characteristic, less the air friction of the motor type which has it"""
+        self.gatherBodyScalarsF(self.phiDotNp, group)
+        speed = group.scalarHEADNp - group.scalarTAILNp
+        torque = group.actuatorNp * (1.0 - speed * group.inverseNoLoadSpeedNp) - \
+            group.airFrictionNp * speed * np.abs(speed)
+        group.forceHEADNp[:, 2] = torque
+        group.forceTAILNp[:, 2] = -torque
+    #  -------------------------------------------------------------------------
+    def springEnergyF(self):
+        """Potential energy [J] stored in all the linear and rotational springs"""
+        energy = 0.0
+        for group in self.forceGroupList:
+            if group.actuatorType in (1, 2, 3, 4):
+                energy += 0.5 * np.sum(group.stiffnessNp * group.deltaNp**2) * 1e-6
+            elif group.actuatorType == 5:
+                energy += 0.5 * np.sum(group.stiffnessNp * np.minimum(group.deltaNp, 0.0)**2) * 1e-6
+        return energy
+    #  -------------------------------------------------------------------------
+    def contactPenetrationF(self):
+        """Penetration of the contact points into the ground (y = 0) and its rate, the velocities
+        of the points and which of them are touching it, from the current point positions"""
+        pointWorld = np.take(self.pointWorldNp.reshape(-1, 2), self.contactFlatNp, axis=0)
+        pointWorldDot = np.take(self.pointWorldDotNp.reshape(-1, 2), self.contactFlatNp, axis=0)
+        penetration = -pointWorld[:, 1]
+        penetrationDot = -pointWorldDot[:, 1]
+        touching = penetration > 0.0
+        # With impact events, the penalty force only looks after the contacts which have come to rest
+        if self.contactMode == 1:
+            touching &= self.contactRestingNp
+        return penetration, penetrationDot, pointWorldDot, touching
+    #  -------------------------------------------------------------------------
+    def acceptContactsF(self, uArray):
+        """Latch the approach speed of the contact points coming down towards the ground, at the
+        state of an accepted step, for contactForcesF to use once they reach it [one which touches
+        the ground again while moving away keeps the approach speed of its last impact].
+        Never in the right-hand side, which is also called for the trial stages of rejected steps
+        and the perturbed states of the state Jacobian"""
+        if self.numContacts == 0:
+            return
+        self.unpackStateF(uArray)
+        penetration, penetrationDot, pointWorldDot, touching = self.contactPenetrationF()
+        approaching = ~touching & (penetrationDot > 0.0)
+        self.contactSpeed0Np[approaching] = penetrationDot[approaching]
+    #  -------------------------------------------------------------------------
+    def acceptedStepEventF(self, tick, uArray):
+        """A solve_ivp event which never fires: solve_ivp evaluates its events at the start and at the
+        end of every accepted step, which is where the approach speeds are latched by acceptContactsF"""
+        self.acceptContactsF(uArray)
+        return 1.0
+    #  -------------------------------------------------------------------------
+    def contactForcesF(self):
+        """Penalty force and friction of all the contact points penetrating the ground (y = 0) in one go"""
+        if Debug:
+            DT.Mess("DapMainMod-contactForcesF")
+        penetration, penetrationDot, pointWorldDot, touching = self.contactPenetrationF()
+        if not touching.any():
+            return
 
-            Friction = CAD.Vector(0.0, forceY, 0.0)
-            bodyObj.sumForces = bodyObj.sumForces + Friction
-            bodyObj.sumMoments = bodyObj.sumMoments + bodyObj.pVecRot[indexPoint].dot(Friction)
-        else:
-            FlagsList[constraintIndex] = False
+        # Normal force of the Lankarani-Nikravesh or Flores models, with the approach speeds
+        # latched by acceptContactsF before the points reached the ground
+        restitution = self.contactRestitutionNp
+        penetration = np.where(touching, penetration, 0.0)
+        speed0 = np.maximum(self.contactSpeed0Np, self.restingContactSpeed)
+        normalForce = np.where(self.contactModelNp == 0,
+                               self.Contact_LN(penetration, penetrationDot, speed0, self.contactStiffnessNp, restitution),
+                               self.Contact_FM(penetration, penetrationDot, speed0, self.contactStiffnessNp,
+                                               np.maximum(restitution, 1.0e-3)))
+        # The ground can only push
+        np.maximum(normalForce, 0.0, out=normalForce)
+
+        # Friction against the sliding velocity
+        slidingVel = pointWorldDot[:, 0]
+        mu_s, mu_d, mu_v, v_s, p, k_t, v_t, fnt = self.frictionParametersNp.T
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            frictionForce = np.where(self.frictionModelNp == 1,
+                                     self.Friction_A(mu_s, mu_d, v_s, p, k_t, slidingVel, normalForce),
+                                     np.where(self.frictionModelNp == 2,
+                                              self.Friction_B(mu_s, mu_d, mu_v, v_t, fnt, slidingVel, normalForce),
+                                              0.0))
+        frictionForce[~touching] = 0.0
+
+        # Add the forces and their moments about the CoG to the bodies
+        pointVector = np.take(self.pointVectorNp.reshape(-1, 2), self.contactFlatNp, axis=0)
+        np.subtract.at(self.sumForcesNp[:, 0], self.contactBodyNp, frictionForce)
+        np.add.at(self.sumForcesNp[:, 1], self.contactBodyNp, normalForce)
+        pointVector[:, 0] *= normalForce
+        pointVector[:, 1] *= frictionForce
+        np.add.at(self.sumMomentsNp, self.contactBodyNp, pointVector[:, 0] + pointVector[:, 1])
     #  -------------------------------------------------------------------------
     def Contact_FM(self, delta, deltaDot, deltaDot0, kConst, eConst):
         return kConst * (delta**1.5) * (1 + 8 * (1 - eConst) * deltaDot / (5 * eConst * deltaDot0))
@@ -1296,12 +2812,12 @@ class DapMainC:
         return kConst * (delta**1.5) * (1 + 3 * (1 - eConst * eConst) * deltaDot / (4 * deltaDot0))
     #  -------------------------------------------------------------------------
     def Friction_A(self, mu_s, mu_d, v_s, p, k_t, v, fN):
-        return fN * (mu_d + (mu_s - mu_d) * exp(-(abs(v) / v_s)**p)) * tanh(k_t * v)
+        return fN * (mu_d + (mu_s - mu_d) * np.exp(-(np.abs(v) / v_s)**p)) * np.tanh(k_t * v)
     #  -------------------------------------------------------------------------
     def Friction_B(self, mu_s, mu_d, mu_v, v_t, fnt, v, fN):
         vr = v / v_t
-        return fN * (mu_d * tanh(4 * vr) + (mu_s - mu_d) *
-                     vr / (0.25 * vr * vr + 0.75)**2) + mu_v * v * tanh(4 * fN / fnt)
+        return fN * (mu_d * np.tanh(4 * vr) + (mu_s - mu_d) *
+                     vr / (0.25 * vr * vr + 0.75)**2) + mu_v * v * np.tanh(4 * fN / fnt)
     #  =========================================================================
     def outputResults(self, timeValues, uResults):
         if Debug:
@@ -1309,7 +2825,6 @@ class DapMainC:
         # Compute body accelerations, Lagrange multipliers, coordinates and
         #    velocity of all points, kinetic and potential energies,
         #             at every reporting time interval
-        self.solverObj = CAD.ActiveDocument.findObjects(Name="^DapSolver$")[0]
         fileName = self.solverObj.Directory+"/"+self.solverObj.FileName+".csv"
         DapResultsFILE = open(fileName, 'w')
         numTicks = len(timeValues)
@@ -1378,202 +2893,176 @@ class DapMainC:
             else:
                 DapResultsFILE.write("\n")
 
-        # Do the calculations for each point in time
-        # Plus an extra one at time=0 (with no printing)
-        FirstTimeAround = True
-        VerticalCounter = 0
-        TickRange = [0]
-        TickRange += range(numTicks)
-        for timeIndex in TickRange:
-            tick = timeValues[timeIndex]
-            ColumnCounter = 0
-
-            # Do the analysis on the stored uResults
-            self.Analysis(tick, uResults[timeIndex])
-
-            # Write Time
-            if not FirstTimeAround:
-                DapResultsFILE.write(str(tick) + " ")
-
-            # Write All the Bodies position, positionDot, positionDotDot
-            for bodyIndex in range(1, self.numBodies):
-                if not FirstTimeAround:
-                    # Body Name vertically
-                    if VerticalCounter < len(VerticalHeaders[ColumnCounter]):
-                        character = VerticalHeaders[ColumnCounter][VerticalCounter]
-                        if character in "0123456789":
-                            DapResultsFILE.write("'" + character + "' ")
-                        else:
-                            DapResultsFILE.write(character + " ")
-                    else:
-                        DapResultsFILE.write("- ")
-                    ColumnCounter += 1
-                    # X Y
-                    DapResultsFILE.write(str(self.worldNp[bodyIndex]*1e-3) + " ")
-                    # Phi (rad)
-                    DapResultsFILE.write(str(self.phiNp[bodyIndex]) + " ")
-                    # Phi (deg)
-                    DapResultsFILE.write(str(self.phiNp[bodyIndex] * 180.0 / math.pi) + " ")
-                    # Xdot Ydot
-                    DapResultsFILE.write(str(self.worldDotNp[bodyIndex]*1e-3) + " ")
-                    # PhiDot (rad)
-                    DapResultsFILE.write(str(self.phiDotNp[bodyIndex]) + " ")
-                    # PhiDot (deg)
-                    DapResultsFILE.write(str(self.phiDotNp[bodyIndex] * 180.0 / math.pi) + " ")
-                    # Xdotdot Ydotdot
-                    DapResultsFILE.write(str(self.worldDotDotNp[bodyIndex]*1e-3) + " ")
-                    # PhiDotDot (rad)
-                    DapResultsFILE.write(str(self.phiDotDotNp[bodyIndex]) + " ")
-                    # PhiDotDot (deg)
-                    DapResultsFILE.write(str(self.phiDotDotNp[bodyIndex] * 180.0 / math.pi) + " ")
-
-                # Write all the points position and positionDot in the body
-                for index in range(self.numPointsInDict[bodyIndex]):
-                    if not FirstTimeAround:
-                        # Point Name vertically
-                        if VerticalCounter < len(VerticalHeaders[ColumnCounter]):
-                            character = VerticalHeaders[ColumnCounter][VerticalCounter]
-                            if character in "0123456789":
-                                DapResultsFILE.write("'" + character + "' ")
-                            else:
-                                DapResultsFILE.write(character + " ")
-                        else:
-                            DapResultsFILE.write("- ")
-                        ColumnCounter += 1
-                        # Point X Y
-                        DapResultsFILE.write(str(self.pointWorldNp[bodyIndex, index]*1e-3) + " ")
-                        # Point Xdot Ydot
-                        DapResultsFILE.write(str(self.pointWorldDotNp[bodyIndex, index]*1e-3) + " ")
-
-            # Write the Lambdas
-            if self.numConstraints > 0:
-                if not FirstTimeAround:
-                    # Lambda
-                    for bodyIndex in range(self.numMovBodies):
-                        # Body Name vertically
-                        if VerticalCounter < len(VerticalHeaders[ColumnCounter]):
-                            character = VerticalHeaders[ColumnCounter][VerticalCounter]
-                            if character in "0123456789":
-                                DapResultsFILE.write("'" + character + "' ")
-                            else:
-                                DapResultsFILE.write(character + " ")
-                        else:
-                            DapResultsFILE.write("- ")
-                        ColumnCounter += 1
-                        DapResultsFILE.write(str(self.Lambda[bodyIndex*2] * 1e-3) + " " + str(self.Lambda[bodyIndex*2 + 1] * 1e-3) + " ")
-
-            # Compute kinetic and potential energies in Joules
-            totKinEnergy = 0
-            for bodyIndex in range(1, self.numBodies):
-                kinEnergy = 0.5 * (
-                            (self.massArrayNp[(bodyIndex-1) * 3] *
-                            (self.worldDotNp[bodyIndex, 0] ** 2 + self.worldDotNp[bodyIndex, 1] ** 2))
-                            +
-                            (self.massArrayNp[(bodyIndex - 1) * 3 + 2] *
-                            (self.phiDotNp[bodyIndex] ** 2))
-                            ) * 1e-6
-
-                # Kinetic Energy (m^2 = mm^2 * 1e-6)
-                if not FirstTimeAround:
-                    # Body Name vertically
-                    if VerticalCounter < len(VerticalHeaders[ColumnCounter]):
-                        character = VerticalHeaders[ColumnCounter][VerticalCounter]
-                        if character in "0123456789":
-                            DapResultsFILE.write("'" + character + "' ")
-                        else:
-                            DapResultsFILE.write(character + " ")
-                    else:
-                        DapResultsFILE.write("- ")
-                    ColumnCounter += 1
-                    DapResultsFILE.write(str(kinEnergy) + " ")
-                totKinEnergy += kinEnergy
-
-            # Currently, calculate only gravitational potential energy
-            totPotEnergy = 0
-            for forceIndex in range(self.numForces):
-                forceObj = self.forceObjList[forceIndex]
-                # Potential Energy
-                if forceObj.actuatorType == 0:
-                    for bodyIndex in range(1, self.numBodies):
-                        potEnergy = -self.WeightNp[bodyIndex].dot(self.worldNp[bodyIndex]) * 1e-6 - self.potEnergyZeroPointNp[bodyIndex]
-                        totPotEnergy += potEnergy
-                        if FirstTimeAround:
-                            self.potEnergyZeroPointNp[bodyIndex] = potEnergy
-                        else:
-                            # Body Name vertically
-                            if VerticalCounter < len(VerticalHeaders[ColumnCounter]):
-                                character = VerticalHeaders[ColumnCounter][VerticalCounter]
-                                if character in "0123456789":
-                                    DapResultsFILE.write("'" + character + "' ")
-                                else:
-                                    DapResultsFILE.write(character + " ")
-                            else:
-                                DapResultsFILE.write("- ")
-                            ColumnCounter += 1
-                            DapResultsFILE.write(str(potEnergy) + " ")
-                elif forceObj.actuatorType == "Point-to-point":
-                    LinearSpringDamperActuator(forceObj)
-                    potEnergy += 0.5 * forceObj.k * delta**2
-                elif forceObj.actuatorType == "Rotational Spring Damper Actuator":
-                    RotationalSpringDamperActuator(forceObj)
-                elif forceObj.actuatorType == "Constant Local Force":
-                    bodyHEAD = forceObj.bodyHEADindex
-                    self.sumForcesNp[bodyHEAD] += self.RotMatPhiNp[bodyHEAD].multVec(forceObj.localForce)
-                    self.sumForcesNp[bodyHEAD] += self.RotMatPhiNp[bodyHEAD] * self.forceUnitLocalNp[bodyHEAD]
-                elif forceObj.actuatorType == "Constant Force":
-                    bodyHEAD = forceObj.bodyHEADindex
-                    self.sumForcesNp[bodyHEAD] += forceObj.constForce
-                elif forceObj.actuatorType == "Constant Torque":
-                    bodyHEAD = forceObj.bodyHEADindex
-                    self.sumMomentsNp[bodyHEAD] += forceObj.constTorque
-                elif forceObj.actuatorType == "Contact Friction":
-                    futureImplementation(forceObj)
-                elif forceObj.actuatorType == "Unilateral Spring Damper(Y)":
-                    futureImplementation(forceObj)
-                elif forceObj.actuatorType == "Unilateral Spring Damper(Z)":
-                    futureImplementation(forceObj)
-                elif forceObj.actuatorType == "Motor":
-                    futureImplementation(forceObj)
-                elif forceObj.actuatorType == "Motor-Air Friction":
-                    futureImplementation(forceObj)
-
-            if FirstTimeAround:
-                FirstTimeAround = False
-                VerticalCounter = 0
-            else:
-                DapResultsFILE.write(str(totKinEnergy) + " ")
-                DapResultsFILE.write(str(totPotEnergy) + " ")
-                DapResultsFILE.write(str(totKinEnergy + totPotEnergy) + " ")
-                DapResultsFILE.write("\n")
-                VerticalCounter += 1
-
-        # Next timeIndex
+        # The row format - a name column in front of each body/point block, filled in vertically
+        # with a character of the name on each of the first rows, and "-" after that
+        blockFormats = []
+        for bodyIndex in range(1, self.numBodies):
+            blockFormats.append(" ".join(["%.15g"] * 12))
+            blockFormats += [" ".join(["%.15g"] * 4)] * self.numPointsInDict[bodyIndex]
+        if self.numConstraints > 0:
+            blockFormats += ["%.15g %.15g"] * self.numMovBodies
+        blockFormats += ["%.15g"] * (len(VerticalHeaders) - len(blockFormats))
+
+        # The potential energies are relative to the first time
+        if numTicks > 0:
+            startPositionNp = np.asarray(uResults[0, 0: self.numMovBodiesx3]).reshape(self.numMovBodies, 3)
+            self.potEnergyZeroPointNp[1:] = -np.einsum('bi,bi->b', self.WeightNp[1:], startPositionNp[:, 0:2]) * 1e-6
+
+        # Work through the results a chunk at a time, so that a memory-mapped run need not all be in memory
+        # Each chunk is independent, so the chunks can be shared out over a pool of worker processes,
+        # with only a few chunks in flight at a time, and their lines written to the file in order
+        chunkSize = 1000
+        numWorkers = self.postProcessWorkers if self.postProcessWorkers > 0 else os.cpu_count()
+        chunkStartList = range(0, numTicks, chunkSize)
+        if numWorkers > 1 and len(chunkStartList) > 1:
+            with ProcessPoolExecutor(max_workers=numWorkers, initializer=initResultsWorker,
+                                     initargs=(pickle.dumps(self),)) as executor:
+                pendingChunks = deque()
+                for chunkStart in chunkStartList:
+                    pendingChunks.append(executor.submit(resultsTextWorker, chunkStart,
+                                                         np.asarray(timeValues[chunkStart: chunkStart + chunkSize]),
+                                                         np.asarray(uResults[chunkStart: chunkStart + chunkSize]),
+                                                         VerticalHeaders, blockFormats))
+                    if len(pendingChunks) >= 2 * numWorkers:
+                        DapResultsFILE.write(pendingChunks.popleft().result())
+                while len(pendingChunks) > 0:
+                    DapResultsFILE.write(pendingChunks.popleft().result())
+        else:
+            for chunkStart in chunkStartList:
+                DapResultsFILE.write(self.resultsTextF(chunkStart,
+                                                       np.asarray(timeValues[chunkStart: chunkStart + chunkSize]),
+                                                       np.asarray(uResults[chunkStart: chunkStart + chunkSize]),
+                                                       VerticalHeaders, blockFormats))
 
         DapResultsFILE.close()
     #  -------------------------------------------------------------------------
+    def resultsTextF(self, chunkStart, timeValues, uResults, VerticalHeaders, blockFormats):
+        """The lines of the results file for the chunk of times starting at row chunkStart"""
+        if Debug:
+            DT.Mess("DapMainMod-resultsTextF")
+        tableNp = self.resultsTableF(timeValues, uResults)
+        chunkFILE = io.StringIO()
+        # The rows with a character of some name in them get a format of their own
+        maxNameLength = max([len(name) for name in VerticalHeaders], default=0)
+        numNamedRows = max(0, min(len(tableNp), maxNameLength - chunkStart))
+        for rowIndex in range(numNamedRows):
+            VerticalCounter = chunkStart + rowIndex
+            nameList = []
+            for name in VerticalHeaders:
+                if VerticalCounter < len(name):
+                    character = name[VerticalCounter].replace("%", "%%")
+                    nameList.append("'" + character + "'" if character in "0123456789" else character)
+                else:
+                    nameList.append("-")
+            rowFormat = "%.15g " + " ".join([nameList[column] + " " + blockFormats[column]
+                                             for column in range(len(VerticalHeaders))]) + " %.15g %.15g %.15g "
+            chunkFILE.write(rowFormat % tuple(tableNp[rowIndex]) + "\n")
+        # and the rest all in one go
+        rowFormat = "%.15g " + " ".join(["- " + blockFormat for blockFormat in blockFormats]) + " %.15g %.15g %.15g "
+        np.savetxt(chunkFILE, tableNp[numNamedRows:], fmt=rowFormat)
+        return chunkFILE.getvalue()
+    #  -------------------------------------------------------------------------
+    def resultsTableF(self, timeValues, uResults):
+        """All the columns of the results file for a run of times, as a 2-D array:
+        time, body coordinates, velocities and accelerations, point coordinates and velocities,
+        Lagrange multipliers, kinetic and potential energies and their totals [SI units].
+        Only the accelerations and Lagrange multipliers are evaluated time by time"""
+        if Debug:
+            DT.Mess("DapMainMod-resultsTableF")
+        numTicks = len(timeValues)
+        positionNp = uResults[:, 0: self.numMovBodiesx3].reshape(numTicks, self.numMovBodies, 3)
+        velocityNp = uResults[:, self.numMovBodiesx3:].reshape(numTicks, self.numMovBodies, 3)
+
+        # The accelerations and Lagrange multipliers are solved for time by time, in the
+        # same way (and with the same workspace) as in Analysis, so a chunk only ever
+        # holds one Jacobian, whether it is sparse or dense, however many bodies there are
+        accelNp = np.zeros((numTicks, self.numMovBodiesx3,), dtype=np.float64)
+        lambdaNp = np.zeros((numTicks, max(self.numConstraints, 2 * self.numMovBodies),), dtype=np.float64)
+        springEnergyNp = np.zeros((numTicks,), dtype=np.float64)
+        for timeIndex in range(numTicks):
+            self.unpackStateF(uResults[timeIndex])
+            self.makeForceArray()
+            springEnergyNp[timeIndex] = self.springEnergyF()
+            if self.numConstraints == 0:
+                np.multiply(self.massInvArrayNp, self.forceArrayNp, out=accelNp[timeIndex])
+                continue
+            if self.sparseJacobian:
+                Jacobian = self.getSparseJacobianF()
+            else:
+                Jacobian = self.getJacobianF()
+            rhsAccel = self.stabilisedRHSAccF(timeValues[timeIndex])
+            if self.accelerationSolver == 1:
+                accelNp[timeIndex], lambdaNp[timeIndex, 0: self.numConstraints] = \
+                    self.schurSolveF(Jacobian, rhsAccel)
+            else:
+                accelNp[timeIndex], lambdaNp[timeIndex, 0: self.numConstraints] = \
+                    self.augmentedSolveF(Jacobian, rhsAccel)
+        accelNp = accelNp.reshape(numTicks, self.numMovBodies, 3)
+
+        # Point coordinates and velocities of every point of every body at every time
+        cosPhi = np.cos(positionNp[:, :, 2])[:, :, np.newaxis]
+        sinPhi = np.sin(positionNp[:, :, 2])[:, :, np.newaxis]
+        pointLocal = self.pointLocalNp[1:]
+        pointVectorX = cosPhi * pointLocal[:, :, 0] - sinPhi * pointLocal[:, :, 1]
+        pointVectorY = sinPhi * pointLocal[:, :, 0] + cosPhi * pointLocal[:, :, 1]
+        pointX = positionNp[:, :, 0:1] + pointVectorX
+        pointY = positionNp[:, :, 1:2] + pointVectorY
+        pointXDot = velocityNp[:, :, 0:1] - velocityNp[:, :, 2:3] * pointVectorY
+        pointYDot = velocityNp[:, :, 1:2] + velocityNp[:, :, 2:3] * pointVectorX
+
+        # Energies in Joules (m^2 = mm^2 * 1e-6)
+        massNp = self.massArrayNp.reshape(self.numMovBodies, 3)
+        kinEnergyNp = 0.5 * (massNp[:, 0] * (velocityNp[:, :, 0]**2 + velocityNp[:, :, 1]**2) +
+                             massNp[:, 2] * velocityNp[:, :, 2]**2) * 1e-6
+        potEnergyNp = -np.einsum('bi,tbi->tb', self.WeightNp[1:], positionNp[:, :, 0:2]) * 1e-6 - \
+            self.potEnergyZeroPointNp[1:]
+
+        # Lay the columns out in the order of the headings
+        columnList = [timeValues]
+        for bodyIndex in range(self.numMovBodies):
+            columnList += [positionNp[:, bodyIndex, 0] * 1e-3, positionNp[:, bodyIndex, 1] * 1e-3,
+                           positionNp[:, bodyIndex, 2], np.degrees(positionNp[:, bodyIndex, 2]),
+                           velocityNp[:, bodyIndex, 0] * 1e-3, velocityNp[:, bodyIndex, 1] * 1e-3,
+                           velocityNp[:, bodyIndex, 2], np.degrees(velocityNp[:, bodyIndex, 2]),
+                           accelNp[:, bodyIndex, 0] * 1e-3, accelNp[:, bodyIndex, 1] * 1e-3,
+                           accelNp[:, bodyIndex, 2], np.degrees(accelNp[:, bodyIndex, 2])]
+            for index in range(self.numPointsInDict[bodyIndex + 1]):
+                columnList += [pointX[:, bodyIndex, index] * 1e-3, pointY[:, bodyIndex, index] * 1e-3,
+                               pointXDot[:, bodyIndex, index] * 1e-3, pointYDot[:, bodyIndex, index] * 1e-3]
+        if self.numConstraints > 0:
+            for bodyIndex in range(self.numMovBodies):
+                columnList += [lambdaNp[:, bodyIndex * 2] * 1e-3, lambdaNp[:, bodyIndex * 2 + 1] * 1e-3]
+        columnList += [kinEnergyNp[:, bodyIndex] for bodyIndex in range(self.numMovBodies)]
+        for gravityIndex in range(self.numGravity):
+            columnList += [potEnergyNp[:, bodyIndex] for bodyIndex in range(self.numMovBodies)]
+        totKinEnergyNp = kinEnergyNp.sum(axis=1)
+        totPotEnergyNp = self.numGravity * potEnergyNp.sum(axis=1) + springEnergyNp
+        columnList += [totKinEnergyNp, totPotEnergyNp, totKinEnergyNp + totPotEnergyNp]
+        return np.column_stack(columnList)
+    #  -------------------------------------------------------------------------
     def makeForceArray(self):
         if Debug:
             DT.Mess("makeForceArray")
-        # Reset all forces and moments to zero
-        for bodyIndex in range(1, self.numBodies):
-            self.sumForcesNp[bodyIndex] = np.zeros((2,), dtype=np.float64)
-            self.sumMomentsNp[bodyIndex] = np.zeros((1,), dtype=np.float64)
-        # Add up all the body force vectors for all the bodies
-        for forceIndex in range(self.numForces):
-            forceObj = self.forceObjList[forceIndex]
-            if forceObj.actuatorType == 0:
-                for bodyIndex in range(1, self.numBodies):
-                    self.sumForcesNp[bodyIndex] += self.WeightNp[bodyIndex]
-            # Handle all the other forces CLCCLCCLC
-
-        # Next forceIndex
+        # Start with the weight of all the bodies, once for every gravity force
+        np.multiply(self.WeightNp, self.numGravity, out=self.sumForcesNp)
+        self.sumMomentsNp[:] = 0.0
+        # Evaluate every group of force elements, then add all their HEAD and TAIL
+        # terms to the bodies in one scatter-add [terms on the ground fall into its row 0]
+        if len(self.forceGroupList) > 0:
+            for group in self.forceGroupList:
+                self.dictForceKernels[group.actuatorType](group)
+            np.add.at(self.sumForcesNp, self.forceTermBodyNp, self.forceTermForceNp)
+            np.add.at(self.sumMomentsNp, self.forceTermBodyNp, self.forceTermMomentNp)
+
+        # Contact with the ground of all the contact points at once
+        if self.numContacts > 0:
+            self.contactForcesF()
 
         # The force array has three values for every body
         # x and y are the sum of forces in Np and z is the sum of moments
         # Store all the bodies force/moments into the ForceArray
-        for bodyIndex in range(1, self.numBodies):
-            self.forceArrayNp[(bodyIndex - 1) * 3: bodyIndex * 3 - 1] = self.sumForcesNp[bodyIndex]
-            self.forceArrayNp[bodyIndex * 3 - 1] = self.sumMomentsNp[bodyIndex]
+        self.forceArray3Np[:, 0:2] = self.sumForcesNp[1:]
+        self.forceArray3Np[:, 2] = self.sumMomentsNp[1:]
         if Debug:
             DT.MessNoLF("Force Array:  ")
             DT.Np1D(True, self.forceArrayNp)
@@ -1606,10 +3095,54 @@ class DapMainC:
         self.forceUnitLocalNp = np.zeros((self.numForces, 2,), dtype=np.float64)
         self.forceUnitWorldNp = np.zeros((self.numForces, 2,), dtype=np.float64)
         self.forceUnitWorldRotNp = np.zeros((self.numForces, 2,), dtype=np.float64)
+        self.forceUnitWorldDotNp = np.zeros((self.numForces, 2,), dtype=np.float64)
 
         self.forceArrayNp = np.zeros((self.numMovBodiesx3,), dtype=np.float64)
         self.potEnergyZeroPointNp = np.zeros((self.numBodies,), dtype=np.float64)
     #  -------------------------------------------------------------------------
+    def initWorkspace(self):
+        """Allocate, once we know numConstraints, all the buffers which
+        Analysis and the functions it calls write into in place, so that evaluating
+        the r-h-s only makes small temporaries [and the copy of uDot it returns]"""
+        if Debug:
+            DT.Mess("DapMainMod-initWorkspace")
+        numBodPlusConstr = self.numMovBodiesx3 + self.numConstraints
+        # State vector and its derivative, with [x, y, phi] per body views into each half
+        self.uArrayNp = np.zeros((self.numMovBodies * 6,), dtype=np.float64)
+        self.uPositionNp = self.uArrayNp[0: self.numMovBodiesx3].reshape(self.numMovBodies, 3)
+        self.uVelocityNp = self.uArrayNp[self.numMovBodiesx3:].reshape(self.numMovBodies, 3)
+        self.uDotArrayNp = np.zeros((self.numMovBodies * 6,), dtype=np.float64)
+        self.uDotPositionNp = self.uDotArrayNp[0: self.numMovBodiesx3].reshape(self.numMovBodies, 3)
+        self.uDotVelocityNp = self.uDotArrayNp[self.numMovBodiesx3:].reshape(self.numMovBodies, 3)
+        self.accelNp = np.zeros((self.numMovBodiesx3,), dtype=np.float64)
+        self.forceArray3Np = self.forceArrayNp.reshape(self.numMovBodies, 3)
+        # [Fx, Fy] and moment columns of the HEAD and TAIL terms of the force groups, for the scatter-add
+        self.forceTermForceNp = self.forceTermNp[:, 0:2]
+        self.forceTermMomentNp = self.forceTermNp[:, 2]
+        # Forces with a unit vector rotating with a moving body
+        numRotating = len(self.forceRotatingNp)
+        self.forceUnitLocalRotatingNp = self.forceUnitLocalNp[self.forceRotatingNp]
+        self.forceRotMatNp = np.zeros((numRotating, 2, 2,), dtype=np.float64)
+        self.forceUnitRotatingNp = np.zeros((numRotating, 2,), dtype=np.float64)
+        self.forceUnitRotatingRotNp = np.zeros((numRotating, 2,), dtype=np.float64)
+        self.forceUnitRotatingDotNp = np.zeros((numRotating, 2,), dtype=np.float64)
+        self.forcePhiDotNp = np.zeros((numRotating,), dtype=np.float64)
+        # Constraints, r-h-s of the acceleration constraints and the dense Jacobian
+        self.constraintNp = np.zeros((self.numConstraints,), dtype=np.float64)
+        self.rhsAccNp = np.zeros((self.numConstraints,), dtype=np.float64)
+        self.rhsVelNp = np.zeros((self.numConstraints,), dtype=np.float64)
+        self.constraintVelNp = np.zeros((self.numConstraints,), dtype=np.float64)
+        self.jacobianWeightsNp = np.zeros((len(self.jacobianDataNp),), dtype=np.float64)
+        self.jacobianDenseNp = np.zeros((self.numConstraints, self.numMovBodiesx3,), dtype=np.float64)
+        # Augmented matrix solution - Fortran ordered so LAPACK can factorise it in place
+        self.augmentedMatrixNp = np.zeros((numBodPlusConstr, numBodPlusConstr,), dtype=np.float64, order='F')
+        self.augmentedDiagonalNp = np.einsum('ii->i', self.augmentedMatrixNp)
+        self.augmentedRhsNp = np.zeros((numBodPlusConstr,), dtype=np.float64)
+        # Schur complement solution
+        self.jacMassInvNp = np.zeros((self.numConstraints, self.numMovBodiesx3,), dtype=np.float64)
+        self.schurMatrixNp = np.zeros((self.numConstraints, self.numConstraints,), dtype=np.float64)
+        self.rhsLambdaNp = np.zeros((self.numConstraints,), dtype=np.float64)
+    #  -------------------------------------------------------------------------
     def nicePhiPlease(self, vectorsRelativeCoG):
 
         # Start off by looking at the longest vector and its orientation
@@ -1729,10 +3262,232 @@ class DapMainC:
         return b
     #  -------------------------------------------------------------------------
     def __getstate__(self):
+        """Pickle the model without the FreeCAD solver object, so that it can be sent to
+        worker processes [the bodies, joints and forces are already plain snapshots]
+        - the interpolant of the run is left out too"""
         if Debug:
-            DT.Mess("TaskPanelDapMainC-__getstate__")
+            DT.Mess("DapMainC-__getstate__")
+        state = self.__dict__.copy()
+        state["solverObj"] = None
+        state["denseSolution"] = None
+        return state
     #  -------------------------------------------------------------------------
     def __setstate__(self, state):
         if Debug:
-            DT.Mess("TaskPanelDapMainC-__setstate__")
+            DT.Mess("DapMainC-__setstate__")
+        self.__dict__.update(state)
+        # Views into other arrays come out of the pickle as arrays of their own, so make them again
+        self.jacobianDataNp = self.jacobianSlotsNp[0: self.jacobianTrashSlot]
+        termStart = 0
+        for group in self.forceGroupList:
+            group.forceHEADNp = self.forceTermNp[termStart: termStart + group.numForces]
+            group.forceTAILNp = self.forceTermNp[termStart + group.numForces: termStart + 2 * group.numForces]
+            termStart += 2 * group.numForces
+        self.initWorkspace()
+    #  -------------------------------------------------------------------------
+# =============================================================================
+class JointGroupC:
+    """All the joints of one type and number of constraints, compiled into
+    NumPy index and parameter arrays for the batched kernels in DapMainC"""
     #  -------------------------------------------------------------------------
+    def __init__(self, mainObj, jointType, mConstraints, jointIndexList):
+        if Debug:
+            DT.Mess("JointGroupC-__init__")
+        jointObjList = [mainObj.jointObjList[jointIndex] for jointIndex in jointIndexList]
+        self.jointType = jointType
+        self.mConstraints = mConstraints
+        self.numJoints = len(jointIndexList)
+        self.jointIndexNp = np.array(jointIndexList, dtype=np.int64)
+
+        # Body and point indices, and flat indices into the [body, point] arrays
+        self.bodyHEADNp = np.array([jointObj.bodyHEADindex for jointObj in jointObjList], dtype=np.int64)
+        self.bodyTAILNp = np.array([jointObj.bodyTAILindex for jointObj in jointObjList], dtype=np.int64)
+        self.pointHEADNp = np.array([jointObj.pointHEADindex for jointObj in jointObjList], dtype=np.int64)
+        self.pointTAILNp = np.array([jointObj.pointTAILindex for jointObj in jointObjList], dtype=np.int64)
+        self.pointHEADFlatNp = self.bodyHEADNp * mainObj.maxNumPoints + self.pointHEADNp
+        self.pointTAILFlatNp = self.bodyTAILNp * mainObj.maxNumPoints + self.pointTAILNp
+        # 1.0 if the body is moving and 0.0 if it is the ground
+        self.headMovingNp = (self.bodyHEADNp != 0).astype(np.float64)
+        self.tailMovingNp = (self.bodyTAILNp != 0).astype(np.float64)
+        self.tailGroundNp = self.bodyTAILNp == 0
+        # Rows of each joint in the constraint vector
+        self.rowNp = np.array([range(jointObj.rowStart, jointObj.rowEnd) for jointObj in jointObjList],
+                              dtype=np.int64).reshape(self.numJoints, mConstraints)
+
+        # Joint parameters
+        self.phi0Np = np.array([jointObj.phi0 for jointObj in jointObjList], dtype=np.float64)
+        self.lengthLinkNp = np.array([jointObj.lengthLink for jointObj in jointObjList], dtype=np.float64)
+        self.radiusNp = np.array([jointObj.Radius for jointObj in jointObjList], dtype=np.float64)
+        self.x0Np = np.array([jointObj.world0[0] for jointObj in jointObjList], dtype=np.float64)
+        self.d0Np = np.array([jointObj.d0[0: 2] for jointObj in jointObjList], dtype=np.float64)
+        self.driverList = [mainObj.driverObjDict.get(jointObj.Name) for jointObj in jointObjList]
+
+        # Slots of the HEAD and TAIL blocks in DapMainC.jacobianSlotsNp
+        # The blocks of the ground body go to the trash block at the end
+        blockNp = np.arange(mConstraints * 3, dtype=np.int64).reshape(mConstraints, 3)
+        slotNp = mainObj.jacHEADSlotNp[self.jointIndexNp]
+        slotNp = np.where(slotNp < 0, mainObj.jacobianTrashSlot, slotNp)
+        self.jacHEADSlotNp = slotNp[:, np.newaxis, np.newaxis] + blockNp
+        slotNp = mainObj.jacTAILSlotNp[self.jointIndexNp]
+        slotNp = np.where(slotNp < 0, mainObj.jacobianTrashSlot, slotNp)
+        self.jacTAILSlotNp = slotNp[:, np.newaxis, np.newaxis] + blockNp
+
+        # Results of the kernels
+        self.constraintNp = np.zeros((self.numJoints, mConstraints,), dtype=np.float64)
+        self.gammaNp = np.zeros((self.numJoints, mConstraints,), dtype=np.float64)
+        self.jacHEADNp = np.zeros((self.numJoints, mConstraints, 3,), dtype=np.float64)
+        self.jacTAILNp = np.zeros((self.numJoints, mConstraints, 3,), dtype=np.float64)
+        # Workspace of the kernels
+        self.vecHEADNp = np.zeros((self.numJoints, 2,), dtype=np.float64)
+        self.vecTAILNp = np.zeros((self.numJoints, 2,), dtype=np.float64)
+        self.diffNp = np.zeros((self.numJoints, 2,), dtype=np.float64)
+        self.diffDotNp = np.zeros((self.numJoints, 2,), dtype=np.float64)
+        self.d0WorldNp = np.zeros((self.numJoints, 2,), dtype=np.float64)
+        self.rotMatTAILNp = np.zeros((self.numJoints, 2, 2,), dtype=np.float64)
+        self.scalarHEADNp = np.zeros((self.numJoints,), dtype=np.float64)
+        self.scalarTAILNp = np.zeros((self.numJoints,), dtype=np.float64)
+        self.scalarNp = np.zeros((self.numJoints,), dtype=np.float64)
+        self.driverNp = np.zeros((self.numJoints, 3,), dtype=np.float64)
+
+        # Fill in the entries of the Jacobian blocks which never change
+        if jointType == 0:  # 'Rotation'
+            self.jacHEADNp[:, 0, 0] = self.jacHEADNp[:, 1, 1] = 1.0
+            self.jacTAILNp[:, 0, 0] = self.jacTAILNp[:, 1, 1] = -1.0
+            if mConstraints == 3:
+                self.jacHEADNp[:, 2, 2] = 1.0
+                self.jacTAILNp[:, 2, 2] = -1.0
+        elif jointType == 4:  # 'Driven-Rotation'
+            self.jacHEADNp[:, 0, 2] = 1.0
+            self.jacTAILNp[:, 0, 2] = -1.0
+        elif jointType == 6:  # 'Disc'
+            self.jacHEADNp[:, 0, 1] = 1.0
+            self.jacHEADNp[:, 1, 0] = 1.0
+            self.jacHEADNp[:, 1, 2] = self.radiusNp
+        elif jointType == 7:  # 'Rigid'
+            self.jacHEADNp[:, 0, 0] = self.jacHEADNp[:, 1, 1] = self.jacHEADNp[:, 2, 2] = 1.0
+            self.jacTAILNp[:, 0, 0] = self.jacTAILNp[:, 1, 1] = self.jacTAILNp[:, 2, 2] = -1.0
+#  =============================================================================
+class HermiteDenseOutputC(DenseOutput):
+    """Cubic Hermite interpolant over one step, from the states and their derivatives
+    at both ends - the dense output of the integration modes which do not have their own"""
+    #  -------------------------------------------------------------------------
+    def __init__(self, tickOld, tick, uOld, u, uDotOld, uDot):
+        super().__init__(tickOld, tick)
+        self.h = tick - tickOld
+        self.uOld = uOld
+        self.u = u
+        self.uDotOld = uDotOld
+        self.uDot = uDot
+    #  -------------------------------------------------------------------------
+    def _call_impl(self, t):
+        s = (np.asarray(t) - self.t_old) / self.h
+        s2 = s * s
+        s3 = s2 * s
+        h00 = 2.0 * s3 - 3.0 * s2 + 1.0
+        h10 = (s3 - 2.0 * s2 + s) * self.h
+        h01 = 3.0 * s2 - 2.0 * s3
+        h11 = (s3 - s2) * self.h
+        return np.multiply.outer(self.uOld, h00) + np.multiply.outer(self.uDotOld, h10) + \
+            np.multiply.outer(self.u, h01) + np.multiply.outer(self.uDot, h11)
+#  =============================================================================
+class ForceGroupC:
+    """All the forces of one actuatorType, compiled into
+    NumPy index and parameter arrays for the batched force kernels in DapMainC"""
+    #  -------------------------------------------------------------------------
+    def __init__(self, mainObj, actuatorType, forceIndexList):
+        if Debug:
+            DT.Mess("ForceGroupC-__init__")
+        forceObjList = [mainObj.forceObjList[forceIndex] for forceIndex in forceIndexList]
+        self.actuatorType = actuatorType
+        self.numForces = len(forceIndexList)
+        self.forceIndexNp = np.array(forceIndexList, dtype=np.int64)
+
+        # Body and point indices, and flat indices into the [body, point] arrays
+        self.bodyHEADNp = np.array([forceObj.bodyHEADindex for forceObj in forceObjList], dtype=np.int64)
+        self.bodyTAILNp = np.array([forceObj.bodyTAILindex for forceObj in forceObjList], dtype=np.int64)
+        self.pointHEADNp = np.array([forceObj.pointHEADindex for forceObj in forceObjList], dtype=np.int64)
+        self.pointTAILNp = np.array([forceObj.pointTAILindex for forceObj in forceObjList], dtype=np.int64)
+        self.pointHEADFlatNp = self.bodyHEADNp * mainObj.maxNumPoints + self.pointHEADNp
+        self.pointTAILFlatNp = self.bodyTAILNp * mainObj.maxNumPoints + self.pointTAILNp
+        # 1.0 if the body is moving and 0.0 if it is the ground
+        self.headMovingNp = (self.bodyHEADNp != 0).astype(np.float64)
+        self.tailMovingNp = (self.bodyTAILNp != 0).astype(np.float64)
+
+        # Force parameters - the plain springs [types 1 and 2] have no damping
+        self.stiffnessNp = np.array([forceObj.Stiffness for forceObj in forceObjList], dtype=np.float64)
+        self.dampingNp = np.array([forceObj.DampingCoeff for forceObj in forceObjList], dtype=np.float64)
+        if actuatorType in (1, 2):
+            self.dampingNp[:] = 0.0
+        self.value0Np = np.array([forceObj.Value0 for forceObj in forceObjList], dtype=np.float64)
+        if actuatorType in (2, 4, 10, 11):
+            self.actuatorNp = np.array([forceObj.torqueActuator for forceObj in forceObjList], dtype=np.float64)
+        else:
+            self.actuatorNp = np.array([forceObj.forceActuator for forceObj in forceObjList], dtype=np.float64)
+        if actuatorType == 6:
+            self.vectorNp = np.array([forceObj.localForce[0: 2]
+                                      for forceObj in forceObjList], dtype=np.float64)
+        else:
+            self.vectorNp = np.array([forceObj.constForce[0: 2]
+                                      for forceObj in forceObjList], dtype=np.float64)
+        self.torqueNp = np.array([forceObj.constTorque for forceObj in forceObjList], dtype=np.float64)
+        # A motor with no no-load speed gives a constant torque
+        noLoadSpeedNp = np.array([forceObj.NoLoadSpeed for forceObj in forceObjList], dtype=np.float64)
+        self.inverseNoLoadSpeedNp = np.divide(1.0, noLoadSpeedNp, out=np.zeros_like(noLoadSpeedNp),
+                                              where=noLoadSpeedNp != 0.0)
+        self.airFrictionNp = np.array([forceObj.AirFriction for forceObj in forceObjList], dtype=np.float64)
+        if actuatorType != 11:
+            self.airFrictionNp[:] = 0.0
+
+        # [Fx, Fy, moment] on the HEAD and TAIL bodies - views into DapMainC.forceTermNp set by compileForces
+        self.forceHEADNp = np.zeros((self.numForces, 3,), dtype=np.float64)
+        self.forceTAILNp = np.zeros((self.numForces, 3,), dtype=np.float64)
+        # Workspace of the kernels
+        self.vecHEADNp = np.zeros((self.numForces, 2,), dtype=np.float64)
+        self.vecTAILNp = np.zeros((self.numForces, 2,), dtype=np.float64)
+        self.diffNp = np.zeros((self.numForces, 2,), dtype=np.float64)
+        self.diffDotNp = np.zeros((self.numForces, 2,), dtype=np.float64)
+        self.scalarHEADNp = np.zeros((self.numForces,), dtype=np.float64)
+        self.scalarTAILNp = np.zeros((self.numForces,), dtype=np.float64)
+        # Deflection of the springs [also used for their potential energy]
+        self.deltaNp = np.zeros((self.numForces,), dtype=np.float64)
+# =============================================================================
+class ObjectSnapshotC:
+    """A body, joint, force or solver of a model snapshot, with the plain property values
+    of the FreeCAD document object it came from as attributes, so that it reads the same"""
+    #  -------------------------------------------------------------------------
+    def __init__(self, propertyDict):
+        if Debug:
+            DT.Mess("ObjectSnapshotC-__init__")
+        for propertyName in propertyDict:
+            setattr(self, propertyName, propertyDict[propertyName])
+# =============================================================================
+def main(argumentList=None):
+    """Solve a model snapshot headless, without FreeCAD or Qt, and write the usual result files:
+    python -m DapMainMod DapModel.dapjson --end 10 --dt 0.001"""
+    parser = argparse.ArgumentParser(prog="python -m DapMainMod",
+                                     description="Solve a NikraDAP model snapshot [" + MODEL_SNAPSHOT_FILE +
+                                                 ", written with the results of every solve] without FreeCAD")
+    parser.add_argument("snapshot", help="the .dapjson model snapshot")
+    parser.add_argument("--end", type=float, help="length of the analysis [s] - default from the snapshot")
+    parser.add_argument("--dt", type=float, help="time between the reported results [s] - default from the snapshot")
+    parser.add_argument("--directory", help="directory to write the results to - default that of the snapshot")
+    parser.add_argument("--name", help="file name of the results spreadsheet [- for none] - default from the snapshot")
+    arguments = parser.parse_args(argumentList)
+
+    snapshot = readModelSnapshot(arguments.snapshot)
+    solverDict = snapshot["solver"]
+    if arguments.directory is not None:
+        solverDict["Directory"] = arguments.directory
+    else:
+        solverDict["Directory"] = os.path.dirname(os.path.abspath(arguments.snapshot))
+    if arguments.name is not None:
+        solverDict["FileName"] = arguments.name
+
+    mainObj = DapMainC.fromSnapshot(snapshot, arguments.end, arguments.dt)
+    if mainObj.initialised is not True:
+        return 1
+    mainObj.MainSolve()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -147,6 +147,7 @@ class DapMaterialC:
         DT.addObjectProperty(materialObject, "materialsNameList", [], "App::PropertyStringList", "", "List of matching Material Names")
         DT.addObjectProperty(materialObject, "materialsDensityList", [], "App::PropertyFloatList", "", "List of matching Density values")
         DT.addObjectProperty(materialObject, "kgm3ORgcm3", True, "App::PropertyBool", "", "Density units kg/m^3 or g/cm^3")
+        DT.addObjectProperty(materialObject, "massPropertiesCache", "", "App::PropertyString", "", "Mass properties of the solids [JSON] - only solids whose geometry has changed are computed again")
     #  -------------------------------------------------------------------------
     def onDocumentRestored(self, materialObject):
         if Debug:
@@ -159,6 +160,13 @@ class DapMaterialC:
         if Debug:
             CAD.Console.PrintMessage("DapMaterialC-execute\n")
     #  -------------------------------------------------------------------------
+    def onChanged(self, materialObject, prop):
+        """The densities have changed [the cache of the mass properties is kept up-to-date by the solve itself]"""
+        # if Debug:
+        #    CAD.Console.PrintMessage("DapMaterialC-onChanged\n")
+        if prop != "massPropertiesCache":
+            DT.invalidateModelSnapshot(materialObject)
+    #  -------------------------------------------------------------------------
     def __getstate__(self):
         if Debug:
             CAD.Console.PrintMessage("DapMaterialC-__getstate__\n")
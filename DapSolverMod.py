@@ -58,7 +58,7 @@
 import FreeCAD as CAD
 
 from os import path, getcwd
-from math import sin, cos, tan, asin, acos, atan2, pi
+from math import sin, cos, tan, asin, acos, atan2, pi, log10
 
 import DapToolsMod as DT
 import DapMainMod
@@ -165,9 +165,21 @@ class DapSolverC:
 
         # Set up the initial properties of the Dap Solver
         self.initProperties(solverObject)
+        self.initModelSnapshot()
 
         solverObject.Proxy = self
     #  -------------------------------------------------------------------------
+    def initModelSnapshot(self):
+        """The model extracted from the document by the last solve, kept [but not saved with the document]
+        so that solving again with only the solver settings changed need not extract it again.
+        The bodies, joints, forces, material and container drop it when they change"""
+
+        if Debug:
+            DT.Mess("DapSolverC-initModelSnapshot")
+
+        self.modelSnapshot = None
+        self.solidsFingerprint = None
+    #  -------------------------------------------------------------------------
     def initProperties(self, solverObject):
         """Initialse all the properties of the solver object"""
 
@@ -178,9 +190,38 @@ class DapSolverC:
         DT.addObjectProperty(solverObject, "Directory", "", "App::PropertyString", "", "Directory to save data")
         DT.addObjectProperty(solverObject, "TimeLength", 10.0, "App::PropertyFloat", "", "Length of the Analysis")
         DT.addObjectProperty(solverObject, "DeltaTime", 0.01, "App::PropertyFloat", "", "Length of time steps")
+        DT.addObjectProperty(solverObject, "ExportCSV", False, "App::PropertyBool", "", "Also write the positions to DapAnimation.csv as text")
+        DT.addObjectProperty(solverObject, "PostProcessWorkers", 1, "App::PropertyInteger", "", "Number of processes writing the results file [0 = one per core]")
         DT.addObjectProperty(solverObject, "DapResultsValid", False, "App::PropertyBool", "", "")
         DT.addObjectProperty(solverObject, "BodyNames", [], "App::PropertyStringList", "", "")
         DT.addObjectProperty(solverObject, "BodyCoG", [], "App::PropertyVectorList", "", "")
+        DT.addObjectProperty(solverObject, "SparseJacobian", False, "App::PropertyBool", "", "Assemble the Jacobian as a sparse matrix")
+        DT.addObjectProperty(solverObject, "AccelerationSolver", 0, "App::PropertyInteger", "", "Method of solving for the accelerations")
+        DT.addObjectProperty(solverObject, "IntegrationMethod", 0, "App::PropertyInteger", "Integrator", "Integration method used by solve_ivp")
+        DT.addObjectProperty(solverObject, "ContactMode", 0, "App::PropertyInteger", "Integrator", "Contact with the ground by penalty forces or impact events")
+        DT.addObjectProperty(solverObject, "RestingContactSpeed", 10.0, "App::PropertyFloat", "Integrator", "Impacts slower than this are treated as resting contact [mm/s]")
+        DT.addObjectProperty(solverObject, "IntegrationMode", 0, "App::PropertyInteger", "Integrator", "solve_ivp, stepping with projection onto the constraints, coordinate partitioning or fixed steps")
+        DT.addObjectProperty(solverObject, "MaxStep", 0.0, "App::PropertyFloat", "Integrator", "Maximum step size [0 = unlimited], or the fixed step size [0 = reporting time]")
+        DT.addObjectProperty(solverObject, "FirstStep", 0.0, "App::PropertyFloat", "Integrator", "Initial step size [0 = chosen by the integrator]")
+        DT.addObjectProperty(solverObject, "RelativeTolerance", 1.0e-7, "App::PropertyFloat", "Integrator", "Relative tolerance")
+        DT.addObjectProperty(solverObject, "AbsoluteTolerance", 1.0e-9, "App::PropertyFloat", "Integrator", "Absolute tolerance")
+        DT.addObjectProperty(solverObject, "AnalyticJacobian", True, "App::PropertyBool", "Integrator", "Give the implicit methods the semi-analytic state Jacobian")
+        DT.addObjectProperty(solverObject, "BaumgarteStabilisation", False, "App::PropertyBool", "Integrator", "Add Baumgarte stabilisation terms to the acceleration constraints")
+        DT.addObjectProperty(solverObject, "BaumgarteAlpha", 10.0, "App::PropertyFloat", "Integrator", "Baumgarte gain on the velocity constraint violation [1/s]")
+        DT.addObjectProperty(solverObject, "BaumgarteBeta", 10.0, "App::PropertyFloat", "Integrator", "Baumgarte gain on the position constraint violation [1/s]")
+        DT.addObjectProperty(solverObject, "DenseOutput", True, "App::PropertyBool", "Integrator", "Keep the interpolant of the run, so the results can be resampled at any rate afterwards")
+        DT.addObjectProperty(solverObject, "StreamResults", False, "App::PropertyBool", "Integrator", "Write the results to disk in chunks during the run, with memory that does not grow with its length")
+        DT.addObjectProperty(solverObject, "StreamChunkSize", 1000, "App::PropertyInteger", "Integrator", "Number of reporting times written to disk at a time when streaming")
+        DT.addObjectProperty(solverObject, "AnimationDelta", 0.0, "App::PropertyFloat", "Animation", "Time between animation frames, resampled from the dense output [0 = reporting time]")
+        DT.addObjectProperty(solverObject, "AnimationStart", 0.0, "App::PropertyFloat", "Animation", "Start of the resampled animation window")
+        DT.addObjectProperty(solverObject, "AnimationEnd", 0.0, "App::PropertyFloat", "Animation", "End of the resampled animation window [0 = end of the run]")
+        DT.addObjectProperty(solverObject, "NumFuncEvals", 0, "App::PropertyInteger", "Integrator", "Number of evaluations of the r-h-s in the last run")
+        DT.addObjectProperty(solverObject, "NumJacEvals", 0, "App::PropertyInteger", "Integrator", "Number of evaluations of the Jacobian in the last run")
+        DT.addObjectProperty(solverObject, "NumLUDecomps", 0, "App::PropertyInteger", "Integrator", "Number of LU decompositions in the last run")
+        DT.addObjectProperty(solverObject, "MaxConstraintDrift", 0.0, "App::PropertyFloat", "Integrator", "Largest position constraint violation in the last run")
+        DT.addObjectProperty(solverObject, "MaxVelocityDrift", 0.0, "App::PropertyFloat", "Integrator", "Largest velocity constraint violation in the last run")
+        DT.addObjectProperty(solverObject, "RealTimeFactor", 0.0, "App::PropertyFloat", "Integrator", "Simulated time / wall-clock time of the last fixed step run")
+        DT.addObjectProperty(solverObject, "MissedFrames", 0, "App::PropertyInteger", "Integrator", "Reporting times the last fixed step run reached later than real time")
     #  -------------------------------------------------------------------------
     def onDocumentRestored(self, solverObject):
         """Initialise again from scratch"""
@@ -189,6 +230,7 @@ class DapSolverC:
             DT.Mess("DapSolverC-onDocumentRestored")
 
         self.initProperties(solverObject)
+        self.initModelSnapshot()
     #  -------------------------------------------------------------------------
     def execute(self, solverObject):
 
@@ -366,10 +408,43 @@ class TaskPanelDapSolverC:
         self.form.outputData.setChecked(True)
         self.form.outputData.setChecked(False)
 
-        # Set the accuracy in the form
-        self.Accuracy = 5
+        # Set the accuracy in the form to match the stored relative tolerance
+        if self.solverTaskObject.RelativeTolerance > 0.0:
+            self.Accuracy = round(-log10(self.solverTaskObject.RelativeTolerance)) - 2
+        else:
+            self.Accuracy = self.form.Accuracy.maximum()
+        self.Accuracy = min(max(self.Accuracy, self.form.Accuracy.minimum()), self.form.Accuracy.maximum())
         self.form.Accuracy.setValue(self.Accuracy)
         self.form.Accuracy.valueChanged.connect(self.accuracyChanged)
+
+        # Set the integration method and its settings in the form
+        self.form.integrationMethod.addItems(DT.INTEGRATION_METHOD)
+        self.form.integrationMethod.setCurrentIndex(self.solverTaskObject.IntegrationMethod)
+        self.form.integrationMethod.currentIndexChanged.connect(self.integrationMethodChanged)
+        self.integrationMethodChanged()
+        self.form.integrationMode.addItems(DT.INTEGRATION_MODE)
+        self.form.integrationMode.setCurrentIndex(self.solverTaskObject.IntegrationMode)
+        self.form.integrationMode.currentIndexChanged.connect(self.integrationModeChanged)
+        self.integrationModeChanged()
+        self.form.contactMode.addItems(DT.CONTACT_MODE)
+        self.form.contactMode.setCurrentIndex(self.solverTaskObject.ContactMode)
+        self.form.contactMode.currentIndexChanged.connect(self.contactModeChanged)
+        self.contactModeChanged()
+        self.form.maxStep.setText(str(self.solverTaskObject.MaxStep))
+        self.form.firstStep.setText(str(self.solverTaskObject.FirstStep))
+        self.form.relativeTolerance.setText(str(self.solverTaskObject.RelativeTolerance))
+        self.form.absoluteTolerance.setText(str(self.solverTaskObject.AbsoluteTolerance))
+        self.form.analyticJacobian.setChecked(self.solverTaskObject.AnalyticJacobian)
+        self.form.baumgarte.setChecked(self.solverTaskObject.BaumgarteStabilisation)
+        self.form.baumgarteAlpha.setText(str(self.solverTaskObject.BaumgarteAlpha))
+        self.form.baumgarteBeta.setText(str(self.solverTaskObject.BaumgarteBeta))
+
+        # Set the way the accelerations are solved in the form
+        self.form.accelerationSolver.addItems(DT.ACCELERATION_SOLVER)
+        self.form.accelerationSolver.setCurrentIndex(self.solverTaskObject.AccelerationSolver)
+        self.form.accelerationSolver.currentIndexChanged.connect(self.accelerationSolverChanged)
+        self.accelerationSolverChanged()
+        self.form.sparseJacobian.setChecked(self.solverTaskObject.SparseJacobian)
     #  -------------------------------------------------------------------------
     def accept(self):
         """Run when we press the OK button"""
@@ -402,14 +477,45 @@ class TaskPanelDapSolverC:
         self.solverTaskObject.TimeLength = self.form.endTime.value()
         self.solverTaskObject.DeltaTime = self.form.reportingTime.value()
     #  -------------------------------------------------------------------------
+    def storeSolverOptions(self):
+        """Transfer the solution options selected in the dialog to our object"""
+
+        if Debug:
+            DT.Mess("TaskPanelDapSolverC-storeSolverOptions")
+
+        self.solverTaskObject.AccelerationSolver = self.form.accelerationSolver.currentIndex()
+        self.solverTaskObject.SparseJacobian = self.form.sparseJacobian.isChecked()
+        self.solverTaskObject.IntegrationMethod = self.form.integrationMethod.currentIndex()
+        self.solverTaskObject.IntegrationMode = self.form.integrationMode.currentIndex()
+        self.solverTaskObject.ContactMode = self.form.contactMode.currentIndex()
+        self.solverTaskObject.MaxStep = self.textToFloat(self.form.maxStep, self.solverTaskObject.MaxStep)
+        self.solverTaskObject.FirstStep = self.textToFloat(self.form.firstStep, self.solverTaskObject.FirstStep)
+        self.solverTaskObject.RelativeTolerance = self.textToFloat(self.form.relativeTolerance,
+                                                                   self.solverTaskObject.RelativeTolerance)
+        self.solverTaskObject.AbsoluteTolerance = self.textToFloat(self.form.absoluteTolerance,
+                                                                   self.solverTaskObject.AbsoluteTolerance)
+        self.solverTaskObject.AnalyticJacobian = self.form.analyticJacobian.isChecked()
+        self.solverTaskObject.BaumgarteStabilisation = self.form.baumgarte.isChecked()
+        self.solverTaskObject.BaumgarteAlpha = self.textToFloat(self.form.baumgarteAlpha,
+                                                                self.solverTaskObject.BaumgarteAlpha)
+        self.solverTaskObject.BaumgarteBeta = self.textToFloat(self.form.baumgarteBeta,
+                                                               self.solverTaskObject.BaumgarteBeta)
+    #  -------------------------------------------------------------------------
+    def textToFloat(self, lineEdit, oldValue):
+        """Return the number typed into lineEdit, or oldValue if it is not a number"""
+        try:
+            return float(lineEdit.text())
+        except ValueError:
+            CAD.Console.PrintError("'" + lineEdit.text() + "' is not a number - keeping " + str(oldValue) + "\n")
+            lineEdit.setText(str(oldValue))
+            return oldValue
+    #  -------------------------------------------------------------------------
     def outputDataCheckboxChanged(self):
         if self.form.outputData.isChecked():
             self.form.outputFileLabel.setEnabled(True)
             self.form.outputFileName.setEnabled(True)
             self.form.outputDirectoryLabel.setEnabled(True)
             self.form.outputDirectory.setEnabled(True)
-            self.Accuracy = 9
-            self.form.Accuracy.setValue(self.Accuracy)
         else:
             self.form.outputFileLabel.setDisabled(True)
             self.form.outputFileName.setDisabled(True)
@@ -440,10 +546,10 @@ class TaskPanelDapSolverC:
             self.solverTaskObject.FileName = "-"
 
         self.storeTimeValues()
+        self.storeSolverOptions()
         # Instantiate the DapMainC class and run the solver
         self.DapMainC_Instance = DapMainMod.DapMainC(self.solverTaskObject.TimeLength,
                                                      self.solverTaskObject.DeltaTime,
-                                                     self.Accuracy,
                                                      self.form.correctInitial.isChecked())
         if self.DapMainC_Instance.initialised is True:
             self.DapMainC_Instance.MainSolve()
@@ -464,6 +570,29 @@ class TaskPanelDapSolverC:
     def accuracyChanged(self):
         """Change the accuracy setting when slider has been adjusted"""
         self.Accuracy = self.form.Accuracy.value()
+        # and set the tolerances to match
+        self.form.relativeTolerance.setText(str(10**(-self.Accuracy-2)))
+        self.form.absoluteTolerance.setText(str(10**(-self.Accuracy-4)))
+    #  -------------------------------------------------------------------------
+    def accelerationSolverChanged(self):
+        """Show the helper text of the acceleration solution selected"""
+        self.form.accelerationSolver.setToolTip(
+            DT.ACCELERATION_SOLVER_HELPER_TEXT[self.form.accelerationSolver.currentIndex()])
+    #  -------------------------------------------------------------------------
+    def integrationMethodChanged(self):
+        """Show the helper text of the integration method selected"""
+        self.form.integrationMethod.setToolTip(
+            DT.INTEGRATION_METHOD_HELPER_TEXT[self.form.integrationMethod.currentIndex()])
+    #  -------------------------------------------------------------------------
+    def integrationModeChanged(self):
+        """Show the helper text of the integration mode selected"""
+        self.form.integrationMode.setToolTip(
+            DT.INTEGRATION_MODE_HELPER_TEXT[self.form.integrationMode.currentIndex()])
+    #  -------------------------------------------------------------------------
+    def contactModeChanged(self):
+        """Show the helper text of the contact mode selected"""
+        self.form.contactMode.setToolTip(
+            DT.CONTACT_MODE_HELPER_TEXT[self.form.contactMode.currentIndex()])
     #  -------------------------------------------------------------------------
     def __getstate__(self):
         if Debug:
@@ -0,0 +1,458 @@
+# ********************************************************************************
+# *                                                                              *
+# *   This program is free software; you can redistribute it and/or modify       *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)         *
+# *   as published by the Free Software Foundation; either version 3 of          *
+# *   the License, or (at your option) any later version.                        *
+# *   for detail see the LICENCE text file.                                      *
+# *                                                                              *
+# *   This program is distributed in the hope that it will be useful,            *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of             *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.                       *
+# *   See the GNU Library General Public License for more details.               *
+# *                                                                              *
+# *   You should have received a copy of the GNU Library General Public          *
+# *   License along with this program; if not, write to the Free Software        *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston,                      *
+# *   MA 02111-1307, USA                                                         *
+# *_____________________________________________________________________________ *
+# *                                                                              *
+# *        ##########################################################            *
+# *       #### Nikra-DAP FreeCAD WorkBench Revision 2.0 (c) 2023: ####           *
+# *        ##########################################################            *
+# *                                                                              *
+# *                     Authors of this workbench:                               *
+# *                   Cecil Churms <churms@gmail.com>                            *
+# *             Lukas du Plessis (UP) <lukas.duplessis@up.ac.za>                 *
+# *                                                                              *
+# *               This file is a sizeable expansion of the:                      *
+# *                "Nikra-DAP-Rev-1" workbench for FreeCAD                       *
+# *        with increased functionality and inherent code documentation          *
+# *                  by means of expanded variable naming                        *
+# *                                                                              *
+# *     Which in turn, is based on the MATLAB code Complementary to              *
+# *                  Chapters 7 and 8 of the textbook:                           *
+# *                                                                              *
+# *                     "PLANAR MULTIBODY DYNAMICS                               *
+# *         Formulation, Programming with MATLAB, and Applications"              *
+# *                          Second Edition                                      *
+# *                         by P.E. Nikravesh                                    *
+# *                          CRC Press, 2018                                     *
+# *                                                                              *
+# *     Authors of Rev-1:                                                        *
+# *            Alfred Bogaers (EX-MENTE) <alfred.bogaers@ex-mente.co.za>         *
+# *            Lukas du Plessis (UP) <lukas.duplessis@up.ac.za>                  *
+# *            Dewald Hattingh (UP) <u17082006@tuks.co.za>                       *
+# *            Varnu Govender (UP) <govender.v@tuks.co.za>                       *
+# *                                                                              *
+# * Copyright (c) 2023 Cecil Churms <churms@gmail.com>                           *
+# * Copyright (c) 2023 Lukas du Plessis (UP) <lukas.duplessis@up.ac.za>          *
+# * Copyright (c) 2022 Alfred Bogaers (EX-MENTE) <alfred.bogaers@ex-mente.co.za> *
+# * Copyright (c) 2022 Dewald Hattingh (UP) <u17082006@tuks.co.za>               *
+# * Copyright (c) 2022 Varnu Govender (UP) <govender.v@tuks.co.za>               *
+# *                                                                              *
+# *             Please refer to the Documentation and README for                 *
+# *         more information regarding this WorkBench and its usage              *
+# *                                                                              *
+# ********************************************************************************
+import os
+import sys
+import copy
+import time
+import json
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import DapToolsMod as DT
+import DapMainMod
+global Debug
+Debug = False
+# The index of a sweep - the parameters and a summary of every run - in the sweep directory
+SWEEP_INDEX_FILE = "DapSweep.json"
+# Appended to the names of the bodies, joints and forces of each member of a stacked ensemble
+ENSEMBLE_MEMBER_SUFFIX = "@%05d"
+# =============================================================================
+def gridParameterSets(parameterGrid):
+    """Every combination of the values in parameterGrid {parameterPath: [value, ...]}
+    as a list of parameter sets {parameterPath: value}"""
+    pathList = list(parameterGrid)
+    return [dict(zip(pathList, valueTuple))
+            for valueTuple in itertools.product(*[parameterGrid[path] for path in pathList])]
+# =============================================================================
+def randomParameterSets(parameterDistributions, numSamples, seed=None):
+    """numSamples parameter sets drawn at random [Monte Carlo] from parameterDistributions
+    {parameterPath: [distribution, arguments...]}, where the distribution is any numpy
+    Generator method, e.g. ["uniform", low, high], ["normal", mean, std] or ["lognormal", mean, sigma]"""
+    generator = np.random.default_rng(seed)
+    sampleDict = {}
+    for path in parameterDistributions:
+        distribution = parameterDistributions[path]
+        sampleDict[path] = getattr(generator, distribution[0])(*distribution[1:], size=numSamples)
+    return [{path: float(sampleDict[path][sampleIndex]) for path in sampleDict} for sampleIndex in range(numSamples)]
+# =============================================================================
+def sweepParameterSets(sweepDict):
+    """The parameter sets of a sweep description {"grid": {...}, "random": {...}, "samples": N, "seed": S}
+    - with both a grid and random distributions, every grid point gets every random sample"""
+    gridSetList = [{}]
+    if "grid" in sweepDict:
+        gridSetList = gridParameterSets(sweepDict["grid"])
+    randomSetList = [{}]
+    if "random" in sweepDict:
+        randomSetList = randomParameterSets(sweepDict["random"], sweepDict.get("samples", 1), sweepDict.get("seed"))
+    return [dict(gridSet, **randomSet) for gridSet in gridSetList for randomSet in randomSetList]
+# =============================================================================
+def setSnapshotParameter(snapshot, parameterPath, value):
+    """Set one value in a model snapshot, addressed by a path such as "bodies/DapBody001/Mass",
+    "forces/DapForce002/Stiffness", "bodies/DapBody001/worldDotXY/0" [the initial x velocity]
+    or "solver/RelativeTolerance" - the bodies, joints and forces are picked out by their Name"""
+    keyList = parameterPath.split("/")
+    item = snapshot[keyList[0]]
+    keyList = keyList[1:]
+    if isinstance(item, list):
+        nameList = [itemDict["Name"] for itemDict in item]
+        if len(keyList) < 2 or keyList[0] not in nameList:
+            raise KeyError("No parameter " + parameterPath + " in the model snapshot")
+        item = item[nameList.index(keyList[0])]
+        keyList = keyList[1:]
+    for key in keyList[:-1]:
+        item = item[int(key)] if isinstance(item, list) else item[key]
+    if isinstance(item, list):
+        item[int(keyList[-1])] = value
+    elif keyList[-1] in item:
+        item[keyList[-1]] = value
+    else:
+        raise KeyError("No parameter " + parameterPath + " in the model snapshot")
+# =============================================================================
+# The base model in a sweep worker process, handed over once when the worker starts
+workerSnapshot = None
+def initSweepWorker(snapshot):
+    """Keep the base model snapshot in a sweep worker process"""
+    global workerSnapshot
+    workerSnapshot = snapshot
+# =============================================================================
+def variantSnapshot(snapshot, runIndex, parameterSet, directory, fileName):
+    """A copy of the model snapshot with the parameter set applied, which is solved into
+    its own run directory under directory - kept there too, so that any run can be solved
+    again on its own. Returns the variant and its run directory"""
+    runDirectory = os.path.join(directory, "run%05d" % runIndex)
+    os.makedirs(runDirectory, exist_ok=True)
+    runSnapshot = copy.deepcopy(snapshot)
+    for path in parameterSet:
+        setSnapshotParameter(runSnapshot, path, parameterSet[path])
+    runSnapshot["solver"]["Directory"] = runDirectory
+    runSnapshot["solver"]["FileName"] = fileName
+    # The sweep keeps all the cores busy already
+    runSnapshot["solver"]["PostProcessWorkers"] = 1
+    DapMainMod.writeModelSnapshot(os.path.join(runDirectory, DapMainMod.MODEL_SNAPSHOT_FILE), runSnapshot)
+    return runSnapshot, runDirectory
+# =============================================================================
+def resultsSummary(runDirectory):
+    """The number of rows, end time and final state in the results store of a run"""
+    header, resultsNp = DapMainMod.openResults(runDirectory)
+    if len(resultsNp) == 0:
+        return {"numRows": 0, "endTime": 0.0, "finalState": []}
+    return {"numRows": header["numRows"], "endTime": float(resultsNp[-1, 0]), "finalState": resultsNp[-1, 1:].tolist()}
+# =============================================================================
+def sweepRunWorker(runIndex, parameterSet, directory, simEnd, simDelta, fileName):
+    """Solve one variant of the base model into its own run directory, and return a summary of the run"""
+    if Debug:
+        DT.Mess("DapSweepMod-sweepRunWorker")
+    runSnapshot, runDirectory = variantSnapshot(workerSnapshot, runIndex, parameterSet, directory, fileName)
+    summary = {"run": runIndex, "directory": os.path.basename(runDirectory), "parameters": parameterSet,
+               "modelHash": DapMainMod.modelSnapshotHash(runSnapshot), "success": False}
+    # The same model over the same times has been solved into this directory before
+    if DapMainMod.resultsUpToDate(runDirectory, summary["modelHash"], simEnd, simDelta):
+        summary.update(resultsSummary(runDirectory), success=True, cached=True, wallTime=0.0)
+        return summary
+    startTime = time.perf_counter()
+    # One variant which cannot be solved should not stop the whole sweep
+    try:
+        mainObj = DapMainMod.DapMainC.fromSnapshot(runSnapshot, simEnd, simDelta)
+        if mainObj.initialised is True:
+            mainObj.MainSolve()
+            summary.update(resultsSummary(runDirectory))
+            summary["success"] = mainObj.integrationSuccess
+            summary["numFuncEvals"] = int(mainObj.solverObj.NumFuncEvals)
+            summary["maxConstraintDrift"] = float(mainObj.solverObj.MaxConstraintDrift)
+            summary["maxVelocityDrift"] = float(mainObj.solverObj.MaxVelocityDrift)
+    except Exception as error:
+        summary["error"] = repr(error)
+    summary["wallTime"] = time.perf_counter() - startTime
+    return summary
+# =============================================================================
+def runSweep(snapshot, parameterSets, directory, simEnd=None, simDelta=None, numWorkers=0, fileName="-"):
+    """Solve a variant of the model snapshot for every parameter set, fanned out over a pool of
+    worker processes [0 = one per core], each run into its own run#####/ directory under directory.
+    The parameters and a summary of every run are indexed in DapSweep.json there, which is rewritten
+    as each run finishes. Returns the summaries in the order of parameterSets"""
+    if Debug:
+        DT.Mess("DapSweepMod-runSweep")
+    os.makedirs(directory, exist_ok=True)
+    if simEnd is None:
+        simEnd = snapshot["solver"]["TimeLength"]
+    if simDelta is None:
+        simDelta = snapshot["solver"]["DeltaTime"]
+    if numWorkers <= 0:
+        numWorkers = os.cpu_count()
+    numWorkers = max(1, min(numWorkers, len(parameterSets)))
+
+    summaryList = [None] * len(parameterSets)
+    sweepIndex = {"simEnd": simEnd, "simDelta": simDelta,
+                  "parameterPaths": sorted(set([path for parameterSet in parameterSets for path in parameterSet])),
+                  "runs": summaryList}
+    with ProcessPoolExecutor(max_workers=numWorkers, initializer=initSweepWorker, initargs=(snapshot,)) as executor:
+        runDict = {}
+        for runIndex in range(len(parameterSets)):
+            runDict[executor.submit(sweepRunWorker, runIndex, parameterSets[runIndex],
+                                    directory, simEnd, simDelta, fileName)] = runIndex
+        for future in as_completed(runDict):
+            summaryList[runDict[future]] = future.result()
+            with open(os.path.join(directory, SWEEP_INDEX_FILE), "w") as indexFILE:
+                json.dump(sweepIndex, indexFILE, indent=1)
+    return summaryList
+# =============================================================================
+def ensembleTopology(snapshot):
+    """The names and connections of the bodies, joints and forces of a model snapshot,
+    which have to be the same in every member of an ensemble"""
+    return ([bodyDict["Name"] for bodyDict in snapshot["bodies"]],
+            [(jointDict["Name"], jointDict["JointType"], jointDict["fixDof"], jointDict["FunctType"],
+              jointDict["bodyHEADName"], jointDict["pointHEADName"], jointDict["bodyTAILName"], jointDict["pointTAILName"])
+             for jointDict in snapshot["joints"]],
+            [(forceDict["Name"], forceDict["actuatorType"],
+              forceDict["bodyHEADName"], forceDict["pointHEADName"], forceDict["bodyTAILName"], forceDict["pointTAILName"])
+             for forceDict in snapshot["forces"]])
+# =============================================================================
+def stackSnapshots(memberSnapshotList):
+    """Stack the snapshots of the members of an ensemble - variants of one model which only differ
+    in their parameters and initial states - into the snapshot of one model, with the moving bodies,
+    joints and forces of every member in turn, renamed with ENSEMBLE_MEMBER_SUFFIX.
+    The ground body, gravity and the solver settings are those of the first member"""
+    baseSnapshot = memberSnapshotList[0]
+    groundDict = baseSnapshot["bodies"][0]
+    for memberSnapshot in memberSnapshotList[1:]:
+        if ensembleTopology(memberSnapshot) != ensembleTopology(baseSnapshot):
+            raise ValueError("The members of an ensemble must all have the same bodies, joints and forces")
+        if memberSnapshot["bodies"][0] != groundDict:
+            raise ValueError("The members of an ensemble must all have the same ground body")
+
+    stackedSnapshot = {"solver": dict(baseSnapshot["solver"]),
+                       "correctInitial": baseSnapshot["correctInitial"],
+                       "bodies": [groundDict],
+                       "joints": [],
+                       "forces": [forceDict for forceDict in baseSnapshot["forces"] if forceDict["actuatorType"] == 0]}
+    for memberIndex in range(len(memberSnapshotList)):
+        memberSnapshot = memberSnapshotList[memberIndex]
+        suffix = ENSEMBLE_MEMBER_SUFFIX % memberIndex
+        # The ground is shared by all the members, so it keeps its name
+        nameDict = {groundDict["Name"]: groundDict["Name"]}
+        for bodyDict in memberSnapshot["bodies"][1:]:
+            nameDict[bodyDict["Name"]] = bodyDict["Name"] + suffix
+            stackedSnapshot["bodies"].append(dict(bodyDict, Name=bodyDict["Name"] + suffix))
+        for jointDict in memberSnapshot["joints"]:
+            stackedSnapshot["joints"].append(dict(jointDict, Name=jointDict["Name"] + suffix,
+                                                  bodyHEADName=nameDict[jointDict["bodyHEADName"]],
+                                                  bodyTAILName=nameDict[jointDict["bodyTAILName"]]))
+        # Gravity acts on all the bodies already
+        for forceDict in memberSnapshot["forces"]:
+            if forceDict["actuatorType"] != 0:
+                stackedSnapshot["forces"].append(dict(forceDict, Name=forceDict["Name"] + suffix,
+                                                      bodyHEADName=nameDict.get(forceDict["bodyHEADName"], forceDict["bodyHEADName"]),
+                                                      bodyTAILName=nameDict.get(forceDict["bodyTAILName"], forceDict["bodyTAILName"])))
+    return stackedSnapshot
+# =============================================================================
+def runEnsemble(snapshot, parameterSets, directory, simEnd=None, simDelta=None, fileName="-"):
+    """Solve a variant of the model snapshot for every parameter set, all together in lockstep as one
+    batched DapEnsembleC, rather than one process per run as in runSweep. The runs end up in the
+    same run#####/ directories and DapSweep.json index. Returns the summaries in the order of parameterSets"""
+    if Debug:
+        DT.Mess("DapSweepMod-runEnsemble")
+    os.makedirs(directory, exist_ok=True)
+    if simEnd is None:
+        simEnd = snapshot["solver"]["TimeLength"]
+    if simDelta is None:
+        simDelta = snapshot["solver"]["DeltaTime"]
+
+    # Only the runs which have not been solved into their directories before are members
+    memberSnapshotList = []
+    memberSummaryList = []
+    summaryList = []
+    for runIndex in range(len(parameterSets)):
+        runSnapshot, runDirectory = variantSnapshot(snapshot, runIndex, parameterSets[runIndex], directory, fileName)
+        summary = {"run": runIndex, "directory": os.path.basename(runDirectory), "parameters": parameterSets[runIndex],
+                   "modelHash": DapMainMod.modelSnapshotHash(runSnapshot), "success": False}
+        if DapMainMod.resultsUpToDate(runDirectory, summary["modelHash"], simEnd, simDelta):
+            summary.update(resultsSummary(runDirectory), success=True, cached=True, wallTime=0.0)
+        else:
+            memberSnapshotList.append(runSnapshot)
+            memberSummaryList.append(summary)
+        summaryList.append(summary)
+    startTime = time.perf_counter()
+    try:
+        if len(memberSnapshotList) > 0:
+            ensembleObj = DapEnsembleC(simEnd, simDelta, memberSnapshotList, directory)
+            if ensembleObj.initialised is True:
+                ensembleObj.MainSolve()
+                ensembleObj.writeMemberResultsF(memberSnapshotList)
+                for memberIndex in range(len(memberSummaryList)):
+                    summary = memberSummaryList[memberIndex]
+                    summary.update(resultsSummary(os.path.join(directory, summary["directory"])))
+                    summary["success"] = ensembleObj.integrationSuccess
+                    summary["numFuncEvals"] = int(ensembleObj.solverObj.NumFuncEvals)
+                    summary["maxConstraintDrift"] = float(ensembleObj.memberPositionDriftNp[memberIndex])
+                    summary["maxVelocityDrift"] = float(ensembleObj.memberVelocityDriftNp[memberIndex])
+    except Exception as error:
+        for summary in memberSummaryList:
+            summary["error"] = repr(error)
+    # The members share the one integration, and so its wall time
+    wallTime = time.perf_counter() - startTime
+    for summary in memberSummaryList:
+        summary["wallTime"] = wallTime
+
+    sweepIndex = {"simEnd": simEnd, "simDelta": simDelta, "ensemble": True,
+                  "parameterPaths": sorted(set([path for parameterSet in parameterSets for path in parameterSet])),
+                  "runs": summaryList}
+    with open(os.path.join(directory, SWEEP_INDEX_FILE), "w") as indexFILE:
+        json.dump(sweepIndex, indexFILE, indent=1)
+    return summaryList
+# =============================================================================
+class DapEnsembleC(DapMainMod.DapMainC):
+    """An ensemble of variants of one model, solved together: the moving bodies of all the
+    members are stacked one member after another in the body arrays of one DapMainC, so the
+    batched kernels evaluate every member in the same NumPy calls, with one integration
+    advancing all the members in lockstep. Body arrays reshape to a leading member axis,
+    e.g. worldNp[1:].reshape(numMembers, memberNumMovBodies, 2)"""
+    #  -------------------------------------------------------------------------
+    def __init__(self, simEnd, simDelta, memberSnapshotList, directory):
+        if Debug:
+            DT.Mess("DapEnsembleC-__init__")
+        self.numMembers = len(memberSnapshotList)
+        stackedSnapshot = stackSnapshots(memberSnapshotList)
+        # The members are split out of the stacked results afterwards, with their own results tables
+        stackedSnapshot["solver"].update(Directory=directory, FileName="-", DenseOutput=False, StreamResults=False,
+                                         SparseJacobian=True, AccelerationSolver=1)
+        super().__init__(simEnd, simDelta, stackedSnapshot["correctInitial"], snapshot=stackedSnapshot)
+        if self.initialised is not True:
+            return
+        self.memberNumMovBodies = self.numMovBodies // self.numMembers
+        self.memberNumConstraints = self.numConstraints // self.numMembers
+        self.memberBodyNames = [bodyDict["Name"] for bodyDict in memberSnapshotList[0]["bodies"][1:]]
+
+        # The solve_ivp error norm is the RMS over all the members, so with the tolerances
+        # shrunk by sqrt(numMembers), every member is held to the tolerances on its own
+        self.relativeTolerance /= np.sqrt(self.numMembers)
+        self.absoluteTolerance /= np.sqrt(self.numMembers)
+
+        # The Jacobian slots of every member follow one another in the same pattern,
+        # so each member's block is filled from the (row, column) pattern of the first member
+        slotsPerMember = self.jacobianTrashSlot // self.numMembers
+        self.memberJacobianRowsNp = self.jacobianRowsNp[0: slotsPerMember]
+        self.memberJacobianColumnsNp = self.jacobianColumnsNp[0: slotsPerMember]
+        self.memberJacobianNp = np.zeros((self.numMembers, self.memberNumConstraints, self.memberNumMovBodies * 3,),
+                                         dtype=np.float64)
+        self.memberPositionDriftNp = np.zeros((self.numMembers,), dtype=np.float64)
+        self.memberVelocityDriftNp = np.zeros((self.numMembers,), dtype=np.float64)
+    #  -------------------------------------------------------------------------
+    def schurSolveF(self, Jacobian, rhsAccel):
+        """The Schur complement solution of DapMainC, member by member in one batched solve
+        (J M^-1 J^T) Lambda = gamma - J M^-1 F   with a (numMembers, m, m) stack of J M^-1 J^T
+        accel = M^-1 (F + J^T Lambda)
+        jacobianDataNp already holds the Jacobian, so the stacked Jacobian is not used"""
+        if Debug:
+            DT.Mess("DapEnsembleC-schurSolveF")
+        memberJacobian = self.memberJacobianNp
+        memberJacobian[:, self.memberJacobianRowsNp, self.memberJacobianColumnsNp] = \
+            self.jacobianDataNp.reshape(self.numMembers, -1)
+        massInv = self.massInvArrayNp.reshape(self.numMembers, -1)
+        force = self.forceArrayNp.reshape(self.numMembers, -1)
+        JacMassInv = memberJacobian * massInv[:, np.newaxis, :]
+        schurMatrix = JacMassInv @ memberJacobian.transpose(0, 2, 1)
+        rhsLambda = rhsAccel.reshape(self.numMembers, -1) - np.einsum('kij,kj->ki', JacMassInv, force)
+        Lambda = np.linalg.solve(schurMatrix, rhsLambda[:, :, np.newaxis])[:, :, 0]
+        accel = np.einsum('kij,ki->kj', memberJacobian, Lambda)
+        accel += force
+        accel *= massInv
+        return accel.reshape(-1), Lambda.reshape(-1)
+    #  -------------------------------------------------------------------------
+    def augmentedSolveF(self, Jacobian, rhsAccel):
+        """The members are always solved via the batched Schur complement"""
+        return self.schurSolveF(Jacobian, rhsAccel)
+    #  -------------------------------------------------------------------------
+    def constraintDriftF(self, timeValues, uResults):
+        """The largest violation of the position and of the velocity constraints over the
+        results, as in DapMainC, but also kept member by member"""
+        if Debug:
+            DT.Mess("DapEnsembleC-constraintDriftF")
+        self.memberPositionDriftNp[:] = 0.0
+        self.memberVelocityDriftNp[:] = 0.0
+        if self.numConstraints > 0:
+            for timeIndex in range(len(timeValues)):
+                self.unpackStateF(uResults[timeIndex])
+                constraintError = np.abs(self.Constraints(timeValues[timeIndex])).reshape(self.numMembers, -1)
+                np.maximum(self.memberPositionDriftNp, constraintError.max(axis=1), out=self.memberPositionDriftNp)
+                constraintVel = self.getSparseJacobianF() @ self.uVelocityNp.reshape(-1) - \
+                    self.RHSVel(timeValues[timeIndex])
+                constraintVel = np.abs(constraintVel).reshape(self.numMembers, -1)
+                np.maximum(self.memberVelocityDriftNp, constraintVel.max(axis=1), out=self.memberVelocityDriftNp)
+        return self.memberPositionDriftNp.max(), self.memberVelocityDriftNp.max()
+    #  -------------------------------------------------------------------------
+    def writeMemberResultsF(self, memberSnapshotList):
+        """Split the stacked results into the results store of every member in its own
+        Directory, with the positions as text and the results table, as a run of its own would have"""
+        if Debug:
+            DT.Mess("DapEnsembleC-writeMemberResultsF")
+        header, resultsNp = DapMainMod.openResults(self.solverObj.Directory)
+        memberNumStates = self.memberNumMovBodies * 3
+        memberColumnsNp = np.arange(memberNumStates, dtype=np.int64)
+        for memberIndex in range(self.numMembers):
+            memberSolverDict = memberSnapshotList[memberIndex]["solver"]
+            # time, then the positions and the velocities of the member's bodies
+            columnsNp = np.concatenate(([0], 1 + memberIndex * memberNumStates + memberColumnsNp,
+                                        1 + self.numMovBodiesx3 + memberIndex * memberNumStates + memberColumnsNp))
+            memberResultsNp = resultsNp[:, columnsNp]
+            np.save(os.path.join(memberSolverDict["Directory"], DapMainMod.RESULTS_FILE), memberResultsNp)
+            suffixLength = len(ENSEMBLE_MEMBER_SUFFIX % memberIndex)
+            memberHeader = dict(header, bodyNames=self.memberBodyNames, numMovBodies=self.memberNumMovBodies,
+                                modelHash=DapMainMod.modelSnapshotHash(memberSnapshotList[memberIndex]),
+                                columns=["time"] + [header["columns"][column][0: -suffixLength]
+                                                    for column in columnsNp[1:]])
+            DapMainMod.writeResultsHeader(memberSolverDict["Directory"], memberHeader)
+            if self.exportCSV:
+                DapMainMod.exportAnimationCSV(memberSolverDict["Directory"])
+            if memberSolverDict["FileName"] != "-":
+                memberObj = DapMainMod.DapMainC.fromSnapshot(memberSnapshotList[memberIndex], self.simEnd, self.simDelta)
+                memberObj.outputResults(memberResultsNp[:, 0], memberResultsNp[:, 1:])
+# =============================================================================
+def main(argumentList=None):
+    """Run a parameter sweep of a model snapshot headless:
+    python -m DapSweepMod DapModel.dapjson sweep.json --directory sweep --workers 16"""
+    parser = argparse.ArgumentParser(prog="python -m DapSweepMod",
+                                     description="Solve variants of a NikraDAP model snapshot in parallel")
+    parser.add_argument("snapshot", help="the .dapjson model snapshot")
+    parser.add_argument("sweep", help='the sweep: {"grid": {path: [values]}, "random": {path: [distribution, ...]}, '
+                                      '"samples": N, "seed": S} with paths like "bodies/DapBody001/Mass"')
+    parser.add_argument("--directory", default="DapSweep", help="directory to collect the runs in")
+    parser.add_argument("--workers", type=int, default=0, help="number of worker processes [0 = one per core]")
+    parser.add_argument("--end", type=float, help="length of the analysis [s] - default from the snapshot")
+    parser.add_argument("--dt", type=float, help="time between the reported results [s] - default from the snapshot")
+    parser.add_argument("--name", default="-", help="file name of the results spreadsheet of each run [- for none]")
+    parser.add_argument("--ensemble", action="store_true",
+                        help="solve all the runs together as one batched ensemble, rather than a process per run")
+    arguments = parser.parse_args(argumentList)
+
+    with open(arguments.sweep, "r") as sweepFILE:
+        sweepDict = json.load(sweepFILE)
+    snapshot = DapMainMod.readModelSnapshot(arguments.snapshot)
+    if arguments.ensemble:
+        summaryList = runEnsemble(snapshot, sweepParameterSets(sweepDict),
+                                  arguments.directory, arguments.end, arguments.dt, arguments.name)
+    else:
+        summaryList = runSweep(snapshot, sweepParameterSets(sweepDict),
+                               arguments.directory, arguments.end, arguments.dt, arguments.workers, arguments.name)
+    numFailed = len([summary for summary in summaryList if summary["success"] is not True])
+    print(str(len(summaryList)) + " runs, " + str(numFailed) + " failed - index in " +
+          os.path.join(arguments.directory, SWEEP_INDEX_FILE))
+    return 0 if numFailed == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -55,10 +55,22 @@
 # *         more information regarding this WorkBench and its usage              *
 # *                                                                              *
 # ********************************************************************************
-import FreeCAD as CAD
-import Part
+try:
+    import FreeCAD as CAD
+    import Part
+except ImportError:
+    # Solving a model snapshot headless [python -m DapMainMod] without FreeCAD,
+    # where only the console is needed, and it writes to the terminal instead
+    import sys
+    from types import SimpleNamespace
+    CAD = SimpleNamespace(GuiUp=False,
+                          Console=SimpleNamespace(PrintMessage=sys.stdout.write,
+                                                  PrintWarning=sys.stderr.write,
+                                                  PrintError=sys.stderr.write))
 from os import path
 import math
+import json
+import hashlib
 import numpy as np
 Debug = False
 #  -------------------------------------------------------------------------
@@ -74,29 +86,29 @@ JOINT_TYPE = ["Rotation",
               #"Disc",
               #"Rigid",
               ]
+# Every joint type the code knows about, whether or not it is offered in JOINT_TYPE yet
 JOINT_TYPE_DICTIONARY = {"Rotation": 0,
-                         #"Translation": 1,
-                         #"Rotation-Rotation": 2,
-                         #"Rotation-Translation": 3,
-                         #"Driven-Rotation": 4,
-                         #"Driven-Translation": 5,
-                         #"Disc": 6,
-                         #"Rigid": 7,
+                         "Translation": 1,
+                         "Rotation-Rotation": 2,
+                         "Rotation-Translation": 3,
+                         "Driven-Rotation": 4,
+                         "Driven-Translation": 5,
+                         "Disc": 6,
+                         "Rigid": 7,
                          }
-# These options are included in the code,
-# but limited until each has been more thoroughly tested
+# The index in this list is the actuatorType of the force
 FORCE_TYPE = ["Gravity",
-              #"Spring",
-              #"Rotational Spring",
-              #"Linear Spring Damper",
-              #"Rotational Spring Damper",
-              #"Unilateral Spring Damper",
-              #"Constant Force Local to Body",
-              #"Constant Global Force",
-              #"Constant Torque about a Point",
-              #"Contact Friction",
-              #"Motor",
-              #"Motor with Air Friction"
+              "Spring",
+              "Rotational Spring",
+              "Linear Spring Damper",
+              "Rotational Spring Damper",
+              "Unilateral Spring Damper",
+              "Constant Force Local to Body",
+              "Constant Global Force",
+              "Constant Torque about a Point",
+              "Contact Friction",
+              "Motor",
+              "Motor with Air Friction"
               ]
 FORCE_TYPE_HELPER_TEXT = [
     "Universal force of attraction between all matter",
@@ -111,6 +123,60 @@ FORCE_TYPE_HELPER_TEXT = [
     "Contact friction between two bodies",
     "A motor with characteristics defined by an equation",
     "A motor defined by an equation, but with air friction associated with body movement"]
+# The normal force and friction models of the contact with the ground [ContactModel and FrictionModel]
+CONTACT_MODEL = ["Lankarani-Nikravesh",
+                 "Flores",
+                 ]
+FRICTION_MODEL = ["None",
+                  "A - Stribeck",
+                  "B - Viscous Transition",
+                  ]
+# The forces which act between a HEAD and a TAIL body [the others only act on the HEAD body]
+FORCE_TYPE_TWO_BODIES = [1, 2, 3, 4, 5, 10, 11]
+# and the forces which act at a point of a body, rather than on the body as a whole
+FORCE_TYPE_AT_POINTS = [1, 3, 5, 6, 7, 9]
+# The ways of solving for the accelerations and Lagrange multipliers
+# at every evaluation of the equations of motion
+ACCELERATION_SOLVER = ["Augmented Matrix",
+                       "Schur Complement",
+                       ]
+ACCELERATION_SOLVER_HELPER_TEXT = [
+    "Solve the full (3n+m) x (3n+m) mass-Jacobian matrix in one go",
+    "Use the diagonal mass matrix to solve the smaller m x m system J M^-1 J^T first"]
+# The integrators available in scipy.integrate.solve_ivp
+INTEGRATION_METHOD = ["RK45",
+                      "RK23",
+                      "DOP853",
+                      "Radau",
+                      "BDF",
+                      "LSODA",
+                      ]
+INTEGRATION_METHOD_HELPER_TEXT = [
+    "Explicit Runge-Kutta 5(4) - the general purpose default",
+    "Explicit Runge-Kutta 3(2) - for loose tolerances",
+    "Explicit Runge-Kutta 8(5,3) - for tight tolerances",
+    "Implicit Runge-Kutta (Radau IIA) order 5 - for stiff systems",
+    "Implicit multi-step (BDF) - for stiff systems",
+    "Adams / BDF with automatic stiffness detection (LSODA)"]
+INTEGRATION_MODE = ["solve_ivp",
+                    "Step with projection",
+                    "Coordinate partitioning",
+                    "Fixed step semi-implicit Euler",
+                    "Fixed step RK4",
+                    ]
+INTEGRATION_MODE_HELPER_TEXT = [
+    "Integrate in one go with scipy solve_ivp",
+    "Step the integrator ourselves and project the coordinates and velocities back onto the constraints after every step (RK45, RK23, DOP853 and Radau)",
+    "Integrate only the independent coordinates, finding the dependent ones from the constraints",
+    "Real-time preview: fixed steps (Max Step) of semi-implicit Euler with projection onto the constraints",
+    "Real-time preview: fixed steps (Max Step) of fourth order Runge-Kutta with projection onto the constraints"]
+# How contact of body points with the ground is modelled
+CONTACT_MODE = ["Penalty Force",
+                "Impact Events",
+                ]
+CONTACT_MODE_HELPER_TEXT = [
+    "A stiff force resists penetration of the ground (needs very small steps during contact)",
+    "Find the instant of impact and jump the velocities using the coefficient of restitution"]
 NIKRAVESH_EXAMPLES = [
     'Double A-Arm Suspension',
     'MacPherson Suspension A',
@@ -338,6 +404,14 @@ def getMaterialObject():
             return groupMember
     return None
 #  -------------------------------------------------------------------------
+def invalidateModelSnapshot(docObj):
+    """Drop the model kept by the solver of the document of docObj since the last solve,
+    so that it is extracted afresh from the document when next we solve.
+    Called by the onChanged of the bodies, joints, forces, material and container"""
+    solverObj = docObj.Document.getObject("DapSolver")
+    if solverObj is not None and hasattr(solverObj.Proxy, "modelSnapshot"):
+        solverObj.Proxy.modelSnapshot = None
+#  -------------------------------------------------------------------------
 def getDapModulePath():
     """Returns the path where the current DAP module is stored
     Determines where this file is running from, so DAP workbench works regardless of whether
@@ -347,6 +421,28 @@ def getDapModulePath():
         Mess("DapTools-getDapModulePath")
     return path.dirname(__file__)
 #  -------------------------------------------------------------------------
+def solidMassProperties(assemblyObj, massPropertiesDict):
+    """The volume, centre of gravity and matrix of inertia [for unit density] of a solid in its own
+    coordinates, and the placement which puts them where the solid is.
+    OpenCascade is only asked for them when the geometry of the solid has changed since they
+    were stored in massPropertiesDict - otherwise it costs only a hash of the solid's BREP"""
+    # The solid without its placement, so that moving it does not change its hash
+    shape = assemblyObj.Shape.copy()
+    placement = shape.Placement
+    shape.Placement = CAD.Placement()
+    geometryHash = hashlib.sha256(shape.exportBrepToString().encode("utf-8")).hexdigest()
+    solidDict = massPropertiesDict.get(assemblyObj.Name)
+    if solidDict is None or solidDict["geometryHash"] != geometryHash:
+        if Debug:
+            Mess("Computing the mass properties of " + assemblyObj.Name)
+        centreOfGravity = shape.CenterOfGravity
+        solidDict = {"geometryHash": geometryHash,
+                     "volume": shape.Volume,
+                     "centreOfGravity": [centreOfGravity.x, centreOfGravity.y, centreOfGravity.z],
+                     "matrixOfInertia": np.array(shape.MatrixOfInertia.A).reshape(4, 4)[0:3, 0:3].ravel().tolist()}
+        massPropertiesDict[assemblyObj.Name] = solidDict
+    return solidDict, placement
+#  -------------------------------------------------------------------------
 def computeCoGAndMomentInertia(bodyObj):
     """ Computes:
     1. The world centre of mass of each body based on the weighted sum
@@ -356,6 +452,8 @@ def computeCoGAndMomentInertia(bodyObj):
     between the axis through the solid's CoG and the axis through the whole body's
     CoG) squared.   Both axes should be normal to the plane of movement and
     will hence be parallel if everything is OK.
+    The mass properties of each solid are kept in the massPropertiesCache of the
+    Material object, so only the solids whose geometry has changed are computed again
     *************************************************************************
     IMPORTANT:  FreeCAD and NikraDAP work internally with a mm-kg-s system
     *************************************************************************
@@ -363,10 +461,15 @@ def computeCoGAndMomentInertia(bodyObj):
 
     # Get the Material object (i.e. list of densities) which has been defined in the appropriate DAP routine
     theMaterialObject = getMaterialObject()
+    densityDict = dict(zip(theMaterialObject.solidsNameList, theMaterialObject.materialsDensityList))
+    massPropertiesDict = {}
+    if theMaterialObject.massPropertiesCache != "":
+        massPropertiesDict = json.loads(theMaterialObject.massPropertiesCache)
 
     # Determine the vectors and matrices to convert movement in the selected base plane to the X-Y plane
     MovePlaneNormal = getActiveContainerObject().movementPlaneNormal
-    xyzToXYRotation = CAD.Rotation(CAD.Vector(0, 0, 1), MovePlaneNormal)
+    xyzToXYMatrix = CAD.Rotation(CAD.Vector(0, 0, 1), MovePlaneNormal).toMatrix()
+    MovePlaneNormalNp = np.array([MovePlaneNormal.x, MovePlaneNormal.y, MovePlaneNormal.z])
 
     # Clear the variables and lists for filling
     totalBodyMass = 0
@@ -377,19 +480,19 @@ def computeCoGAndMomentInertia(bodyObj):
 
     # Run through all the solids in the assemblyObjectList
     for assemblyPartName in bodyObj.ass4SolidsNames:
-        assemblyObj = bodyObj.Document.findObjects(Name="^" + assemblyPartName + "$")[0]
+        assemblyObj = bodyObj.Document.getObject(assemblyPartName)
         if Debug:
             Mess(str("assembly4 Part Name:  ")+str(assemblyPartName))
 
         # Translate this assemblyObj to where assembly4 put it
         # assemblyObj.applyRotation(assemblyObj.Placement.Rotation)
         # assemblyObj.applyTranslation(assemblyObj.Placement.Base)
+        solidDict, placement = solidMassProperties(assemblyObj, massPropertiesDict)
 
         # Volume of this assemblyObj in cubic mm
-        volume = assemblyObj.Shape.Volume
+        volume = solidDict["volume"]
         # Density of this assemblyObj in kg per cubic mm
-        index = theMaterialObject.solidsNameList.index(assemblyPartName)
-        density = theMaterialObject.materialsDensityList[index] * 1e-9
+        density = densityDict[assemblyPartName] * 1e-9
         # Calculate the mass in kg
         mass = density * volume
         massList.append(mass)
@@ -398,24 +501,30 @@ def computeCoGAndMomentInertia(bodyObj):
             Mess("Density [kg/mm^3]:  "+str(density))
             Mess("Mass [kg]:  "+str(mass))
 
-        # Add the Centre of gravities to the list to use in parallel axis theorem
-        solidCentreOfGravityXYPlaneList.append(xyzToXYRotation.toMatrix().multVec(assemblyObj.Shape.CenterOfGravity))
+        # Add the Centre of gravities [placed where assembly4 put the solid] to the list to use in parallel axis theorem
+        solidCentreOfGravityXYPlaneList.append(xyzToXYMatrix.multVec(placement.multVec(CAD.Vector(*solidDict["centreOfGravity"]))))
         solidCentreOfGravityXYPlaneList[-1].z = 0.0
 
         # MatrixOfInertia[MoI] around an axis through the CoG of the Placed assemblyObj
-        # and normal to the MovePlaneNormal
-        MoIVec = assemblyObj.Shape.MatrixOfInertia.multVec(MovePlaneNormal)
-        MoIVecLength = MoIVec.Length * 1e-6
+        # [rotated from the solid's own coordinates] and normal to the MovePlaneNormal
+        rotationNp = np.array(placement.Rotation.toMatrix().A).reshape(4, 4)[0:3, 0:3]
+        matrixOfInertiaNp = rotationNp @ np.array(solidDict["matrixOfInertia"]).reshape(3, 3) @ rotationNp.T
+        MoIVecLength = np.linalg.norm(matrixOfInertiaNp @ MovePlaneNormalNp) * 1e-6
         solidMoIThroughCoGNormalToMovePlaneList.append(MoIVecLength * mass)
 
         totalBodyMass += mass
         CoGWholeBody += mass * solidCentreOfGravityXYPlaneList[-1]
     # Next assemblyIndex
 
+    # Keep the mass properties of any solids which had to be computed
+    massPropertiesCache = json.dumps(massPropertiesDict, sort_keys=True)
+    if massPropertiesCache != theMaterialObject.massPropertiesCache:
+        theMaterialObject.massPropertiesCache = massPropertiesCache
+
     bodyObj.Mass = totalBodyMass
     CoGWholeBody /= totalBodyMass
     bodyObj.centreOfGravity = CoGWholeBody
-    bodyCentreOfGravityXYPlane = xyzToXYRotation.toMatrix().multVec(bodyObj.centreOfGravity)
+    bodyCentreOfGravityXYPlane = xyzToXYMatrix.multVec(bodyObj.centreOfGravity)
     bodyCentreOfGravityXYPlane.z = 0.0
 
     # Using parallel axis theorem to compute the moment of inertia through the CoG